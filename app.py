@@ -7,7 +7,7 @@ if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
 from app import create_app
-from app.constants import DEFAULT_HOST, DEFAULT_PORT
+from app.constants import DEFAULT_HOST, DEFAULT_PORT, STREAM_SERVER_PORT
 
 app = create_app()
 
@@ -17,4 +17,9 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', DEFAULT_PORT))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     
+    # Streams are served by the stream server - run it alongside, but only once under the reloader
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.stream_server import serve_in_thread
+        serve_in_thread(host, int(os.environ.get('STREAM_SERVER_PORT', STREAM_SERVER_PORT)))
+    
     app.run(host=host, port=port, debug=debug)
\ No newline at end of file
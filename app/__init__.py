@@ -24,6 +24,18 @@ def create_app():
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
     
+    # Start browsing for DVR servers now so the registry is warm by the first request
+    from app.services.channels_dvr_services import dvr_registry
+    dvr_registry.start()
+    
+    # Check DVR health in the background so page renders never wait on it
+    from app.services.dvr_health import dvr_health
+    dvr_health.start()
+    
+    # Streams only play through the stream server - say so loudly if it cannot be reached
+    from app.services.stream_server_client import start_startup_check
+    start_startup_check()
+    
     # Make config available in templates
     @app.context_processor
     def inject_config():
@@ -1,6 +1,7 @@
 """
 Constants for the Channels DVR Player application.
 """
+import os
 
 # Application constants
 DEFAULT_PORT = 7734
@@ -9,6 +10,7 @@ DEFAULT_TIMEOUT = 30
 
 # Database constants
 DEFAULT_DB_PATH = 'config/channels.db'
+GUIDE_SNAPSHOT_PATH = 'config/guide.snapshot'  # Memory-mapped guide shared by all workers
 MAX_CHANNEL_NAME_LENGTH = 255
 MAX_PLAYLIST_NAME_LENGTH = 100
 
@@ -18,6 +20,36 @@ HTTP_REQUEST_TIMEOUT = 30
 QUICK_CHECK_TIMEOUT = 2
 CHANNELS_DVR_DEFAULT_PORT = 8089  # Default port for Channels DVR server
 DVR_DISCOVERY_DEFAULT_TIMEOUT = 10  # Default timeout for DVR discovery
+DVR_DISCOVERY_RETRY_SECONDS = 5     # First retry after the mDNS browser failed to start, doubled per failure
+DVR_DISCOVERY_MAX_BACKOFF = 300     # Longest wait between attempts to start the mDNS browser
+
+# Shared HTTP connection pool for DVR traffic
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 4))  # Hosts kept in the pool
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 32))         # Keep-alive connections per host
+FAN_OUT_MAX_WORKERS = int(os.environ.get('FAN_OUT_MAX_WORKERS', 8))      # Threads for concurrent calls within a request
+
+# Circuit breaker for unreachable DVR hosts
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 3))    # Consecutive failures before opening
+CIRCUIT_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))           # Seconds open before a trial call
+CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.environ.get('CIRCUIT_HALF_OPEN_MAX_CALLS', 1))  # Trial calls allowed while half-open
+
+# HLS proxy
+STREAM_SERVER_PORT = int(os.environ.get('STREAM_SERVER_PORT', 7735))    # Port of the async stream server
+STREAM_SERVER_THREADS = int(os.environ.get('STREAM_SERVER_THREADS', 32))  # Threads for its blocking DVR fetches
+STREAM_SERVER_RESTART_DELAY = 1        # First wait before serve.py restarts a stream server that exited, doubled per exit
+STREAM_SERVER_MAX_RESTART_DELAY = 30   # Longest wait between stream server restarts
+STREAM_SERVER_URL = os.environ.get('STREAM_SERVER_URL', '')  # Where the player loads streams from, '' for STREAM_SERVER_PORT on the web UI's host
+STREAM_SERVER_INTERNAL_URL = os.environ.get('STREAM_SERVER_INTERNAL_URL', f'http://127.0.0.1:{STREAM_SERVER_PORT}')  # Where the web UI reaches it
+STREAM_SERVER_CHECK_ATTEMPTS = 6   # Startup checks of the stream server before logging that streams will not play
+STREAM_SERVER_CHECK_INTERVAL = 5   # Seconds between those checks
+HLS_RELAY_CHUNK_SIZE = 64 * 1024  # Bytes per read when relaying non-HLS streams
+STREAM_VIEWER_TIMEOUT = 15        # Seconds without requests before a viewer counts as gone
+STREAM_IDLE_TIMEOUT = 30          # Seconds a relayed stream may go without data before it is closed
+STREAM_REAP_INTERVAL = 5          # Seconds between checks for viewers that left
+PLAYLIST_CACHE_DEFAULT_TTL = 1.0  # Seconds to cache a playlist without a target duration
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get('SEGMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # In-memory segment budget
+SEGMENT_CACHE_SPILL_DIR = os.environ.get('SEGMENT_CACHE_SPILL_DIR') or None               # Disk tier, off when unset
+SEGMENT_CACHE_SPILL_MAX_BYTES = int(os.environ.get('SEGMENT_CACHE_SPILL_MAX_BYTES', 512 * 1024 * 1024))  # Disk tier budget
 
 # UI constants
 MAX_FEATURED_PROGRAMS = 6
@@ -25,15 +57,37 @@ MAX_SEARCH_RESULTS = 10
 MAX_PROGRAM_RESULTS = 5
 MAX_TOTAL_SEARCH_RESULTS = 100  # Maximum total search results across all sources
 MAX_SEARCH_HISTORY = 12  # Maximum number of channels in search history
+MAX_CHANNEL_SEARCH_RESULTS = 100  # Maximum channels returned by the channel search index
+CHANNEL_SEARCH_MIN_SIMILARITY = 0.5  # Trigram similarity needed for a typo-tolerant channel match
+CHANNEL_INDEX_CHECK_SECONDS = 2  # How often a search checks whether the channels changed
 
 # Cache durations (in seconds)
 GUIDE_DATA_CACHE_DURATION = 900  # 15 minutes
 EPG_CACHE_DURATION = 3600       # 1 hour
+GUIDE_REFRESH_LEAD_SECONDS = 120   # Refresh the guide this long before it expires
+GUIDE_REFRESH_RETRY_SECONDS = 60   # Wait between failed guide refresh attempts
+GUIDE_CHANNEL_REFRESH_DELAY = 10   # Quiet time after enabling channels before the guide is re-downloaded
+DVR_HEALTH_CHECK_INTERVAL = 30     # Poll the DVR this often while it is reachable
+DVR_HEALTH_RETRY_SECONDS = 5       # First retry after a failed health check, doubled per failure
+DVR_HEALTH_MAX_BACKOFF = 300       # Longest wait between failed health checks
+
+# Request deadlines (in seconds) - total time a route may spend on upstream calls
+REQUEST_DEADLINE_SECONDS = 15
+ROUTE_DEADLINE_SECONDS = {
+    'main.index': 8,
+    'main.search': 8,
+    'main.get_guide_data': 10,
+    'main.sync_channels': 60
+}
 
 # Time windows
 GUIDE_LOOKBACK_HOURS = 2
 GUIDE_LOOKAHEAD_HOURS = 4
+GUIDE_MAX_WINDOW_HOURS = 8   # Longest window /api/guide/data will serve - the 8 hours player.js asks for
+GUIDE_VERSION_HISTORY = 48   # Guide versions a client can still get deltas from
 PROGRAM_SEARCH_HOURS = 4
 
 # Guide/EPG constants
 EPG_DURATION_SECONDS = 14400  # 4 hours in seconds for xmltv guide data
+# Guide downloaded by the guide cache - the player's window from now, and no more, since every refresh downloads it
+EPG_DOWNLOAD_SECONDS = max(EPG_DURATION_SECONDS, GUIDE_MAX_WINDOW_HOURS * 3600)
@@ -1,164 +1,101 @@
-from flask import Blueprint, render_template, request, jsonify, session, send_from_directory, make_response
+from flask import Blueprint, render_template, request, jsonify, session, send_from_directory, make_response, Response
 from config.app_config import AppConfig
-from app.services.channels_dvr_services import discover_dvr_server, ChannelsDVRClient
-from app.models.database import Database, Channel, Playlist, SearchHistory
+from app.services.channels_dvr_services import discover_dvr_servers, fetch_server_status
+from app.models.database import Database, Channel, Playlist, SearchHistory, Programme
 from app.services.m3u_parser import M3UParser
 from app.services.artwork_service import ArtworkService
+from app.services.guide_cache import guide_cache
+from app.services.circuit_breaker import get_breaker_statuses
+from app.services.dvr_health import dvr_health
+from app.services.deadline import start_deadline
+from app.services.fan_out import fan_out
+from app.services.channel_index import channel_index
+from app.services import stream_server_client
 from app.constants import *
-import requests
-import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
 import logging
 import os
+import zlib
+import requests
 from . import bp
 
 logger = logging.getLogger(__name__)
 
+@bp.before_request
+def start_request_deadline():
+    """Give each request a total time budget that every upstream call draws from."""
+    start_deadline(ROUTE_DEADLINE_SECONDS.get(request.endpoint, REQUEST_DEADLINE_SECONDS))
+
 def check_dvr_availability():
-    """Check if DVR server is currently available."""
-    # First try to use configured server
-    configured_server = AppConfig.get_setup_flag('configured_server')
-    if configured_server:
-        try:
-            import requests
-            test_url = f"http://{configured_server['ip_address']}:{configured_server['port']}/status"
-            response = requests.get(test_url, timeout=QUICK_CHECK_TIMEOUT)
-            return response.status_code == 200
-        except:
-            pass
-    
-    # Fallback to discovery
-    server_info = discover_dvr_server(timeout=QUICK_CHECK_TIMEOUT)  # Quick check
-    return server_info is not None
+    """Check if DVR server is currently available, as last seen by the health monitor."""
+    return dvr_health.is_available()
 
 def get_current_server_info():
-    """Get current server info, preferring configured server over discovery."""
-    # First try configured server
-    configured_server = AppConfig.get_setup_flag('configured_server')
-    if configured_server:
-        try:
-            import requests
-            test_url = f"http://{configured_server['ip_address']}:{configured_server['port']}/status"
-            response = requests.get(test_url, timeout=QUICK_CHECK_TIMEOUT)
-            if response.status_code == 200:
-                return configured_server
-        except:
-            pass
-    
-    # Fallback to discovery
-    return discover_dvr_server(timeout=DVR_DISCOVERY_TIMEOUT)
+    """Get current server info, preferring configured server over discovery, as last seen by the health monitor."""
+    return dvr_health.get_server_info()
+
+def get_programme_episode(programme):
+    """Combine episode number and sub-title into one episode line."""
+    episode_info = [part for part in (programme['episode_num'], programme['sub_title']) if part]
+    return ' • '.join(episode_info) if episode_info else None
 
-def get_featured_programs(channel_ids, channels):
+def format_programme(programme, display_name=''):
+    """Convert an indexed guide programme into the JSON shape used by the player and templates."""
+    return {
+        'title': programme['title'] or 'Unknown Program',
+        'description': programme['description'] or '',
+        'episode': get_programme_episode(programme),
+        'category': programme['categories'][0] if programme['categories'] else None,
+        'artwork_url': programme['artwork_url'],
+        'start_time': programme['start'].strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'end_time': programme['stop'].strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'channel_display_name': display_name
+    }
+
+def get_featured_programs(channels):
     """Get current program information for featured channels."""
     try:
-        # Use the same logic as the API endpoint to get guide data
-        db = Database()
-        channel_model = Channel(db)
-        
-        # Get all channels to map IDs to tvg_ids
-        all_channels = channel_model.get_all()
-        
-        # Create mapping from channel ID to tvg_id
-        id_to_tvg_id = {}
-        tvg_id_to_id = {}
-        
-        for channel in all_channels:
-            if channel.get('tvg_id'):
-                id_to_tvg_id[channel['id']] = channel['tvg_id']
-                tvg_id_to_id[channel['tvg_id']] = channel['id']
-        
-        # Get the tvg_ids we need
-        tvg_ids_needed = []
-        for ch_id in channel_ids:
-            if ch_id in id_to_tvg_id:
-                tvg_ids_needed.append(id_to_tvg_id[ch_id])
-        
-        if not tvg_ids_needed:
+        if not any(channel.get('tvg_id') for channel in channels):
             return []
         
-        # Get guide data using existing function
-        server_info = discover_dvr_server(timeout=DVR_DISCOVERY_TIMEOUT)
-        if not server_info:
-            return []
-            
+        # Get the indexed guide from the shared guide cache
         try:
-            with ChannelsDVRClient() as client:
-                epg_url = client.get_epg_url(device="ANY")
-                
-            if not epg_url:
-                logger.error("Could not get EPG URL")
+            guide = guide_cache.get_guide()
+            if not guide:
+                logger.error("Could not get EPG data")
                 return []
-                
-            # Fetch EPG data
-            response = requests.get(epg_url, timeout=HTTP_REQUEST_TIMEOUT)
-            response.raise_for_status()
-            
-            # Parse the guide data - this already handles time parsing and filtering
-            guide_data = parse_xmltv_data(response.text, tvg_ids_needed, tvg_id_to_id)
-            
         except Exception as e:
             logger.error(f"Error fetching guide data: {e}")
             return []
         
         # Build featured programs
         featured_programs = []
-        now = datetime.now()
+        now = datetime.now(timezone.utc)
+        now_ts = int(now.timestamp())
         artwork_service = ArtworkService()
         
         for channel in channels:
-            channel_id = channel['id']
-            channel_programs = guide_data.get(channel_id, [])
+            # Programmes of a disabled channel may still be in the guide until its next download
+            tvg_id = channel.get('tvg_id') if channel.get('is_enabled', True) else None
+            display_name = guide.channel_name(tvg_id)
             
-            # Find current program - use same logic as player.html
-            current_program = None
-            for program in channel_programs:
-                try:
-                    # Parse times - they come with Z suffix from parse_xmltv_data
-                    # Convert to local timezone for comparison (same as frontend)
-                    start_time = datetime.fromisoformat(program['start_time'].replace('Z', '+00:00'))
-                    end_time = datetime.fromisoformat(program['end_time'].replace('Z', '+00:00'))
-                    
-                    # Convert UTC to local for comparison
-                    start_time = start_time.replace(tzinfo=timezone.utc).astimezone()
-                    end_time = end_time.replace(tzinfo=timezone.utc).astimezone()
-                    
-                    # Make now timezone-aware for comparison
-                    local_now = now.replace(tzinfo=datetime.now().astimezone().tzinfo)
-                    
-                    if start_time <= local_now < end_time:
-                        current_program = program
-                        break
-                except Exception as e:
-                    logger.error(f"Error parsing program times: {e}")
-                    continue
+            # Binary search for the program airing now
+            current = guide.now(tvg_id, now_ts) if tvg_id else None
             
-            if current_program:
-                # Calculate progress and remaining time using same logic as frontend
-                try:
-                    # Parse times - convert UTC to local (same as current_program finding logic)
-                    start_time = datetime.fromisoformat(current_program['start_time'].replace('Z', '+00:00'))
-                    end_time = datetime.fromisoformat(current_program['end_time'].replace('Z', '+00:00'))
-                    
-                    # Convert UTC to local for calculation
-                    start_time = start_time.replace(tzinfo=timezone.utc).astimezone()
-                    end_time = end_time.replace(tzinfo=timezone.utc).astimezone()
-                    
-                    # Make now timezone-aware
-                    local_now = now.replace(tzinfo=datetime.now().astimezone().tzinfo)
-                    
-                    total_duration = (end_time - start_time).total_seconds()
-                    elapsed = (local_now - start_time).total_seconds()
-                    progress = min(max((elapsed / total_duration) * 100, 0), 100) if total_duration > 0 else 0
-                    
-                    remaining_seconds = (end_time - local_now).total_seconds()
-                    remaining_minutes = max(int(remaining_seconds / 60), 0)
-                    
-                except Exception as e:
-                    logger.error(f"Error calculating progress: {e}")
-                    progress = 0
-                    remaining_minutes = 0
-                    start_time = now
-                    end_time = now
+            if current:
+                current_program = format_programme(current, display_name)
+                
+                # Convert UTC to local for display (same as frontend)
+                start_time = current['start'].astimezone()
+                end_time = current['stop'].astimezone()
+                
+                total_duration = (end_time - start_time).total_seconds()
+                elapsed = (now - start_time).total_seconds()
+                progress = min(max((elapsed / total_duration) * 100, 0), 100) if total_duration > 0 else 0
+                
+                remaining_seconds = (end_time - now).total_seconds()
+                remaining_minutes = max(int(remaining_seconds / 60), 0)
                 
                 # Get enhanced artwork information  
                 artwork_info = artwork_service.get_artwork_with_fallback(current_program, channel)
@@ -175,57 +112,30 @@ def get_featured_programs(channel_ids, channels):
                 
             else:
                 # No current program - get next upcoming program if available
-                upcoming_program = None
-                if channel_programs:
-                    for program in channel_programs:
-                        try:
-                            start_time = datetime.fromisoformat(program['start_time'].replace('Z', ''))
-                            if start_time > now:
-                                upcoming_program = program
-                                break
-                        except Exception:
-                            continue
+                upcoming = guide.next(tvg_id, now_ts) if tvg_id else None
                 
-                if upcoming_program:
-                    try:
-                        start_time = datetime.fromisoformat(upcoming_program['start_time'].replace('Z', ''))
-                        
-                        # Create program dict for upcoming show
-                        upcoming_program_info = {
-                            'title': f"Coming Up: {upcoming_program['title']}",
-                            'description': upcoming_program.get('description', ''),
-                            'artwork_url': upcoming_program.get('artwork_url')
-                        }
-                        
-                        # Get enhanced artwork information for upcoming program
-                        artwork_info = artwork_service.get_artwork_with_fallback(upcoming_program, channel)
-                        
-                        featured_programs.append({
-                            'channel': channel,
-                            'program': upcoming_program_info,
-                            'artwork_info': artwork_info,
-                            'progress': 0,
-                            'remaining_minutes': 0,
-                            'start_time': start_time.strftime('%I:%M %p'),
-                            'end_time': ''
-                        })
-                    except Exception:
-                        # Fallback to basic channel info
-                        fallback_program = {
-                            'title': 'Live TV',
-                            'description': f'Currently broadcasting on {channel["name"]}'
-                        }
-                        artwork_info = artwork_service.get_artwork_with_fallback(fallback_program, channel)
-                        
-                        featured_programs.append({
-                            'channel': channel,
-                            'program': fallback_program,
-                            'artwork_info': artwork_info,
-                            'progress': 0,
-                            'remaining_minutes': 0,
-                            'start_time': '',
-                            'end_time': ''
-                        })
+                if upcoming:
+                    upcoming_program = format_programme(upcoming, display_name)
+                    
+                    # Create program dict for upcoming show
+                    upcoming_program_info = {
+                        'title': f"Coming Up: {upcoming_program['title']}",
+                        'description': upcoming_program.get('description', ''),
+                        'artwork_url': upcoming_program.get('artwork_url')
+                    }
+                    
+                    # Get enhanced artwork information for upcoming program
+                    artwork_info = artwork_service.get_artwork_with_fallback(upcoming_program, channel)
+                    
+                    featured_programs.append({
+                        'channel': channel,
+                        'program': upcoming_program_info,
+                        'artwork_info': artwork_info,
+                        'progress': 0,
+                        'remaining_minutes': 0,
+                        'start_time': upcoming['start'].astimezone().strftime('%I:%M %p'),
+                        'end_time': ''
+                    })
                 else:
                     # No programs available
                     fallback_program = {
@@ -287,33 +197,17 @@ def index():
     # Get the configured server info
     configured_server = AppConfig.get_setup_flag('configured_server')
     
-    # Try to reach the configured server
-    server_info = None
-    dvr_currently_found = False
+    # The health monitor has already tried the configured server, then discovery
+    dvr_state = dvr_health.get_state()
+    server_info = dvr_state['server_info']
+    dvr_currently_found = dvr_state['available']
     
-    if configured_server:
-        # Try to validate the configured server is still reachable
-        try:
-            import requests
-            test_url = f"http://{configured_server['ip_address']}:{configured_server['port']}/status"
-            response = requests.get(test_url, timeout=5)
-            if response.status_code == 200:
-                server_info = configured_server
-                dvr_currently_found = True
-        except:
-            # If configured server fails, try discovery as fallback
-            discovered_server = discover_dvr_server(timeout=DVR_DISCOVERY_TIMEOUT)
-            if discovered_server:
-                server_info = discovered_server
-                dvr_currently_found = True
-                # Update configured server if discovery found something different
-                if (discovered_server['ip_address'] != configured_server['ip_address'] or 
-                    discovered_server['port'] != configured_server['port']):
-                    AppConfig.set_setup_flag('configured_server', discovered_server)
-    else:
-        # No configured server, try discovery
-        server_info = discover_dvr_server(timeout=DVR_DISCOVERY_TIMEOUT)
-        dvr_currently_found = server_info is not None
+    # Update configured server if discovery found something different
+    if configured_server and server_info and (
+            server_info['ip_address'] != configured_server['ip_address'] or
+            server_info['port'] != configured_server['port']):
+        AppConfig.set_setup_flag('configured_server', server_info)
+        dvr_health.refresh()
     
     # Only show discovery message if server is found AND it wasn't previously discovered
     show_discovery_message = dvr_currently_found and not dvr_previously_discovered
@@ -329,14 +223,21 @@ def index():
     all_playlists = []
     
     if dvr_currently_found:
+        # Independent lookups run together - the guide is warmed for the featured cards meanwhile
+        lookups = fan_out({
+            'channels': lambda: Channel(Database()).get_all(),
+            'playlists': lambda: Playlist(Database()).get_all(),
+            'guide': guide_cache.get_guide
+        }, defaults={'channels': [], 'playlists': []})
+        
         try:
             # Check if channels have been imported
             db = Database()
             channel_model = Channel(db)
             playlist_model = Playlist(db)
             
-            all_channels = channel_model.get_all()
-            all_playlists = playlist_model.get_all()
+            all_channels = lookups['channels']
+            all_playlists = lookups['playlists']
             
             # Check for enabled channels, not just any channels
             enabled_channels = [ch for ch in all_channels if ch.get('is_enabled', False)]
@@ -406,7 +307,7 @@ def index():
         try:
             db = Database()
             playlist_model = Playlist(db)
-            playlists = playlist_model.get_all()
+            playlists = all_playlists
             
             if playlists:
                 # Check for the last selected playlist from cookie first, then session
@@ -443,8 +344,7 @@ def index():
                 
                 if featured_channels:
                     # Get current program data for these channels
-                    channel_ids = [ch['id'] for ch in featured_channels]
-                    featured_programs = get_featured_programs(channel_ids, featured_channels)
+                    featured_programs = get_featured_programs(featured_channels)
                     
         except Exception as e:
             logger.error(f"Error getting featured programs: {e}")
@@ -541,14 +441,8 @@ def setup():
 @bp.route('/setup/server')
 def setup_server():
     """Server configuration page - first step in setup process."""
-    # Always attempt discovery to show available servers
-    discovered_servers = []
-    
-    # Try discovery multiple times to catch different servers
-    for attempt in range(3):  # Try 3 times with short timeouts
-        server_info = discover_dvr_server(timeout=2)  # Short timeout for each attempt
-        if server_info and server_info not in discovered_servers:
-            discovered_servers.append(server_info)
+    # Always show every server the background discovery currently knows about
+    discovered_servers = discover_dvr_servers(timeout=DVR_DISCOVERY_TIMEOUT)
     
     # Get any previously configured server
     configured_server = AppConfig.get_setup_flag('configured_server')
@@ -676,6 +570,16 @@ def playlist():
                          enabled_channels_count=len([ch for ch in all_channels if ch.get('is_enabled', False)]),
                          playlists_count=len(playlists))
 
+def get_stream_base_url():
+    """Get where players load streams from - the stream server on this host unless STREAM_SERVER_URL is set."""
+    if STREAM_SERVER_URL:
+        return STREAM_SERVER_URL.rstrip('/')
+    
+    host = urlparse(request.host_url).hostname
+    if ':' in host:
+        host = f"[{host}]"  # IPv6 literal
+    return f"{request.scheme}://{host}:{STREAM_SERVER_PORT}"
+
 @bp.route('/player')
 def player():
     """Live TV player page route."""
@@ -713,6 +617,7 @@ def player():
     return render_template('player.html',
                          config=AppConfig,
                          dvr_available=check_dvr_availability(),
+                         stream_base_url=get_stream_base_url(),
                          playlists=playlists,
                          channels=all_channels,
                          channels_count=len(all_channels),
@@ -787,9 +692,7 @@ def test_server_connection():
         
         # Test the server connection
         try:
-            import requests
-            test_url = f"http://{ip_address}:{port}/status"
-            response = requests.get(test_url, timeout=5)
+            response = fetch_server_status(ip_address, port, timeout=5)
             response.raise_for_status()
             
             return jsonify({
@@ -837,9 +740,7 @@ def configure_server():
         
         # Test the server connection
         try:
-            import requests
-            test_url = f"http://{ip_address}:{port}/status"
-            response = requests.get(test_url, timeout=10)
+            response = fetch_server_status(ip_address, port, timeout=10)
             response.raise_for_status()
         except Exception as e:
             return jsonify({
@@ -859,6 +760,10 @@ def configure_server():
         AppConfig.set_setup_flag('server_configured', True)
         AppConfig.set_setup_flag('dvr_discovered', True)
         
+        # Guide data and health state from a previous server are no longer valid
+        guide_cache.invalidate()
+        dvr_health.refresh()
+        
         return jsonify({
             'success': True,
             'message': 'Server configured successfully',
@@ -881,6 +786,8 @@ def sync_channels():
         db = Database()
         parser = M3UParser(db)
         result = parser.sync_channels_from_dvr(replace_existing=replace_existing)
+        guide_cache.invalidate()
+        channel_index.invalidate()
         
         return jsonify(result)
         
@@ -897,6 +804,12 @@ def toggle_channel(channel_id):
         db = Database()
         channel_model = Channel(db)
         new_status = channel_model.toggle_enabled(channel_id)
+        channel_index.invalidate()
+        
+        # The guide only holds programmes for enabled channels - a newly enabled one needs a
+        # new download, a disabled one is simply no longer asked for
+        if new_status:
+            guide_cache.schedule_refresh()
         
         return jsonify({
             'success': True,
@@ -935,6 +848,13 @@ def bulk_toggle_channels():
                     )
                     channels_updated += 1
         
+        if channels_updated:
+            channel_index.invalidate()
+        
+        # Only newly enabled channels are missing from the guide
+        if channels_updated and enable:
+            guide_cache.schedule_refresh()
+        
         return jsonify({
             'success': True,
             'channels_updated': channels_updated,
@@ -1003,27 +923,25 @@ def search():
             })
         
         db = Database()
-        channel_model = Channel(db)
         
-        # Search channels by name, tvg_id, or channel_number
-        channels = channel_model.search(query)
+        # Resolve the server once - the health monitor already knows which one answers
+        server_info = get_current_server_info()
         
-        results = []
-        
-        # Get current program information for channels
-        current_programs = {}
-        server_info = discover_dvr_server(timeout=QUICK_CHECK_TIMEOUT)
+        # Channel search and the guide do not depend on each other
+        calls = {
+            # Search channels by name, tvg_id, or channel_number
+            'channels': lambda: channel_index.search(query)
+        }
         if server_info:
-            try:
-                client = ChannelsDVRClient()
-                guide_url = client.get_epg_url()
-                
-                if guide_url:
-                    response = requests.get(guide_url, timeout=DVR_DISCOVERY_TIMEOUT)
-                    if response.status_code == 200:
-                        current_programs = get_current_programs_for_channels(response.text, channels)
-            except Exception as e:
-                logger.warning(f"Could not fetch current programs for search: {e}")
+            calls['guide'] = lambda: guide_cache.get_guide(timeout=DVR_DISCOVERY_TIMEOUT)
+        lookups = fan_out(calls, defaults={'channels': []})
+        channels = lookups['channels']
+        
+        # Current programs and program matches both come from the one cached guide
+        current_programs, programs = search_guide(lookups.get('guide'), Programme(db), query, channels,
+                                                  channel_index.get_enabled())
+        
+        results = []
         
         # Add channel results
         for channel in channels:
@@ -1044,23 +962,10 @@ def search():
                 
                 results.append(channel_result)
         
-        # If we have a DVR server, also search for programs
-        server_info = discover_dvr_server(timeout=QUICK_CHECK_TIMEOUT)
-        if server_info and len(results) < MAX_TOTAL_SEARCH_RESULTS:  # Limit total results
-            try:
-                # Get guide data and search for programs
-                client = ChannelsDVRClient()
-                guide_url = client.get_epg_url()
-                
-                if guide_url:
-                    response = requests.get(guide_url, timeout=DVR_DISCOVERY_TIMEOUT)
-                    if response.status_code == 200:
-                        programs = search_programs_in_guide(response.text, query, channels)
-                        # Add programs up to the remaining space in our result limit
-                        remaining_slots = MAX_TOTAL_SEARCH_RESULTS - len(results)
-                        results.extend(programs[:remaining_slots])
-            except Exception as e:
-                logger.warning(f"Could not search programs: {e}")
+        # Add programs up to the remaining space in our result limit
+        remaining_slots = MAX_TOTAL_SEARCH_RESULTS - len(results)
+        if remaining_slots > 0:
+            results.extend(programs[:remaining_slots])
         
         return jsonify({
             'success': True,
@@ -1074,122 +979,64 @@ def search():
             'error': str(e)
         }), 500
 
-def search_programs_in_guide(guide_xml, query, channels):
-    """Search for programs in the XML guide data."""
-    results = []
-    query_lower = query.lower()
+def search_guide(guide, programme_model, query, channels, enabled_channels):
+    """
+    Look up current programs for searched channels and matching programs on any enabled channel.
     
-    try:
-        root = ET.fromstring(guide_xml)
-        
-        # Create channel mapping
-        channel_map = {}
-        for channel in channels:
-            if channel.get('tvg_id'):
-                channel_map[channel['tvg_id']] = channel
-        
-        # Search programmes
-        current_time = datetime.now(timezone.utc)
-        end_time = current_time + timedelta(hours=PROGRAM_SEARCH_HOURS)  # Search next hours
-        
-        for programme in root.findall('.//programme'):
-            try:
-                # Check if programme is within time window
-                start_str = programme.get('start', '')
-                if not start_str:
-                    continue
-                    
-                start_time = datetime.strptime(start_str, '%Y%m%d%H%M%S %z')
-                if start_time < current_time or start_time > end_time:
-                    continue
-                
-                # Get programme details
-                title_elem = programme.find('title')
-                if title_elem is None or not title_elem.text:
-                    continue
-                    
-                title = title_elem.text
-                if query_lower not in title.lower():
-                    continue
-                
-                # Get channel info
-                channel_id = programme.get('channel', '')
-                if channel_id not in channel_map:
-                    continue
-                    
-                channel = channel_map[channel_id]
-                
-                # Get description
-                desc_elem = programme.find('desc')
-                description = desc_elem.text if desc_elem is not None else ''
-                
-                results.append({
-                    'type': 'program',
-                    'title': title,
-                    'description': description,
-                    'channel_id': channel['id'],
-                    'channel_name': channel['name'],
-                    'start_time': start_time.strftime('%I:%M %p'),
-                    'artwork_url': None  # Could be enhanced later
-                })
-                
-                if len(results) >= MAX_PROGRAM_RESULTS:  # Limit program results
-                    break
-                    
-            except Exception as e:
-                logger.debug(f"Error parsing programme: {e}")
-                continue
-                
-    except Exception as e:
-        logger.warning(f"Error parsing guide XML for search: {e}")
+    Args:
+        guide: The cached GuideIndex, or None if no guide is available
+        programme_model: Programme model over the stored guide (full-text index)
+        query: Search text
+        channels: Channels matched by the channel search
+        enabled_channels: Every enabled channel - programs match regardless of the channel's name
     
-    return results
-
-def get_current_programs_for_channels(guide_xml, channels):
-    """Get current programs for a list of channels."""
+    Returns:
+        Tuple of (tvg_id -> current program title, list of program results)
+    """
     current_programs = {}
+    programs = []
+    
+    if not guide:
+        return current_programs, programs
     
     try:
-        root = ET.fromstring(guide_xml)
-        
         # Create channel mapping
         channel_map = {}
-        for channel in channels:
+        for channel in enabled_channels:
             if channel.get('tvg_id'):
                 channel_map[channel['tvg_id']] = channel
         
-        # Find current programmes
-        current_time = datetime.now(timezone.utc)
+        current_ts = int(datetime.now(timezone.utc).timestamp())
         
-        for programme in root.findall('.//programme'):
-            try:
-                # Check if programme is currently airing
-                start_str = programme.get('start', '')
-                stop_str = programme.get('stop', '')
-                if not start_str or not stop_str:
-                    continue
-                    
-                start_time = datetime.strptime(start_str, '%Y%m%d%H%M%S %z')
-                stop_time = datetime.strptime(stop_str, '%Y%m%d%H%M%S %z')
-                
-                if start_time <= current_time <= stop_time:
-                    # This is a current program
-                    channel_id = programme.get('channel', '')
-                    if channel_id in channel_map:
-                        title_elem = programme.find('title')
-                        if title_elem is not None and title_elem.text:
-                            current_programs[channel_id] = title_elem.text
-                    
-            except Exception as e:
-                logger.debug(f"Error parsing programme for current programs: {e}")
+        for channel in channels:
+            tvg_id = channel.get('tvg_id')
+            if not tvg_id:
                 continue
+            programme = guide.now(tvg_id, current_ts)
+            if programme and programme['title']:
+                current_programs[tvg_id] = programme['title']
+        
+        # Only look at programs starting in the next few hours
+        end_ts = current_ts + PROGRAM_SEARCH_HOURS * 3600
+        programmes = programme_model.search(query, list(channel_map.keys()), current_ts, end_ts, MAX_PROGRAM_RESULTS)
+        
+        for programme in programmes:
+            channel = channel_map[programme['channel']]
+            programs.append({
+                'type': 'program',
+                'title': programme['title'],
+                'description': programme['description'] or '',
+                'channel_id': channel['id'],
+                'channel_name': channel['name'],
+                'start_time': programme['start'].astimezone().strftime('%I:%M %p'),
+                'artwork_url': None  # Could be enhanced later
+            })
                 
     except Exception as e:
-        logger.warning(f"Error parsing guide XML for current programs: {e}")
+        logger.warning(f"Error searching guide data: {e}")
     
-    return current_programs
+    return current_programs, programs
 
-# API Routes for playlist management
 @bp.route('/api/playlists', methods=['GET'])
 def get_playlists():
     """Get all playlists with their channels."""
@@ -1372,12 +1219,21 @@ def get_guide_data():
             logger.warning("No channels requested for guide data")
             return jsonify({})
         
+        # Work out the time window the client asked for
+        try:
+            window_start, window_end = get_guide_window(data.get('start_time'), data.get('end_time'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Get the actual channel records to get their tvg_id mappings
         db = Database()
         channel_model = Channel(db)
         
-        # Get channels from the database to map IDs
-        all_channels = channel_model.get_all()
+        # Get channels from the database to map IDs - disabled channels get no guide data
+        all_channels = channel_model.get_all(enabled_only=True)
         
         # Create mapping from channel ID to tvg_id
         id_to_tvg_id = {}
@@ -1399,29 +1255,32 @@ def get_guide_data():
             logger.warning("No valid tvg_ids found for requested channels")
             return jsonify({})
         
-        # Get EPG data from Channels DVR
-        configured_server = AppConfig.get_setup_flag('configured_server')
-        if configured_server:
-            # Use configured server directly
-            epg_url = f"{configured_server['url']}/devices/ANY/guide/xmltv?duration={EPG_DURATION_SECONDS}"
+        # Make sure the stored guide is current, then query it directly
+        if not guide_cache.get_guide():
+            logger.warning("Could not refresh EPG data, serving stored guide")
+        
+        # Read the version before the data so a concurrent refresh is re-sent, never skipped
+        programme_model = Programme(db)
+        guide_id = programme_model.get_guide_id()
+        version = programme_model.get_version()
+        channels_key = get_guide_channels_key(tvg_ids_needed)
+        compact = data.get('format') == 'compact'
+        
+        since = parse_guide_token(data.get('since'))
+        if (since and since['guide_id'] == guide_id and since['channels_key'] == channels_key
+                and programme_model.get_version_floor() <= since['version'] <= version):
+            # Client already holds an earlier copy - send only what changed
+            guide_data = build_guide_delta(programme_model, tvg_ids_needed, tvg_id_to_id,
+                                           window_start, window_end, since, compact)
         else:
-            # Fallback to discovery
-            with ChannelsDVRClient() as client:
-                epg_url = client.get_epg_url()
-                if not epg_url:
-                    logger.warning("No EPG URL available")
-                    return jsonify({})
-        
-        # Fetch EPG data
-        response = requests.get(epg_url, timeout=HTTP_REQUEST_TIMEOUT)
-        response.raise_for_status()
-        
-        # Parse XMLTV data
-        guide_data = parse_xmltv_data(response.text, tvg_ids_needed, tvg_id_to_id)
+            # Build guide data for the requested channels
+            guide_data = build_guide_data(programme_model, tvg_ids_needed, tvg_id_to_id,
+                                          window_start, window_end, compact)
         
         # Create response with appropriate caching headers
         from flask import make_response
         json_response = make_response(jsonify(guide_data))
+        json_response.headers['X-Guide-Version'] = make_guide_token(guide_id, version, window_end, channels_key)
         json_response.headers['Cache-Control'] = f'max-age={GUIDE_DATA_CACHE_DURATION}'  # Cache for 15 minutes
         json_response.headers['Expires'] = (datetime.now() + timedelta(seconds=GUIDE_DATA_CACHE_DURATION)).strftime('%a, %d %b %Y %H:%M:%S GMT')
         
@@ -1431,233 +1290,250 @@ def get_guide_data():
         logger.error(f"Error fetching guide data: {e}")
         return jsonify({})
 
-def parse_xmltv_data(xmltv_content, tvg_ids_needed, tvg_id_to_channel_id):
-    """Parse XMLTV data and extract program information for specified channels."""
+def parse_guide_time(value):
+    """Parse an ISO 8601 timestamp from the player into an aware UTC datetime."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def get_guide_window(start_value=None, end_value=None):
+    """
+    Resolve the requested guide window, defaulting to the lookback/lookahead hours.
+    
+    Windows longer than GUIDE_MAX_WINDOW_HOURS are cut short at the maximum.
+    
+    Raises:
+        ValueError: If a time cannot be parsed or the window is empty
+    """
+    now = datetime.now(timezone.utc)
+    
     try:
-        root = ET.fromstring(xmltv_content)
-        guide_data = {}
-        
-        # Get current time and extend the window to include current programs
-        now = datetime.now()
-        # Look back and forward to catch current programs and provide better coverage
-        start_time = now - timedelta(hours=GUIDE_LOOKBACK_HOURS)
-        end_time = now + timedelta(hours=GUIDE_LOOKAHEAD_HOURS)
-        
-        # Make sure end_time is timezone-aware for comparison with converted program times
-        end_time = end_time.replace(tzinfo=datetime.now().astimezone().tzinfo)
-        
-        logger.info(f"Parsing guide data from {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')} for {len(tvg_ids_needed)} channels")
-        
-        # First, build a dictionary of all channel definitions in the guide
-        xmltv_channels = {}
-        for channel in root.findall('channel'):
-            channel_id = channel.get('id')
-            if channel_id:
-                channel_info = {
-                    'id': channel_id,
-                    'display_name': ''
-                }
-                
-                # Get display name
-                display_name = channel.find('display-name')
-                if display_name is not None:
-                    channel_info['display_name'] = display_name.text or ''
-                
-                xmltv_channels[channel_id] = channel_info
-        
-        programs_found = 0
-        
-        # Process programs
-        for programme in root.findall('programme'):
-            xmltv_channel_id = programme.get('channel')
-            
-            # Only process channels we're interested in
-            if xmltv_channel_id not in tvg_ids_needed:
-                continue
-            
-            # Parse program times
-            start_str = programme.get('start')
-            stop_str = programme.get('stop')
-            
-            if not start_str or not stop_str:
-                continue
-                
-            try:
-                # Parse XMLTV datetime format (e.g., "20231215120000 +0000")
-                # XMLTV times are in UTC, so parse them as UTC
-                start_time_str = start_str[:14]
-                stop_time_str = stop_str[:14]
-                
-                start_time = datetime.strptime(start_time_str, '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
-                stop_time = datetime.strptime(stop_time_str, '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
-                
-                # Convert to local timezone for comparison with our window
-                start_time_local = start_time.astimezone()
-                stop_time_local = stop_time.astimezone()
-                
-                # Only include programs within our expanded time window (compare local times)
-                if stop_time_local < start_time_local or start_time_local > end_time:
-                    continue
-                    
-            except ValueError as e:
-                logger.warning(f"Error parsing time {start_str}/{stop_str}: {e}")
-                continue
-            
-            # Extract program details
-            title_elem = programme.find('title')
-            title = title_elem.text if title_elem is not None else 'Unknown Program'
-            
-            desc_elem = programme.find('desc')
-            description = desc_elem.text if desc_elem is not None else ''
-            
-            # Extract program artwork/images
-            artwork_url = None
-            icon_elem = programme.find('icon')
-            if icon_elem is not None:
-                artwork_url = icon_elem.get('src')
-            
-            # Also check for image elements
-            if not artwork_url:
-                image_elem = programme.find('image')
-                if image_elem is not None:
-                    artwork_url = image_elem.text or image_elem.get('src')
-            
-            # Extract episode info
-            episode_info = []
-            
-            # Try episode-num element
-            episode_num_elem = programme.find('episode-num')
-            if episode_num_elem is not None and episode_num_elem.text:
-                episode_info.append(episode_num_elem.text)
-            
-            # Try sub-title element  
-            sub_title_elem = programme.find('sub-title')
-            if sub_title_elem is not None and sub_title_elem.text:
-                episode_info.append(sub_title_elem.text)
-            
-            episode_str = ' • '.join(episode_info) if episode_info else None
-            
-            # Map back to our internal channel ID
-            internal_channel_id = tvg_id_to_channel_id.get(xmltv_channel_id)
-            if not internal_channel_id:
-                continue
-            
-            # Add to guide data using our internal channel ID
-            if internal_channel_id not in guide_data:
-                guide_data[internal_channel_id] = []
-            
-            guide_data[internal_channel_id].append({
-                'title': title,
-                'description': description,
-                'episode': episode_str,
-                'artwork_url': artwork_url,
-                'start_time': start_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
-                'end_time': stop_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
-                'channel_display_name': xmltv_channels.get(xmltv_channel_id, {}).get('display_name', '')
-            })
-            
-            programs_found += 1
+        start_time = parse_guide_time(start_value) if start_value else now - timedelta(hours=GUIDE_LOOKBACK_HOURS)
+        end_time = parse_guide_time(end_value) if end_value else now + timedelta(hours=GUIDE_LOOKAHEAD_HOURS)
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError('Invalid start_time or end_time')
+    
+    if end_time <= start_time:
+        raise ValueError('end_time must be after start_time')
+    
+    end_time = min(end_time, start_time + timedelta(hours=GUIDE_MAX_WINDOW_HOURS))
+    return start_time, end_time
+
+def get_guide_channels_key(tvg_ids):
+    """Short fingerprint of a channel set, so a token is only reused for the same channels."""
+    return format(zlib.crc32(','.join(sorted(tvg_ids)).encode('utf-8')), '08x')
+
+def make_guide_token(guide_id, version, window_end, channels_key):
+    """Build the opaque guide version token returned in X-Guide-Version."""
+    return f"{guide_id}.{version}.{int(window_end.timestamp())}.{channels_key}"
+
+def parse_guide_token(token):
+    """Parse a guide version token sent back as `since`. Returns None if it is not usable."""
+    if not token or not isinstance(token, str):
+        return None
+    
+    try:
+        guide_id, version, window_end, channels_key = token.split('.')
+        return {
+            'guide_id': guide_id,
+            'version': int(version),
+            'window_end': int(window_end),
+            'channels_key': channels_key
+        }
+    except ValueError:
+        return None
+
+def map_guide_programmes(programmes, display_names, tvg_id_to_channel_id):
+    """Key formatted programmes by our internal channel ID."""
+    guide_data = {}
+    
+    for xmltv_channel_id, channel_programmes in programmes.items():
+        # Map back to our internal channel ID
+        internal_channel_id = tvg_id_to_channel_id.get(xmltv_channel_id)
+        if not internal_channel_id:
+            continue
+        
+        display_name = display_names.get(xmltv_channel_id, '')
+        guide_data[internal_channel_id] = [format_programme(p, display_name) for p in channel_programmes]
+    
+    return guide_data
+
+def encode_compact_programmes(programmes, display_names, tvg_id_to_channel_id):
+    """
+    Encode programmes in the compact columnar wire format.
+    
+    Channel metadata is sent once per channel, times are epoch seconds and every
+    string is an index into a shared string table (-1 for missing values):
+    
+        {'format': 'compact', 'strings': [...],
+         'channels': {id: {'display_name', 'start', 'stop', 'title', 'description',
+                           'episode', 'category', 'artwork_url'}}}
+    """
+    strings = []
+    string_ids = {}
+    
+    def intern(value):
+        if value is None:
+            return -1
+        index = string_ids.get(value)
+        if index is None:
+            index = string_ids[value] = len(strings)
+            strings.append(value)
+        return index
+    
+    channels = {}
+    for xmltv_channel_id, channel_programmes in programmes.items():
+        # Map back to our internal channel ID
+        internal_channel_id = tvg_id_to_channel_id.get(xmltv_channel_id)
+        if not internal_channel_id:
+            continue
+        
+        channels[internal_channel_id] = {
+            'display_name': display_names.get(xmltv_channel_id, ''),
+            'start': [int(p['start'].timestamp()) for p in channel_programmes],
+            'stop': [int(p['stop'].timestamp()) for p in channel_programmes],
+            'title': [intern(p['title'] or 'Unknown Program') for p in channel_programmes],
+            'description': [intern(p['description'] or '') for p in channel_programmes],
+            'episode': [intern(get_programme_episode(p)) for p in channel_programmes],
+            'category': [intern(p['categories'][0] if p['categories'] else None) for p in channel_programmes],
+            'artwork_url': [intern(p['artwork_url']) for p in channel_programmes]
+        }
+    
+    return {
+        'format': 'compact',
+        'strings': strings,
+        'channels': channels
+    }
+
+def build_guide_data(programme_model, tvg_ids_needed, tvg_id_to_channel_id, start_time, end_time, compact=False):
+    """Build per-channel program lists for specified channels from the stored guide."""
+    try:
+        logger.info(f"Building guide data from {start_time.astimezone().strftime('%H:%M')} to {end_time.astimezone().strftime('%H:%M')} for {len(tvg_ids_needed)} channels")
         
-        # Sort programs by start time for each channel
-        for channel_id in guide_data:
-            guide_data[channel_id].sort(key=lambda x: x['start_time'])
+        # One indexed range query covers every requested channel
+        programmes = programme_model.get_range(tvg_ids_needed, int(start_time.timestamp()), int(end_time.timestamp()))
+        display_names = programme_model.get_channel_names(tvg_ids_needed)
         
-        return guide_data
+        if compact:
+            return encode_compact_programmes(programmes, display_names, tvg_id_to_channel_id)
+        return map_guide_programmes(programmes, display_names, tvg_id_to_channel_id)
         
-    except ET.ParseError as e:
-        logger.error(f"Error parsing XMLTV data: {e}")
-        return {}
     except Exception as e:
         logger.error(f"Error processing guide data: {e}")
         return {}
 
+def build_guide_delta(programme_model, tvg_ids_needed, tvg_id_to_channel_id, start_time, end_time, since, compact=False):
+    """
+    Build the changes to a client's guide since the version in its token.
+    
+    Returns {'unchanged': True} when nothing changed, otherwise a delta with
+    added/changed programmes and the start times of removed ones. Clients apply
+    removals first, then programmes, and drop anything that ended before start_time.
+    """
+    changes = programme_model.get_changes(
+        tvg_ids_needed,
+        int(start_time.timestamp()),
+        int(end_time.timestamp()),
+        since['version'],
+        since['window_end']
+    )
+    
+    if not changes['programmes'] and not changes['removals']:
+        return {'unchanged': True}
+    
+    display_names = programme_model.get_channel_names(list(changes['programmes'].keys()))
+    
+    removals = {}
+    for xmltv_channel_id, start_times in changes['removals'].items():
+        internal_channel_id = tvg_id_to_channel_id.get(xmltv_channel_id)
+        if internal_channel_id:
+            removals[internal_channel_id] = [t.strftime('%Y-%m-%dT%H:%M:%SZ') for t in start_times]
+    
+    if compact:
+        programmes = encode_compact_programmes(changes['programmes'], display_names, tvg_id_to_channel_id)
+    else:
+        programmes = map_guide_programmes(changes['programmes'], display_names, tvg_id_to_channel_id)
+    
+    return {
+        'delta': True,
+        'programmes': programmes,
+        'removals': removals
+    }
+
+# Headers of a stream server response passed on to the player
+RELAYED_HEADERS = ('Content-Type', 'Cache-Control')
+
+def relay_to_stream_server():
+    """
+    Relay a stream request to the stream server, the one process that holds every channel's session.
+
+    Players load streams from the stream server directly and only come here when its
+    port is not reachable from them, e.g. a container that publishes only the web UI's.
+    """
+    try:
+        upstream = stream_server_client.relay(request.method, request.full_path.rstrip('?'), request.get_data())
+    except requests.RequestException as e:
+        logger.error(f"Stream server not reachable for {request.path}: {e}")
+        return jsonify({'success': False, 'error': 'Stream server not reachable'}), 503
+    
+    headers = {name: upstream.headers[name] for name in RELAYED_HEADERS if name in upstream.headers}
+    response = Response(upstream.iter_content(HLS_RELAY_CHUNK_SIZE), status=upstream.status_code, headers=headers)
+    response.call_on_close(upstream.close)
+    return response
+
 @bp.route('/proxy/stream/<int:channel_id>')
 def proxy_stream(channel_id):
-    """Proxy HLS video streams to bypass CORS restrictions."""
+    """Proxy a channel's HLS stream - served by the stream server."""
+    return relay_to_stream_server()
+
+@bp.route('/proxy/hls/<int:channel_id>/<resource>')
+def proxy_hls(channel_id, resource):
+    """Proxy a resource of a rewritten channel playlist - served by the stream server."""
+    return relay_to_stream_server()
+
+@bp.route('/proxy/leave/<int:channel_id>', methods=['POST'])
+def proxy_leave(channel_id):
+    """Let a player say it stopped watching - handled by the stream server."""
+    return relay_to_stream_server()
+
+@bp.route('/proxy/sessions')
+def proxy_sessions():
+    """API endpoint listing the open stream sessions - served by the stream server, which holds them all."""
+    return relay_to_stream_server()
+
+@bp.route('/proxy/sessions/<int:channel_id>/close', methods=['POST'])
+def close_proxy_session(channel_id):
+    """API endpoint to kill a channel's stream session - served by the stream server."""
+    return relay_to_stream_server()
+
+@bp.route('/api/dvr/status')
+def api_dvr_status():
+    """
+    API endpoint reporting DVR health and the state of each upstream circuit breaker.
+    
+    Breakers live in memory in each process. 'circuits' holds the breakers of the
+    web worker that answered (identified by 'pid'), so successive calls may differ.
+    'stream_server' holds the stream server's breakers, which guard all stream traffic.
+    """
     try:
-        import requests
-        from flask import Response, request as flask_request
-        
-        # Get channel from database
-        db = Database()
-        channel_model = Channel(db)
-        channel = channel_model.get_by_id(channel_id)
-        
-        if not channel:
-            return jsonify({'error': 'Channel not found'}), 404
-        
-        # Get the original stream URL
-        stream_url = channel['stream_url']
-        
-        # Always use HLS format for web playback
-        format_param = 'hls'
-        
-        # Modify URL to use HLS format and handle codec appropriately
-        if '?' in stream_url:
-            base_url = stream_url.split('?')[0]
-            # Parse existing parameters
-            from urllib.parse import urlparse, parse_qs, urlencode
-            parsed = urlparse(stream_url)
-            params = parse_qs(parsed.query)
-            # Update format to HLS
-            params['format'] = [format_param]
-            
-            # For HDHomeRun comptat streams, try h264 codec instead of copy for better browser compatibility
-            # This helps with AAC audio streams that don't work well with codec=copy
-            if 'hdhomerun' in stream_url.lower() or str(CHANNELS_DVR_DEFAULT_PORT) in stream_url:
-                params['codec'] = ['h264']
-                logger.info(f"Stream detected, using h264 codec for better browser compatibility")
-            else:
-                params['codec'] = ['copy']
-                
-            # Rebuild URL
-            new_query = urlencode(params, doseq=True)
-            proxied_url = f"{base_url}?{new_query}"
-        else:
-            # For HDHomeRun  compat streams, try h264 codec instead of copy
-            if 'hdhomerun' in stream_url.lower() or str(CHANNELS_DVR_DEFAULT_PORT) in stream_url:
-                proxied_url = f"{stream_url}?format={format_param}&codec=h264"
-                logger.info(f"Stream detected, using h264 codec for better browser compatibility")
-            else:
-                proxied_url = f"{stream_url}?format={format_param}&codec=copy"
-        
-        logger.info(f"Proxying HLS stream: {proxied_url}")
+        try:
+            stream_server = stream_server_client.get('/proxy/circuits')
+            stream_server.pop('success', None)
+        except (requests.RequestException, ValueError) as e:
+            stream_server = {'error': f"Stream server not reachable: {e}"}
         
-        # Stream the content from Channels DVR
-        def generate():
-            try:
-                with requests.get(proxied_url, stream=True, timeout=HTTP_REQUEST_TIMEOUT) as r:
-                    r.raise_for_status()
-                    logger.info(f"Channels DVR response: {r.status_code}, Content-Type: {r.headers.get('content-type')}")
-                    
-                    for chunk in r.iter_content(chunk_size=8192):
-                        yield chunk
-                            
-            except Exception as e:
-                logger.error(f"Proxy streaming error: {e}")
-                yield b''
-        
-        # Set content type for HLS streams
-        content_type = 'application/vnd.apple.mpegurl'
-        
-        logger.info(f"Setting response content-type: {content_type}")
-        
-        return Response(
-            generate(),
-            content_type=content_type,
-            headers={
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0'
-            }
-        )
+        return jsonify({
+            'success': True,
+            'health': dvr_health.get_state(),
+            'pid': os.getpid(),
+            'circuits': get_breaker_statuses(),
+            'stream_server': stream_server
+        })
         
     except Exception as e:
-        logger.error(f"Proxy stream error: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"Error getting DVR status: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @bp.route('/api/playlists')
 def api_playlists():
@@ -1714,6 +1590,10 @@ def factory_reset():
             logger.info("Setup flags deleted")
         
         # Clear any cached data
+        guide_cache.invalidate()
+        channel_index.invalidate()
+        dvr_health.refresh()
+        
         cache_dirs = ["__pycache__", "app/__pycache__", "app/main/__pycache__", 
                       "app/models/__pycache__", "app/services/__pycache__", "config/__pycache__"]
         
@@ -3,10 +3,15 @@ Database models for channel and playlist management.
 """
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+import re
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Any, Iterable
 from pathlib import Path
-from app.constants import DEFAULT_DB_PATH, MAX_SEARCH_HISTORY
+from app.constants import DEFAULT_DB_PATH, MAX_SEARCH_HISTORY, GUIDE_VERSION_HISTORY
+
+logger = logging.getLogger(__name__)
 
 class Database:
     """Database connection and management."""
@@ -67,12 +72,124 @@ class Database:
                 )
             """)
             
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS programmes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tvg_id TEXT NOT NULL,
+                    start INTEGER NOT NULL,  -- epoch seconds (UTC)
+                    stop INTEGER NOT NULL,   -- epoch seconds (UTC)
+                    title TEXT,
+                    sub_title TEXT,
+                    description TEXT,
+                    episode_num TEXT,
+                    categories TEXT,  -- JSON list of category names
+                    artwork_url TEXT,
+                    version INTEGER NOT NULL DEFAULT 0  -- guide version that last changed this row
+                )
+            """)
+            
+            # Databases created before guide versioning need the column added
+            programme_columns = [row[1] for row in conn.execute("PRAGMA table_info(programmes)").fetchall()]
+            if 'version' not in programme_columns:
+                conn.execute("ALTER TABLE programmes ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS programme_removals (
+                    tvg_id TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    version INTEGER NOT NULL  -- guide version that removed the programme
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS guide_channels (
+                    tvg_id TEXT PRIMARY KEY,
+                    display_name TEXT
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS guide_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            
             # Create indexes for better performance
             conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_tvg_id ON channels(tvg_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_enabled ON channels(is_enabled)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_playlist_channels_order ON playlist_channels(playlist_id, sort_order)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_search_history_channel ON search_history(channel_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_search_history_searched_at ON search_history(searched_at DESC)")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_programmes_tvg_id_start ON programmes(tvg_id, start)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_programmes_start_stop ON programmes(start, stop)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_programmes_version ON programmes(version)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_programme_removals_version ON programme_removals(version)")
+            
+            self._init_programme_search(conn)
+            self._init_channel_versioning(conn)
+    
+    def _init_programme_search(self, conn: sqlite3.Connection):
+        """Create the FTS5 index over programmes, kept in sync by triggers."""
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'programmes_fts'"
+            ).fetchone()
+            
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS programmes_fts USING fts5(
+                    title, sub_title, description, categories,
+                    content='programmes', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS programmes_fts_insert AFTER INSERT ON programmes BEGIN
+                    INSERT INTO programmes_fts (rowid, title, sub_title, description, categories)
+                    VALUES (new.id, new.title, new.sub_title, new.description, new.categories);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS programmes_fts_delete AFTER DELETE ON programmes BEGIN
+                    INSERT INTO programmes_fts (programmes_fts, rowid, title, sub_title, description, categories)
+                    VALUES ('delete', old.id, old.title, old.sub_title, old.description, old.categories);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS programmes_fts_update AFTER UPDATE ON programmes BEGIN
+                    INSERT INTO programmes_fts (programmes_fts, rowid, title, sub_title, description, categories)
+                    VALUES ('delete', old.id, old.title, old.sub_title, old.description, old.categories);
+                    INSERT INTO programmes_fts (rowid, title, sub_title, description, categories)
+                    VALUES (new.id, new.title, new.sub_title, new.description, new.categories);
+                END
+            """)
+            
+            # Index programmes stored before the search table existed
+            if not exists:
+                conn.execute("INSERT INTO programmes_fts (programmes_fts) VALUES ('rebuild')")
+                
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 not available, program search will use LIKE matching: {e}")
+    
+    def _init_channel_versioning(self, conn: sqlite3.Connection):
+        """Bump a version counter on every channel change so in-memory channel indexes in any worker can notice."""
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS channels_version_{event.lower()} AFTER {event} ON channels BEGIN
+                    INSERT INTO guide_meta (key, value) VALUES ('channels_version', 1)
+                    ON CONFLICT(key) DO UPDATE SET value = value + 1;
+                END
+            """)
+    
+    def has_programme_search(self) -> bool:
+        """Check whether the FTS5 programme index exists."""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'programmes_fts'"
+            ).fetchone()
+            return row is not None
     
     def get_connection(self):
         """Get database connection."""
@@ -260,42 +377,11 @@ class Channel:
         with self.db.get_connection() as conn:
             conn.execute("DELETE FROM channels")
 
-    def search(self, query: str) -> List[Dict[str, Any]]:
-        """Search channels by name, tvg_id, or channel_number."""
+    def get_version(self) -> int:
+        """Get the channel version - it changes whenever any channel is added, updated or removed."""
         with self.db.get_connection() as conn:
-            conn.row_factory = sqlite3.Row
-            
-            # Search in name, tvg_id, and channel_number fields
-            search_query = f"%{query}%"
-            rows = conn.execute("""
-                SELECT * FROM channels 
-                WHERE (name LIKE ? OR tvg_id LIKE ? OR channel_number LIKE ?)
-                AND is_enabled = 1
-                ORDER BY 
-                    CASE 
-                        WHEN name LIKE ? THEN 1
-                        WHEN tvg_id LIKE ? THEN 2
-                        WHEN channel_number LIKE ? THEN 3
-                        ELSE 4
-                    END,
-                    name
-                LIMIT 100
-            """, (search_query, search_query, search_query, search_query, search_query, search_query)).fetchall()
-            
-            channels = []
-            for row in rows:
-                channel = dict(row)
-                # Parse attributes JSON
-                if channel['attributes']:
-                    try:
-                        channel['attributes'] = json.loads(channel['attributes'])
-                    except json.JSONDecodeError:
-                        channel['attributes'] = {}
-                else:
-                    channel['attributes'] = {}
-                channels.append(channel)
-            
-            return channels
+            row = conn.execute("SELECT value FROM guide_meta WHERE key = 'channels_version'").fetchone()
+            return int(row[0]) if row else 0
 
 class Playlist:
     """Playlist model for database operations."""
@@ -476,3 +562,335 @@ class SearchHistory:
         with self.db.get_connection() as conn:
             row = conn.execute("SELECT COUNT(*) FROM search_history").fetchone()
             return row[0] if row else 0
+
+
+class Programme:
+    """Programme model for the persisted XMLTV guide."""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    @staticmethod
+    def _row_to_programme(row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a programmes row into the record shape produced by the XMLTV parser."""
+        programme = dict(row)
+        programme['channel'] = programme.pop('tvg_id')
+        programme['start'] = datetime.fromtimestamp(programme['start'], timezone.utc)
+        programme['stop'] = datetime.fromtimestamp(programme['stop'], timezone.utc)
+        try:
+            programme['categories'] = json.loads(programme['categories']) if programme['categories'] else []
+        except json.JSONDecodeError:
+            programme['categories'] = []
+        return programme
+    
+    def sync_guide(self, tvg_ids: Iterable[str], channels: Dict[str, str],
+                   programmes: Dict[str, List[Dict[str, Any]]], retain_after: int) -> Dict[str, int]:
+        """
+        Incrementally load a parsed guide, touching only rows that changed.
+        
+        Rows that are added or changed are stamped with a new guide version and
+        programmes dropped from the feed are recorded in programme_removals, so
+        clients can ask for everything that changed since a version they hold.
+        
+        Args:
+            tvg_ids: Channels covered by this guide load - their missing programmes are removed
+            channels: tvg_id -> XMLTV display name
+            programmes: tvg_id -> programme records from parse_xmltv_stream
+            retain_after: Epoch seconds - programmes that ended before this are pruned
+            
+        Returns:
+            Dictionary with counts of changed and removed rows and the resulting guide version
+        """
+        current_version = self.get_version()
+        version = current_version + 1
+        
+        rows = [
+            (
+                tvg_id,
+                int(p['start'].timestamp()),
+                int(p['stop'].timestamp()),
+                p['title'],
+                p['sub_title'],
+                p['description'],
+                p['episode_num'],
+                json.dumps(p['categories']),
+                p['artwork_url'],
+                version
+            )
+            for tvg_id, channel_programmes in programmes.items()
+            for p in channel_programmes
+        ]
+        
+        with self.db.get_connection() as conn:
+            # Upsert, but skip the write entirely when nothing about the programme changed
+            cursor = conn.executemany("""
+                INSERT INTO programmes (tvg_id, start, stop, title, sub_title, description, episode_num, categories, artwork_url, version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(tvg_id, start) DO UPDATE SET
+                    stop = excluded.stop,
+                    title = excluded.title,
+                    sub_title = excluded.sub_title,
+                    description = excluded.description,
+                    episode_num = excluded.episode_num,
+                    categories = excluded.categories,
+                    artwork_url = excluded.artwork_url,
+                    version = excluded.version
+                WHERE programmes.stop IS NOT excluded.stop
+                    OR programmes.title IS NOT excluded.title
+                    OR programmes.sub_title IS NOT excluded.sub_title
+                    OR programmes.description IS NOT excluded.description
+                    OR programmes.episode_num IS NOT excluded.episode_num
+                    OR programmes.categories IS NOT excluded.categories
+                    OR programmes.artwork_url IS NOT excluded.artwork_url
+            """, rows)
+            changed = cursor.rowcount
+            
+            # Remove programmes that are no longer in the guide for the channels it covers
+            removed = 0
+            if rows:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS guide_load_channels (tvg_id TEXT PRIMARY KEY)")
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS guide_load_keys (tvg_id TEXT, start INTEGER, PRIMARY KEY (tvg_id, start))")
+                conn.execute("DELETE FROM guide_load_channels")
+                conn.execute("DELETE FROM guide_load_keys")
+                conn.executemany("INSERT OR IGNORE INTO guide_load_channels (tvg_id) VALUES (?)", [(t,) for t in tvg_ids])
+                conn.executemany("INSERT OR IGNORE INTO guide_load_keys (tvg_id, start) VALUES (?, ?)", [(r[0], r[1]) for r in rows])
+                
+                dropped = """
+                    FROM programmes
+                    WHERE start >= ?
+                    AND tvg_id IN (SELECT tvg_id FROM guide_load_channels)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM guide_load_keys k
+                        WHERE k.tvg_id = programmes.tvg_id AND k.start = programmes.start
+                    )
+                """
+                min_start = min(r[1] for r in rows)
+                conn.execute(f"INSERT INTO programme_removals (tvg_id, start, version) SELECT tvg_id, start, ? {dropped}", (version, min_start))
+                cursor = conn.execute(f"DELETE {dropped}", (min_start,))
+                removed = cursor.rowcount
+            
+            # Prune programmes that have already ended - clients drop those on their own
+            cursor = conn.execute("DELETE FROM programmes WHERE stop < ?", (retain_after,))
+            pruned = cursor.rowcount
+            
+            conn.executemany(
+                "INSERT OR REPLACE INTO guide_channels (tvg_id, display_name) VALUES (?, ?)",
+                list(channels.items())
+            )
+            
+            # Only move to a new version when something a client could see changed
+            if changed or removed:
+                conn.execute(
+                    "INSERT OR REPLACE INTO guide_meta (key, value) VALUES ('guide_version', ?)",
+                    (str(version),)
+                )
+                
+                # Keep a bounded history of removals
+                floor = max(version - GUIDE_VERSION_HISTORY, 0)
+                conn.execute("DELETE FROM programme_removals WHERE version <= ?", (floor,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO guide_meta (key, value) VALUES ('guide_version_floor', ?)",
+                    (str(floor),)
+                )
+            else:
+                version = current_version
+            
+            return {
+                'changed': changed,
+                'removed': removed + pruned,
+                'version': version
+            }
+    
+    def get_range(self, tvg_ids: List[str], start: int, end: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Get programmes overlapping the epoch window [start, end) for the given channels."""
+        guide = {}
+        if not tvg_ids:
+            return guide
+        
+        with self.db.get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            placeholders = ','.join('?' * len(tvg_ids))
+            rows = conn.execute(f"""
+                SELECT tvg_id, start, stop, title, sub_title, description, episode_num, categories, artwork_url
+                FROM programmes
+                WHERE tvg_id IN ({placeholders}) AND start < ? AND stop > ?
+                ORDER BY tvg_id, start
+            """, (*tvg_ids, end, start)).fetchall()
+            
+            for row in rows:
+                programme = self._row_to_programme(row)
+                guide.setdefault(programme['channel'], []).append(programme)
+            
+            return guide
+    
+    def load_guide(self, tvg_ids: Iterable[str]) -> Dict[str, Any]:
+        """Load the stored guide for the given channels in the same shape as parse_xmltv_stream."""
+        tvg_ids = list(tvg_ids)
+        return {
+            'channels': self.get_channel_names(tvg_ids),
+            'programmes': self.get_range(tvg_ids, 0, 2 ** 62)
+        }
+    
+    def get_channel_names(self, tvg_ids: List[str]) -> Dict[str, str]:
+        """Get XMLTV display names for the given channels."""
+        if not tvg_ids:
+            return {}
+        with self.db.get_connection() as conn:
+            placeholders = ','.join('?' * len(tvg_ids))
+            rows = conn.execute(
+                f"SELECT tvg_id, display_name FROM guide_channels WHERE tvg_id IN ({placeholders})",
+                tvg_ids
+            ).fetchall()
+            return {row[0]: row[1] or '' for row in rows}
+    
+    @staticmethod
+    def _build_match_query(query: str) -> Optional[str]:
+        """Turn free text into an FTS5 query where every word is a prefix match."""
+        words = re.findall(r'\w+', query)
+        if not words:
+            return None
+        return ' '.join(f'"{word}"*' for word in words)
+    
+    def search(self, query: str, tvg_ids: List[str], start: int, end: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        Full-text search of programmes starting within the epoch window [start, end).
+        
+        Matches title, sub-title, description and category with prefix matching,
+        ordered by relevance (title matches rank highest).
+        """
+        if not tvg_ids:
+            return []
+        
+        placeholders = ','.join('?' * len(tvg_ids))
+        use_fts = self.db.has_programme_search()
+        
+        with self.db.get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            
+            if use_fts:
+                match_query = self._build_match_query(query)
+                if not match_query:
+                    return []
+                
+                rows = conn.execute(f"""
+                    SELECT p.tvg_id, p.start, p.stop, p.title, p.sub_title, p.description,
+                           p.episode_num, p.categories, p.artwork_url
+                    FROM programmes_fts
+                    JOIN programmes p ON p.id = programmes_fts.rowid
+                    WHERE programmes_fts MATCH ?
+                    AND p.start >= ? AND p.start < ?
+                    AND p.tvg_id IN ({placeholders})
+                    ORDER BY bm25(programmes_fts, 10.0, 4.0, 1.0, 2.0), p.start
+                    LIMIT ?
+                """, (match_query, start, end, *tvg_ids, limit)).fetchall()
+            else:
+                rows = conn.execute(f"""
+                    SELECT tvg_id, start, stop, title, sub_title, description,
+                           episode_num, categories, artwork_url
+                    FROM programmes
+                    WHERE title LIKE ?
+                    AND start >= ? AND start < ?
+                    AND tvg_id IN ({placeholders})
+                    ORDER BY start
+                    LIMIT ?
+                """, (f"%{query}%", start, end, *tvg_ids, limit)).fetchall()
+            
+            return [self._row_to_programme(row) for row in rows]
+    
+    def get_version(self) -> int:
+        """Get the current guide version (0 before anything is stored)."""
+        try:
+            return int(self.get_meta('guide_version') or 0)
+        except ValueError:
+            return 0
+    
+    def get_version_floor(self) -> int:
+        """Get the oldest version that changes can still be computed from."""
+        try:
+            return int(self.get_meta('guide_version_floor') or 0)
+        except ValueError:
+            return 0
+    
+    def get_guide_id(self) -> str:
+        """Get the random id of this guide store, so tokens from a reset database are rejected."""
+        guide_id = self.get_meta('guide_id')
+        if not guide_id:
+            guide_id = uuid.uuid4().hex[:8]
+            self.set_meta('guide_id', guide_id)
+        return guide_id
+    
+    def get_changes(self, tvg_ids: List[str], start: int, end: int, since_version: int,
+                    previous_end: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Get what changed in the window [start, end) since a client fetched `since_version`.
+        
+        Args:
+            tvg_ids: Channels the client holds
+            start: Start of the client's new window (epoch seconds)
+            end: End of the client's new window (epoch seconds)
+            since_version: Guide version the client last saw
+            previous_end: End of the window the client last fetched - anything starting
+                after it is new to the client even if it has not changed
+            
+        Returns:
+            Dictionary with 'programmes' (tvg_id -> added/changed records) and
+            'removals' (tvg_id -> list of removed start times)
+        """
+        changes = {
+            'programmes': {},
+            'removals': {}
+        }
+        if not tvg_ids:
+            return changes
+        
+        placeholders = ','.join('?' * len(tvg_ids))
+        
+        with self.db.get_connection() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(f"""
+                SELECT tvg_id, start, stop, title, sub_title, description, episode_num, categories, artwork_url
+                FROM programmes
+                WHERE tvg_id IN ({placeholders}) AND start < ? AND stop > ?
+                AND (version > ? OR start >= ?)
+                ORDER BY tvg_id, start
+            """, (*tvg_ids, end, start, since_version, previous_end)).fetchall()
+            
+            for row in rows:
+                programme = self._row_to_programme(row)
+                changes['programmes'].setdefault(programme['channel'], []).append(programme)
+            
+            rows = conn.execute(f"""
+                SELECT DISTINCT tvg_id, start FROM programme_removals
+                WHERE tvg_id IN ({placeholders}) AND version > ?
+            """, (*tvg_ids, since_version)).fetchall()
+            
+            for row in rows:
+                changes['removals'].setdefault(row['tvg_id'], []).append(
+                    datetime.fromtimestamp(row['start'], timezone.utc)
+                )
+            
+            return changes
+    
+    def get_meta(self, key: str) -> Optional[str]:
+        """Get a guide metadata value."""
+        with self.db.get_connection() as conn:
+            row = conn.execute("SELECT value FROM guide_meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+    
+    def set_meta(self, key: str, value: Any):
+        """Set a guide metadata value."""
+        with self.db.get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO guide_meta (key, value) VALUES (?, ?)",
+                (key, str(value))
+            )
+    
+    def increment_meta(self, key: str) -> int:
+        """Atomically add one to a numeric guide metadata value and return the new value."""
+        with self.db.get_connection() as conn:
+            conn.execute("""
+                INSERT INTO guide_meta (key, value) VALUES (?, 1)
+                ON CONFLICT(key) DO UPDATE SET value = value + 1
+            """, (key,))
+            row = conn.execute("SELECT value FROM guide_meta WHERE key = ?", (key,)).fetchone()
+            return int(row[0])
@@ -0,0 +1,243 @@
+"""
+Channel Index Service - In-memory n-gram index for channel search.
+
+Enabled channels are indexed by normalised name, tvg_id and channel number:
+trigram postings answer substring queries, a sorted token list answers short
+prefix queries, and padded word trigrams give typo-tolerant fallback matches.
+The index is rebuilt whenever the channels table changes (e.g. after a sync).
+"""
+import re
+import sqlite3
+import threading
+import time
+import heapq
+import unicodedata
+import logging
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Set
+from app.models.database import Database, Channel
+from app.constants import (
+    MAX_CHANNEL_SEARCH_RESULTS,
+    CHANNEL_SEARCH_MIN_SIMILARITY,
+    CHANNEL_INDEX_CHECK_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# Matching fields in ranking order
+FIELDS = ('name', 'tvg_id', 'channel_number')
+
+# Match quality within a field, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+
+def normalize(text: Optional[str]) -> str:
+    """Lower-case, strip accents and collapse punctuation to single spaces."""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(_NON_WORD.split(text.lower())).strip()
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams of a string as it is, for substring lookups."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def word_trigrams(text: str) -> Set[str]:
+    """Padded trigrams of each word, for similarity matching (so word starts weigh more)."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Dice coefficient of two trigram sets."""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+class _Entry:
+    """One indexed channel."""
+
+    __slots__ = ('channel', 'fields', 'sort_key', 'word_grams')
+
+    def __init__(self, channel: Dict[str, Any]):
+        self.channel = channel
+        self.fields = tuple(normalize(channel.get(field)) for field in FIELDS)
+        self.sort_key = self.fields[0]
+        # Whole name and tvg_id, plus each of their words on its own
+        texts = [self.fields[0], self.fields[1]] + self.fields[0].split() + self.fields[1].split()
+        self.word_grams = [word_trigrams(text) for text in texts if text]
+
+class _Index:
+    """Immutable index over one version of the channel list - swapped as a whole on rebuild."""
+
+    def __init__(self, channels: List[Dict[str, Any]], version: int):
+        self.version = version
+        self.entries = [_Entry(channel) for channel in channels]
+        self.postings: Dict[str, Set[int]] = {}
+        self.word_postings: Dict[str, Set[int]] = {}
+        tokens = []
+
+        for doc, entry in enumerate(self.entries):
+            for text in entry.fields:
+                for gram in trigrams(text):
+                    self.postings.setdefault(gram, set()).add(doc)
+                tokens.extend((token, doc) for token in text.split())
+            for grams in entry.word_grams:
+                for gram in grams:
+                    self.word_postings.setdefault(gram, set()).add(doc)
+
+        self.tokens = sorted(tokens)
+
+    def _substring_candidates(self, query: str) -> Set[int]:
+        """Documents that could contain the query - every one of its trigrams must be present."""
+        grams = sorted(trigrams(query), key=lambda gram: len(self.postings.get(gram, ())))
+        if not grams:
+            return set()
+        candidates = set(self.postings.get(grams[0], ()))
+        for gram in grams[1:]:
+            candidates &= self.postings.get(gram, set())
+            if not candidates:
+                break
+        return candidates
+
+    def _prefix_candidates(self, query: str) -> Set[int]:
+        """Documents with a word starting with a (short) query."""
+        candidates = set()
+        i = bisect_left(self.tokens, (query,))
+        while i < len(self.tokens) and self.tokens[i][0].startswith(query):
+            candidates.add(self.tokens[i][1])
+            i += 1
+        return candidates
+
+    @staticmethod
+    def _match(entry: _Entry, query: str):
+        """Rank key for a direct match of the query in one of the entry's fields, or None."""
+        if query in entry.fields:
+            # An exact name, tvg_id or number beats any partial match
+            return (0, entry.fields.index(query), EXACT)
+        for tier, text in enumerate(entry.fields):
+            if not text:
+                continue
+            if text.startswith(query):
+                return (1, tier, PREFIX)
+            if f" {query}" in text:
+                return (1, tier, WORD_PREFIX)
+            if len(query) >= 3 and query in text:
+                return (1, tier, SUBSTRING)
+        return None
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        if len(query) >= 3:
+            candidates = self._substring_candidates(query)
+        else:
+            candidates = self._prefix_candidates(query)
+
+        ranked = []
+        for doc in candidates:
+            entry = self.entries[doc]
+            rank = self._match(entry, query)
+            if rank is not None:
+                ranked.append((rank, entry.sort_key, doc))
+        results = [self.entries[doc].channel for _, _, doc in heapq.nsmallest(limit, ranked)]
+
+        # Typo-tolerant fallback when direct matches do not fill the page
+        if len(results) < limit and len(query) >= 3:
+            matched = {doc for _, _, doc in ranked}
+            results.extend(self._fuzzy(query, matched, limit - len(results)))
+
+        return results
+
+    def _fuzzy(self, query: str, exclude: Set[int], limit: int) -> List[Dict[str, Any]]:
+        """Channels whose name or tvg_id is similar to the query by trigram overlap."""
+        query_grams = word_trigrams(query)
+
+        # Similar strings share at least `needed` trigrams, so every one of them holds
+        # one of the rarest len - needed + 1 - only those postings need to be read
+        needed = max(2, len(query_grams) // 3)
+        grams = sorted(query_grams, key=lambda gram: len(self.word_postings.get(gram, ())))
+        candidates = set()
+        for gram in grams[:len(grams) - needed + 1]:
+            candidates.update(self.word_postings.get(gram, ()))
+
+        scored = []
+        for doc in candidates - exclude:
+            entry = self.entries[doc]
+            score = max(similarity(query_grams, grams) for grams in entry.word_grams)
+            if score >= CHANNEL_SEARCH_MIN_SIMILARITY:
+                scored.append((-score, entry.sort_key, doc))
+
+        return [self.entries[doc].channel for _, _, doc in heapq.nsmallest(limit, scored)]
+
+class ChannelIndex:
+    """
+    Process-wide channel search index, rebuilt when the channels table changes.
+
+    The stored channel version is checked at most every check_interval seconds,
+    so changes made through another worker show up within that time. Routes
+    that change channels call invalidate() for an immediate check here.
+    """
+
+    def __init__(self, check_interval: float = CHANNEL_INDEX_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._channel_model = None
+        self._checked_at = 0.0
+
+    def _get_version(self) -> int:
+        """Read the stored channel version through one long-lived handle."""
+        if self._channel_model is None:
+            self._channel_model = Channel(Database())
+        try:
+            return self._channel_model.get_version()
+        except sqlite3.OperationalError:
+            # The database file was replaced (factory reset) - open it again, which recreates the tables
+            self._channel_model = Channel(Database())
+            return self._channel_model.get_version()
+
+    def _current(self) -> _Index:
+        """Get an index matching the stored channel version, rebuilding it if channels changed."""
+        now = time.monotonic()
+        index = self._index
+        if index is not None and now - self._checked_at < self.check_interval:
+            return index
+
+        version = self._get_version()
+        self._checked_at = now
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            index = self._index
+            if index is None or index.version != version:
+                index = _Index(self._channel_model.get_all(enabled_only=True), version)
+                self._index = index
+                logger.info(f"Built channel search index for {len(index.entries)} channels")
+        return index
+
+    def search(self, query: str, limit: int = MAX_CHANNEL_SEARCH_RESULTS) -> List[Dict[str, Any]]:
+        """
+        Search enabled channels by name, tvg_id or channel number.
+
+        Exact matches of any field come first, then partial matches ranked by
+        field (name, then tvg_id, then number), then by match quality (prefix,
+        word prefix, substring), then by name. Close misspellings of names and
+        tvg_ids follow the direct matches.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        return [dict(channel) for channel in self._current().search(query, limit)]
+
+    def get_enabled(self) -> List[Dict[str, Any]]:
+        """Get every enabled channel held by the index, in name order."""
+        return [dict(entry.channel) for entry in self._current().entries]
+
+    def invalidate(self):
+        """Check the channel version on the next search instead of waiting for the interval."""
+        self._checked_at = 0.0
+
+# Shared instance used by all routes in this process
+channel_index = ChannelIndex()
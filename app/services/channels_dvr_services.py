@@ -1,40 +1,160 @@
+import os
 import socket
+import time
 import logging
+import requests
 from zeroconf import Zeroconf, ServiceBrowser, ServiceListener
-from threading import Event
-from typing import Optional, Dict, Any
+from threading import Event, Lock
+from typing import Optional, Dict, Any, List
 from app.constants import (
     DVR_DISCOVERY_DEFAULT_TIMEOUT, 
     CHANNELS_DVR_DEFAULT_PORT, 
-    EPG_DURATION_SECONDS
+    EPG_DURATION_SECONDS,
+    QUICK_CHECK_TIMEOUT,
+    DVR_DISCOVERY_TIMEOUT,
+    DVR_DISCOVERY_RETRY_SECONDS,
+    DVR_DISCOVERY_MAX_BACKOFF
 )
+from app.services.single_flight import upstream_calls
+from app.services.http_client import dvr_get
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class ChannelsListener(ServiceListener):
-    def __init__(self):
-        self.event = Event()
-        self.discovered_server_info = None
+CHANNELS_DVR_SERVICE_TYPE = "_channels_dvr._tcp.local."
 
-    def add_service(self, zeroconf, type, name):
-        """Called when a service is discovered."""
+class DVRRegistry(ServiceListener):
+    """
+    Live registry of Channels DVR servers announced over mDNS.
+    
+    A single Zeroconf browser runs for the life of the process and keeps the
+    registry up to date from add, update and remove events, so lookups are
+    dictionary reads instead of a fresh network browse. If the browser cannot
+    be started, the next lookup after a backoff tries again.
+    """
+    
+    def __init__(self, initial_browse: int = DVR_DISCOVERY_TIMEOUT):
+        self.initial_browse = initial_browse
+        self._lock = Lock()
+        self._found = Event()
+        self._servers = {}
+        self._zeroconf = None
+        self._browser = None
+        self._pid = None
+        self._started_at = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+    
+    def start(self):
+        """Start browsing once per process - Zeroconf sockets do not survive a fork."""
+        pid = os.getpid()
+        if self._pid == pid or time.monotonic() < self._retry_at:
+            return
+        with self._lock:
+            if self._pid == pid or time.monotonic() < self._retry_at:
+                return
+            
+            self._servers = {}
+            self._found = Event()
+            self._started_at = time.monotonic()
+            try:
+                self._zeroconf = Zeroconf()
+                self._browser = ServiceBrowser(self._zeroconf, CHANNELS_DVR_SERVICE_TYPE, self)
+            except Exception as e:
+                if self._zeroconf:
+                    self._zeroconf.close()
+                self._zeroconf = None
+                self._browser = None
+                # Leave _pid unset so a later lookup tries again, backing off while it keeps failing
+                backoff = min(DVR_DISCOVERY_RETRY_SECONDS * 2 ** self._failures, DVR_DISCOVERY_MAX_BACKOFF)
+                self._failures += 1
+                self._retry_at = time.monotonic() + backoff
+                logger.error(f"Error starting DVR discovery, retrying in {backoff}s: {e}")
+                return
+            
+            logger.info("Started Channels DVR discovery")
+            self._pid = pid
+            self._failures = 0
+            self._retry_at = 0.0
+    
+    def stop(self):
+        """Stop browsing and forget every known server."""
+        with self._lock:
+            if self._zeroconf:
+                self._zeroconf.close()
+            self._zeroconf = None
+            self._browser = None
+            self._servers = {}
+            self._pid = None
+    
+    def _resolve(self, zeroconf, type, name):
+        """Resolve a service announcement into our server info shape and store it."""
         try:
             info = zeroconf.get_service_info(type, name)
-            if info:
-                self.discovered_server_info = info
-                self.event.set()
+            if not info:
+                return
+            
+            ip_address = ChannelsDVRClient()._get_ip_address(info.addresses)
+            if not ip_address:
+                logger.warning(f"No valid IP address found for DVR server {name}")
+                return
+            
+            port = info.port or CHANNELS_DVR_DEFAULT_PORT
+            server_info = {
+                "name": info.name,
+                "ip_address": ip_address,
+                "port": port,
+                "url": f"http://{ip_address}:{port}",
+                "properties": dict(info.properties) if info.properties else {}
+            }
+            
+            with self._lock:
+                self._servers[name] = server_info
+            self._found.set()
+            logger.info(f"Channels DVR server available: {name} at {server_info['url']}")
         except Exception as e:
             logger.error(f"Error getting service info for {name}: {e}")
-
+    
+    def add_service(self, zeroconf, type, name):
+        """Called when a service is discovered."""
+        self._resolve(zeroconf, type, name)
+    
     def update_service(self, zeroconf, type, name):
         """Called when a service is updated."""
-        pass
-
+        self._resolve(zeroconf, type, name)
+    
     def remove_service(self, zeroconf, type, name):
         """Called when a service is removed."""
-        pass
+        with self._lock:
+            removed = self._servers.pop(name, None)
+        if removed:
+            logger.info(f"Channels DVR server went away: {name}")
+    
+    def _wait_for_initial_browse(self, timeout: float):
+        """Give a just-started browser a chance to hear the first announcement."""
+        if self._found.is_set():
+            return
+        remaining = self.initial_browse - (time.monotonic() - self._started_at)
+        if remaining > 0:
+            self._found.wait(timeout=min(timeout, remaining))
+    
+    def get_servers(self, timeout: float = 0) -> List[Dict[str, Any]]:
+        """
+        Get every known server, in the order they were discovered.
+        
+        Args:
+            timeout: Longest wait if the browser has only just started and found nothing yet
+        """
+        self.start()
+        self._wait_for_initial_browse(timeout)
+        with self._lock:
+            return [dict(server) for server in self._servers.values()]
+    
+    def get_server(self, timeout: float = 0) -> Optional[Dict[str, Any]]:
+        """Get the first known server, or None if none is announced."""
+        servers = self.get_servers(timeout)
+        return servers[0] if servers else None
 
 class ChannelsDVRClient:
     """A client for discovering and interacting with Channels DVR servers."""
@@ -125,47 +245,44 @@ class ChannelsDVRClient:
         return f"{base_url}/devices/{device}/guide/xmltv?duration={EPG_DURATION_SECONDS}"
 
 def discover_dvr_server(timeout: int = DVR_DISCOVERY_DEFAULT_TIMEOUT) -> Optional[Dict[str, Any]]:
-    """Discover DVR server via mDNS with improved error handling."""
-    zeroconf = None
+    """
+    Look up a DVR server in the live mDNS registry.
+    
+    Only waits (up to timeout) while the background browser is still doing its
+    first browse; after that the registry answers immediately.
+    """
     try:
-        zeroconf = Zeroconf()
-        listener = ChannelsListener()
-        browser = ServiceBrowser(zeroconf, "_channels_dvr._tcp.local.", listener)
-        
-        found = listener.event.wait(timeout=timeout)
-        
-        if found and listener.discovered_server_info:
-            info = listener.discovered_server_info
-            
-            # Create client instance to use IP address extraction method
-            client = ChannelsDVRClient()
-            ip_address = client._get_ip_address(info.addresses)
-            
-            if not ip_address:
-                logger.warning("No valid IP address found for DVR server")
-                return None
-            
-            port = info.port or CHANNELS_DVR_DEFAULT_PORT
-            
-            server_info = {
-                "name": info.name,
-                "ip_address": ip_address,
-                "port": port,
-                "url": f"http://{ip_address}:{port}",
-                "properties": dict(info.properties) if info.properties else {}
-            }
-            
-            return server_info
-        
-        logger.warning(f"No Channels DVR server found within {timeout} seconds")
-        return None
-        
+        server_info = dvr_registry.get_server(timeout)
+        if not server_info:
+            logger.warning("No Channels DVR server found")
+        return server_info
     except Exception as e:
         logger.error(f"Error discovering DVR server: {e}")
         return None
-    finally:
-        if zeroconf:
-            zeroconf.close()
+
+def discover_dvr_servers(timeout: int = DVR_DISCOVERY_DEFAULT_TIMEOUT) -> List[Dict[str, Any]]:
+    """Get every DVR server currently in the mDNS registry."""
+    try:
+        return dvr_registry.get_servers(timeout)
+    except Exception as e:
+        logger.error(f"Error discovering DVR servers: {e}")
+        return []
+
+def fetch_server_status(ip_address: str, port: int, timeout: int = QUICK_CHECK_TIMEOUT) -> requests.Response:
+    """
+    Request a DVR server's /status endpoint.
+    
+    Concurrent checks of the same server share one upstream request.
+    
+    Raises:
+        CircuitOpenError: If the server recently failed repeatedly
+        requests.RequestException: If the server cannot be reached
+    """
+    status_url = f"http://{ip_address}:{port}/status"
+    return upstream_calls.do(('GET', status_url), lambda: dvr_get(status_url, timeout=timeout))
+
+# Shared registry, started by the first lookup in each process
+dvr_registry = DVRRegistry()
 
 # Convenience functions for backward compatibility
 def get_m3u_url(device: str = "ANY", format: str = "hls", codec: str = "copy") -> Optional[str]:
@@ -0,0 +1,190 @@
+"""
+Circuit Breaker Service - Fails fast while an upstream DVR host is unreachable.
+"""
+import threading
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Type, TypeVar
+from urllib.parse import urlparse
+import requests
+from app.services.deadline import DeadlineExceeded
+from app.constants import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    CIRCUIT_HALF_OPEN_MAX_CALLS
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Only failures that mean the host itself is unreachable trip the breaker
+TRIP_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream host whose circuit is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit for {name} is open, retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker for one upstream host.
+
+    After failure_threshold consecutive connection failures the circuit opens
+    and calls fail immediately. Once reset_timeout has passed it goes half-open
+    and lets up to half_open_max_calls trial calls through: a success closes it
+    again, a failure re-opens it for another reset_timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT, half_open_max_calls: int = CIRCUIT_HALF_OPEN_MAX_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_calls = 0
+        self._last_error = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """Move an open circuit to half-open once its timeout has passed. Callers hold the lock."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_calls = 0
+            logger.info(f"Circuit for {self.name} is half-open")
+        return self._state
+
+    def _before_call(self):
+        """Reserve permission for one call, or raise CircuitOpenError."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._trial_calls < self.half_open_max_calls:
+                self._trial_calls += 1
+                return
+            retry_in = max(self._opened_at + self.reset_timeout - time.monotonic(), 0)
+        raise CircuitOpenError(self.name, retry_in)
+
+    def _release(self):
+        """Give back a half-open trial slot whose call ended without telling us anything."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trial_calls > 0:
+                self._trial_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._last_error = None
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures: {error}")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """
+        Run an upstream call through the breaker.
+
+        Raises:
+            CircuitOpenError: If the circuit is open - fn is not called
+        """
+        self._before_call()
+        try:
+            result = fn()
+        except DeadlineExceeded:
+            self._release()
+            raise
+        except TRIP_EXCEPTIONS as e:
+            self.record_failure(e)
+            raise
+        except Exception:
+            # The host answered, so it is reachable even if the request failed
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]],
+                         trip_exceptions: Tuple[Type[BaseException], ...] = TRIP_EXCEPTIONS) -> T:
+        """
+        Run an awaited upstream call through the breaker, for clients other than requests.
+
+        Args:
+            fn: Returns the awaitable upstream call
+            trip_exceptions: The client's exceptions meaning the host is unreachable
+
+        Raises:
+            CircuitOpenError: If the circuit is open - fn is not called
+        """
+        self._before_call()
+        try:
+            result = await fn()
+        except trip_exceptions as e:
+            self.record_failure(e)
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        except BaseException:
+            # Cancelled because the viewer went away - nothing learned about the host
+            self._release()
+            raise
+        self.record_success()
+        return result
+
+    def get_status(self) -> Dict[str, Any]:
+        """Describe the breaker for the status API."""
+        with self._lock:
+            state = self._current_state()
+            retry_in = max(self._opened_at + self.reset_timeout - time.monotonic(), 0) if state == OPEN else 0
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_in': round(retry_in, 1),
+                'last_error': self._last_error
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Get the breaker for the host a URL points at - each DVR host trips independently."""
+    host = urlparse(url).netloc or url
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+def get_breaker_statuses() -> List[Dict[str, Any]]:
+    """Get the status of every breaker created in this process."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.get_status() for breaker in breakers]
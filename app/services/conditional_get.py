@@ -0,0 +1,21 @@
+"""
+Conditional GET helpers - ETag / Last-Modified validators for upstream fetches.
+"""
+from typing import Dict, Optional, Tuple
+
+def conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    """Build If-None-Match / If-Modified-Since request headers from stored validators."""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+def response_validators(response) -> Tuple[Optional[str], Optional[str]]:
+    """Get the ETag and Last-Modified validators from a response."""
+    return response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+def is_not_modified(response) -> bool:
+    """Check whether the upstream answered 304 Not Modified."""
+    return response.status_code == 304
@@ -0,0 +1,66 @@
+"""
+Deadline Service - Per-request time budgets shared by every upstream call a route makes.
+
+A route's budget is started in a before_request hook and kept on flask.g, so
+chained DVR calls each get only the time that is left instead of their own full
+timeout. Outside a request (background threads) there is no deadline and
+timeouts pass through unchanged.
+"""
+import time
+from typing import BinaryIO, Optional
+from flask import g, has_app_context
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the current request has no time left for another upstream call."""
+
+def start_deadline(seconds: Optional[float]):
+    """Give the current request a total time budget (None for no deadline)."""
+    g.deadline = time.monotonic() + seconds if seconds is not None else None
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None if it has no deadline."""
+    if not has_app_context():
+        return None
+    deadline = g.get('deadline')
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """
+    Shorten an upstream timeout to the time left in the current request.
+
+    Raises:
+        DeadlineExceeded: If the budget has already run out
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if timeout is None else min(timeout, left)
+
+class _DeadlineReader:
+    """Read-only file wrapper that gives up once a deadline has passed."""
+
+    def __init__(self, source: BinaryIO, deadline: float):
+        self._source = source
+        self._deadline = deadline
+
+    def read(self, size: int = -1) -> bytes:
+        if time.monotonic() >= self._deadline:
+            raise DeadlineExceeded("Request deadline exceeded reading the response body")
+        return self._source.read(size)
+
+def limit_to_deadline(source: BinaryIO) -> BinaryIO:
+    """
+    Make reads of a streamed response body respect the current request's deadline.
+
+    Timeouts only bound each socket read, so a large body that keeps arriving can
+    outlast the request. Reads from the returned file raise DeadlineExceeded once
+    the budget is spent. Outside a request the source is returned unchanged.
+    """
+    left = remaining()
+    if left is None:
+        return source
+    return _DeadlineReader(source, time.monotonic() + left)
@@ -0,0 +1,142 @@
+"""
+DVR Health Service - Background monitor publishing whether the Channels DVR server is reachable.
+"""
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+from config.app_config import AppConfig
+from app.services.channels_dvr_services import discover_dvr_server, fetch_server_status
+from app.constants import (
+    QUICK_CHECK_TIMEOUT,
+    DVR_HEALTH_CHECK_INTERVAL,
+    DVR_HEALTH_RETRY_SECONDS,
+    DVR_HEALTH_MAX_BACKOFF
+)
+
+logger = logging.getLogger(__name__)
+
+class DVRHealthMonitor:
+    """Polls the DVR in the background so page renders only read the last known state.
+
+    The configured server is probed on /status every interval. When it cannot be
+    reached the mDNS registry is consulted instead, and failed checks back off
+    exponentially until the server answers again.
+    """
+
+    def __init__(self, interval: int = DVR_HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._state = {
+            'available': None,
+            'server_info': None,
+            'checked_at': None,
+            'last_success': None,
+            'consecutive_failures': 0,
+            'error': None
+        }
+
+    def check(self) -> Dict[str, Any]:
+        """Probe the DVR now and publish the result."""
+        configured_server = AppConfig.get_setup_flag('configured_server')
+        server_info = None
+        error = None
+
+        if configured_server:
+            try:
+                response = fetch_server_status(configured_server['ip_address'], configured_server['port'], timeout=QUICK_CHECK_TIMEOUT)
+                if response.status_code == 200:
+                    server_info = configured_server
+                else:
+                    error = f"Status check returned {response.status_code}"
+            except Exception as e:
+                error = str(e)
+
+        # Fall back to whatever the mDNS registry currently knows about
+        if server_info is None:
+            server_info = discover_dvr_server(timeout=0)
+
+        now = time.time()
+        with self._lock:
+            previous = self._state['available']
+            failures = 0 if server_info else self._state['consecutive_failures'] + 1
+            self._state = {
+                'available': server_info is not None,
+                'server_info': server_info,
+                'checked_at': now,
+                'last_success': now if server_info else self._state['last_success'],
+                'consecutive_failures': failures,
+                'error': None if server_info else (error or 'No Channels DVR server found')
+            }
+            state = dict(self._state)
+
+        if previous != state['available']:
+            if state['available']:
+                logger.info(f"Channels DVR server is available at {server_info['url']}")
+            else:
+                logger.warning(f"Channels DVR server is unavailable: {state['error']}")
+
+        return state
+
+    def _seconds_until_check(self) -> float:
+        """Regular interval while healthy, exponential backoff while failing."""
+        failures = self._state['consecutive_failures']
+        if not failures:
+            return self.interval
+        return min(DVR_HEALTH_RETRY_SECONDS * 2 ** (failures - 1), DVR_HEALTH_MAX_BACKOFF)
+
+    def _run(self):
+        """Background loop that keeps the published state current."""
+        logger.info("DVR health monitor started")
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking DVR health: {e}")
+            self._wake.wait(timeout=self._seconds_until_check())
+            self._wake.clear()
+
+    def start(self):
+        """Start the monitor thread once per process."""
+        pid = os.getpid()
+        if self._pid == pid and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='dvr-health', daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def refresh(self):
+        """Ask the monitor to check again now, e.g. after the server configuration changed."""
+        self.start()
+        self._wake.set()
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get the last published state without touching the network."""
+        self.start()
+        with self._lock:
+            state = dict(self._state)
+
+        # Until the first check finishes, trust the configured server
+        if state['available'] is None:
+            configured_server = AppConfig.get_setup_flag('configured_server')
+            state['available'] = bool(configured_server)
+            state['server_info'] = configured_server or None
+        return state
+
+    def is_available(self) -> bool:
+        """Check whether a DVR server was reachable at the last check."""
+        return self.get_state()['available']
+
+    def get_server_info(self) -> Optional[Dict[str, Any]]:
+        """Get the server that answered the last check."""
+        return self.get_state()['server_info']
+
+# Shared instance used by all routes in this process
+dvr_health = DVRHealthMonitor()
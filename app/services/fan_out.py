@@ -0,0 +1,78 @@
+"""
+Fan-out Service - Runs a route's independent upstream and database calls concurrently.
+"""
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+from flask import current_app, g, has_app_context
+from app.services.deadline import remaining
+from app.constants import FAN_OUT_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Get the process-wide pool, recreating it after a fork (threads do not survive one)."""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=FAN_OUT_MAX_WORKERS, thread_name_prefix='fan-out')
+                _executor_pid = pid
+    return _executor
+
+def _in_app_context(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Run fn in the caller's app context with the caller's deadline, from a pool thread."""
+    if not has_app_context():
+        return fn
+
+    app = current_app._get_current_object()
+    deadline = g.get('deadline')
+
+    def run():
+        with app.app_context():
+            g.deadline = deadline
+            return fn()
+    return run
+
+def fan_out(calls: Dict[str, Callable[[], Any]], defaults: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run independent calls concurrently and join their results.
+
+    The request's latency becomes that of the slowest call rather than the sum of
+    all of them. Calls run in the app context with the request's deadline, but
+    must not touch flask.request or flask.session, and must not fan out again.
+
+    Args:
+        calls: Name -> zero-argument callable
+        defaults: Name -> value used if that call fails or is still running when the
+                  request's deadline runs out (None if not given)
+
+    Returns:
+        Name -> result
+    """
+    defaults = defaults or {}
+    executor = _get_executor()
+    futures = {name: executor.submit(_in_app_context(fn)) for name, fn in calls.items()}
+
+    wait(futures.values(), timeout=remaining())
+
+    results = {}
+    for name, future in futures.items():
+        if not future.done():
+            logger.warning(f"Request deadline reached before '{name}' finished")
+            results[name] = defaults.get(name)
+            continue
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.warning(f"'{name}' failed: {e}")
+            results[name] = defaults.get(name)
+    return results
@@ -0,0 +1,484 @@
+"""
+Guide Cache Service - Shares one downloaded and parsed XMLTV guide between every guide consumer.
+"""
+import os
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+from config.app_config import AppConfig
+from app.models.database import Database, Channel, Programme
+from app.services.channels_dvr_services import ChannelsDVRClient
+from app.services.xmltv_parser import parse_xmltv_stream
+from app.services.guide_index import GuideIndex
+from app.services.guide_snapshot import LocalSnapshot, write_snapshot, update_fetched_at, open_snapshot, snapshot_identity
+from app.services.http_client import dvr_get
+from app.services.deadline import DeadlineExceeded, remaining, limit_to_deadline
+from app.services.conditional_get import conditional_headers, response_validators, is_not_modified
+from app.constants import (
+    EPG_CACHE_DURATION,
+    EPG_DOWNLOAD_SECONDS,
+    HTTP_REQUEST_TIMEOUT,
+    GUIDE_LOOKBACK_HOURS,
+    GUIDE_REFRESH_LEAD_SECONDS,
+    GUIDE_REFRESH_RETRY_SECONDS,
+    GUIDE_CHANNEL_REFRESH_DELAY,
+    GUIDE_SNAPSHOT_PATH
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows - no cross-process lock, and mapped files cannot be replaced
+    fcntl = None
+
+# Share one mapped snapshot between workers where the platform allows it
+SHARED_SNAPSHOTS = fcntl is not None
+
+# guide_meta counter bumped by invalidate() - downloads started before a bump are discarded
+GENERATION_KEY = 'guide_generation'
+
+# guide_meta counter bumped by schedule_refresh() - a guide downloaded before a bump lacks newly enabled channels
+CHANNELS_KEY = 'guide_channels_generation'
+
+logger = logging.getLogger(__name__)
+
+class GuideCache:
+    """Process-wide cache for the parsed Channels DVR XMLTV guide.
+
+    The parsed guide lives in a binary snapshot file that every worker maps
+    read-only, and a file lock makes sure only one worker downloads it. Every
+    download is also persisted to the programmes table, so a fresh install of
+    the snapshot can be rebuilt from SQLite instead of re-downloading the guide.
+    A background thread refreshes the guide shortly before it expires while
+    requests keep being served from the previous copy. Invalidation never waits
+    for a refresh in progress: it bumps a generation counter in guide_meta, and
+    a refresh that started under an older generation throws its result away.
+    Enabling channels only schedules a refresh, after a quiet period so that a
+    burst of toggles costs one download.
+    """
+
+    def __init__(self, ttl: int = EPG_CACHE_DURATION, snapshot_path: str = GUIDE_SNAPSHOT_PATH):
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.lock_path = f"{snapshot_path}.lock"
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._refresher = None
+        self._snapshot = None
+        self._last_failure = 0.0
+        # Opened on first use - constructing a Database sets up the schema, too much for every generation check
+        self._programme_model = None
+
+    @property
+    def _guide(self) -> Optional[GuideIndex]:
+        snapshot = self._snapshot
+        return snapshot.index if snapshot is not None else None
+
+    @property
+    def _fetched_at(self) -> float:
+        snapshot = self._snapshot
+        return snapshot.fetched_at if snapshot is not None else 0.0
+
+    def _sync_snapshot(self):
+        """Map the current snapshot file if another worker (or we) replaced or removed it."""
+        if not SHARED_SNAPSHOTS:
+            return
+
+        identity = snapshot_identity(self.snapshot_path)
+        current = self._snapshot
+        if identity == (current.identity if current is not None else None):
+            return
+
+        # Old mappings are released once the last reader drops its reference
+        self._snapshot = open_snapshot(self.snapshot_path) if identity else None
+        if self._snapshot is not None:
+            logger.info(f"Mapped guide snapshot {self.snapshot_path}")
+
+    @contextmanager
+    def _exclusive(self, timeout: Optional[float] = None):
+        """
+        Hold the refresh lock in this process and, where supported, across all workers.
+
+        Raises:
+            DeadlineExceeded: If the lock could not be taken within timeout
+        """
+        give_up_at = time.monotonic() + timeout if timeout is not None else None
+        if not self._refresh_lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise DeadlineExceeded("Timed out waiting for the guide refresh")
+
+        try:
+            if not SHARED_SNAPSHOTS:
+                yield
+                return
+
+            Path(self.lock_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                if give_up_at is None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                else:
+                    # flock has no timeout, so poll until another worker lets go
+                    while True:
+                        try:
+                            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            break
+                        except BlockingIOError:
+                            if time.monotonic() >= give_up_at:
+                                raise DeadlineExceeded("Timed out waiting for the guide refresh")
+                            time.sleep(0.05)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self._refresh_lock.release()
+
+    def get_epg_url(self) -> Optional[str]:
+        """Get the XMLTV URL, preferring the configured server over discovery."""
+        configured_server = AppConfig.get_setup_flag('configured_server')
+        if configured_server:
+            server_url = configured_server['url']
+        else:
+            with ChannelsDVRClient() as client:
+                server_url = client.get_server_url()
+            if not server_url:
+                return None
+
+        return f"{server_url}/devices/ANY/guide/xmltv?duration={EPG_DOWNLOAD_SECONDS}"
+
+    def _programmes(self) -> Programme:
+        """Get the long-lived guide store handle. Each call on it still opens its own connection."""
+        if self._programme_model is None:
+            self._programme_model = Programme(Database())
+        return self._programme_model
+
+    def _use_store(self, action: Callable[[Programme], Any]) -> Any:
+        """Run action on the long-lived guide store handle, reopening it if the database was replaced."""
+        try:
+            return action(self._programmes())
+        except sqlite3.OperationalError:
+            # The database file was replaced (factory reset) - open it again, which recreates the tables
+            self._programme_model = Programme(Database())
+            return action(self._programme_model)
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        """Read a guide_meta value shared by all workers."""
+        return self._use_store(lambda programme_model: programme_model.get_meta(key))
+
+    def _get_wanted_tvg_ids(self) -> Set[str]:
+        """Get the tvg_ids of enabled channels - programmes for any other channel are skipped."""
+        channels = self._use_store(lambda programme_model: Channel(programme_model.db).get_all(enabled_only=True))
+        return {ch['tvg_id'] for ch in channels if ch.get('tvg_id')}
+
+    def _get_generation(self, key: str = GENERATION_KEY) -> int:
+        """Get a generation counter shared by all workers."""
+        try:
+            return int(self._get_meta(key) or 0)
+        except ValueError:
+            return 0
+
+    def _discard_if_invalidated(self, generation: int) -> bool:
+        """Throw away a guide downloaded under an older generation. Callers must hold the exclusive lock."""
+        if self._get_generation() == generation:
+            return False
+        logger.info("Guide was invalidated during refresh, discarding the download")
+        self._drop_snapshot()
+        # Start over with the current channels and server
+        self._wake.set()
+        return True
+
+    def _drop_snapshot(self):
+        """Forget the mapped guide here and remove the snapshot file so every worker forgets it."""
+        self._snapshot = None
+        try:
+            os.remove(self.snapshot_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove guide snapshot: {e}")
+
+    def is_fresh(self) -> bool:
+        """Check whether the cached guide is still within its TTL."""
+        return self._guide is not None and (time.time() - self._fetched_at) < self.ttl
+
+    def _load_from_store(self, epg_url: str, tvg_ids: Set[str], generation: int) -> bool:
+        """Rebuild the index from the programmes table if it holds a copy of this guide."""
+        try:
+            fetched_at = float(self._get_meta('fetched_at') or 0)
+            # guide_meta holds text - compare the generation as the int _get_generation returns
+            channels_generation = int(self._get_meta('stored_channels_generation') or 0)
+        except ValueError:
+            return False
+
+        programme_model = self._programmes()
+        # A stale copy is still worth serving while the refresher catches up, an invalidated one is not
+        if programme_model.get_meta('epg_url') != epg_url or not fetched_at:
+            return False
+        if programme_model.get_meta('stored_generation') != str(generation):
+            return False
+
+        meta = {
+            'epg_url': epg_url,
+            'etag': programme_model.get_meta('etag') or None,
+            'last_modified': programme_model.get_meta('last_modified') or None,
+            'generation': generation,
+            'channels_generation': channels_generation
+        }
+        self._write_snapshot(programme_model.load_guide(tvg_ids), fetched_at, meta)
+        logger.info("Loaded XMLTV guide from database")
+        return self._snapshot is not None
+
+    def _write_snapshot(self, parsed_guide: Dict[str, Any], fetched_at: float, meta: Dict[str, Any]):
+        """Publish a parsed guide to every worker and map it here. Callers must hold the exclusive lock."""
+        if not SHARED_SNAPSHOTS:
+            self._snapshot = LocalSnapshot(parsed_guide, fetched_at, meta)
+            return
+
+        Path(self.snapshot_path).parent.mkdir(parents=True, exist_ok=True)
+        write_snapshot(self.snapshot_path, parsed_guide, fetched_at, meta)
+        self._sync_snapshot()
+
+    def _store(self, parsed_guide: Dict[str, Any], tvg_ids: Set[str], fetched_at: float, meta: Dict[str, Any]):
+        """Persist a freshly parsed guide to the programmes table."""
+        programme_model = self._programmes()
+        retain_after = int(time.time()) - GUIDE_LOOKBACK_HOURS * 3600
+        result = programme_model.sync_guide(tvg_ids, parsed_guide['channels'], parsed_guide['programmes'], retain_after)
+        programme_model.set_meta('epg_url', meta['epg_url'])
+        programme_model.set_meta('fetched_at', fetched_at)
+        programme_model.set_meta('etag', meta['etag'] or '')
+        programme_model.set_meta('last_modified', meta['last_modified'] or '')
+        programme_model.set_meta('stored_generation', meta['generation'])
+        programme_model.set_meta('stored_channels_generation', meta['channels_generation'])
+        logger.info(f"Stored XMLTV guide: {result['changed']} programmes changed, {result['removed']} removed")
+
+    def _refresh(self, timeout: int = HTTP_REQUEST_TIMEOUT, allow_store: bool = False) -> bool:
+        """
+        Download, parse and publish a new guide. Callers must hold the exclusive lock.
+
+        Args:
+            timeout: Timeout for the upstream download
+            allow_store: Try the programmes table before downloading (cold start)
+
+        Returns:
+            True if a guide was loaded
+        """
+        epg_url = self.get_epg_url()
+        if not epg_url:
+            logger.warning("No EPG URL available")
+            self._last_failure = time.time()
+            return False
+
+        try:
+            # Read before the channels, so an invalidation from here on discards this download
+            generation = self._get_generation()
+            channels_generation = self._get_generation(CHANNELS_KEY)
+            tvg_ids = self._get_wanted_tvg_ids()
+
+            # Cold start - reuse what a previous process stored
+            if allow_store and self._load_from_store(epg_url, tvg_ids, generation):
+                self._last_failure = 0.0
+                return True
+
+            # Only revalidate the copy we hold - a different URL, generation or set of channels means a different guide
+            headers = {}
+            snapshot = self._snapshot
+            if (snapshot is not None and snapshot.meta.get('epg_url') == epg_url
+                    and snapshot.meta.get('generation') == generation
+                    and snapshot.meta.get('channels_generation') == channels_generation):
+                headers = conditional_headers(snapshot.meta.get('etag'), snapshot.meta.get('last_modified'))
+
+            # Parse straight off the socket instead of buffering the whole document
+            with dvr_get(epg_url, timeout=timeout, stream=True, headers=headers) as response:
+                if is_not_modified(response):
+                    self._mark_not_modified()
+                    return True
+
+                response.raise_for_status()
+                response.raw.decode_content = True
+                # Socket timeouts bound each read, not the download - a request gives up at its deadline
+                parsed_guide = parse_xmltv_stream(limit_to_deadline(response.raw), tvg_ids)
+                etag, last_modified = response_validators(response)
+        except DeadlineExceeded:
+            # The request ran out of time, not the DVR - let the refresher finish the job
+            logger.warning("Request deadline reached fetching XMLTV guide, leaving it to the refresher")
+            self._wake.set()
+            return False
+        except Exception as e:
+            logger.error(f"Error fetching XMLTV guide: {e}")
+            self._last_failure = time.time()
+            return False
+
+        fetched_at = time.time()
+        meta = {'epg_url': epg_url, 'etag': etag, 'last_modified': last_modified, 'generation': generation,
+                'channels_generation': channels_generation}
+
+        if self._discard_if_invalidated(generation):
+            return False
+
+        try:
+            # Readers keep using the old mapping until the snapshot file is replaced
+            self._write_snapshot(parsed_guide, fetched_at, meta)
+        except Exception as e:
+            logger.error(f"Error writing guide snapshot: {e}")
+            self._last_failure = time.time()
+            return False
+
+        # invalidate() does not take the lock, so it may have removed the old file while we wrote this one
+        if self._discard_if_invalidated(generation):
+            return False
+
+        self._last_failure = 0.0
+        logger.info(f"Cached XMLTV guide from {epg_url}")
+
+        try:
+            self._store(parsed_guide, tvg_ids, fetched_at, meta)
+        except Exception as e:
+            logger.error(f"Error storing XMLTV guide: {e}")
+
+        return True
+
+    def _mark_not_modified(self):
+        """Keep the current guide after a 304 and restart its TTL without re-parsing."""
+        fetched_at = time.time()
+        self._last_failure = 0.0
+        logger.info("XMLTV guide not modified, keeping cached copy")
+
+        try:
+            # Every worker reads fetched_at straight from the mapping
+            if SHARED_SNAPSHOTS:
+                update_fetched_at(self.snapshot_path, fetched_at)
+            else:
+                self._snapshot.fetched_at = fetched_at
+            self._use_store(lambda programme_model: programme_model.set_meta('fetched_at', fetched_at))
+        except Exception as e:
+            logger.error(f"Error storing XMLTV guide: {e}")
+
+    def _seconds_until_refresh(self) -> float:
+        """Work out how long the refresher should sleep before its next attempt."""
+        # Never retry faster than the backoff after a failed attempt
+        retry_at = self._last_failure + GUIDE_REFRESH_RETRY_SECONDS
+        if self._guide is None or not self.is_fresh():
+            # Nothing usable or already stale - retry as soon as the backoff allows
+            return max(retry_at - time.time(), 0)
+        if self._snapshot.meta.get('channels_generation') != self._get_generation(CHANNELS_KEY):
+            # Channels were enabled since this copy was downloaded - refresh once the toggling settles
+            try:
+                refresh_after = float(self._get_meta('refresh_after') or 0)
+            except ValueError:
+                refresh_after = 0.0
+            return max(refresh_after - time.time(), retry_at - time.time(), 0)
+        return max(self._fetched_at + self.ttl - GUIDE_REFRESH_LEAD_SECONDS - time.time(), 0)
+
+    def _run_refresher(self):
+        """Background loop that refreshes the guide shortly before it expires."""
+        logger.info("Guide refresher started")
+        while True:
+            self._wake.wait(timeout=self._seconds_until_refresh())
+            self._wake.clear()
+
+            self._sync_snapshot()
+            if self._seconds_until_refresh() > 0:
+                continue
+
+            # Every worker's refresher gets here - whoever takes the lock first downloads
+            with self._exclusive():
+                self._sync_snapshot()
+                if self._seconds_until_refresh() <= 0:
+                    self._refresh(allow_store=self._snapshot is None)
+
+    def start_refresher(self):
+        """Start the background refresher thread once per process."""
+        if self._refresher and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._run_refresher, name='guide-refresher', daemon=True)
+            self._refresher.start()
+
+    def get_guide(self, timeout: int = HTTP_REQUEST_TIMEOUT) -> Optional[GuideIndex]:
+        """
+        Get the indexed guide without waiting on the DVR whenever any copy is available.
+
+        A stale guide is returned immediately and the background refresher is woken
+        to replace it. Only when no worker has a snapshot (and nothing is stored)
+        does a request block on the download.
+
+        Args:
+            timeout: Timeout for the upstream download if one is needed
+
+        Returns:
+            GuideIndex over the parsed guide, or None if it could not be fetched
+        """
+        self.start_refresher()
+        self._sync_snapshot()
+
+        guide = self._guide
+        if guide is not None:
+            if not self.is_fresh():
+                self._wake.set()
+            return guide
+
+        # A recent attempt already failed - leave retries to the refresher
+        if time.time() - self._last_failure < GUIDE_REFRESH_RETRY_SECONDS:
+            return None
+
+        # Concurrent cold-start callers (in any worker) wait on the lock so the guide is loaded once,
+        # but never for longer than the current request has left
+        try:
+            with self._exclusive(timeout=remaining()):
+                self._sync_snapshot()
+                # Callers queued behind a failed attempt share its outcome rather than retrying in turn
+                if self._snapshot is None and time.time() - self._last_failure >= GUIDE_REFRESH_RETRY_SECONDS:
+                    self._refresh(timeout, allow_store=True)
+                guide = self._guide
+        except DeadlineExceeded:
+            logger.warning("Request deadline reached while waiting for the guide")
+            return None
+
+        # Whatever we loaded may already be due for a refresh
+        if guide is not None and not self.is_fresh():
+            self._wake.set()
+        return guide
+
+    def schedule_refresh(self, delay: float = GUIDE_CHANNEL_REFRESH_DELAY):
+        """
+        Download the guide again soon, serving the current copy until then.
+
+        Used when channels are enabled, since their programmes are not in the
+        guide yet. Each call pushes the download back by delay, so a burst of
+        toggles costs one download. A refresh already running still publishes
+        its guide, and is followed by another one for the new channels.
+        """
+        try:
+            def schedule(programme_model):
+                programme_model.increment_meta(CHANNELS_KEY)
+                programme_model.set_meta('refresh_after', time.time() + delay)
+            self._use_store(schedule)
+        except Exception as e:
+            logger.warning(f"Could not schedule a guide refresh: {e}")
+            return
+        self.start_refresher()
+        self._wake.set()
+
+    def invalidate(self):
+        """
+        Drop the cached guide in every worker so the next request downloads a fresh copy.
+
+        Returns straight away - a refresh already running in any worker notices the
+        new generation and discards its result instead of publishing it.
+        """
+        try:
+            self._use_store(lambda programme_model: programme_model.increment_meta(GENERATION_KEY))
+        except Exception as e:
+            logger.warning(f"Could not bump the guide generation: {e}")
+        self._last_failure = 0.0
+        self._drop_snapshot()
+        # Reload in the background rather than in the next request
+        self._wake.set()
+
+# Shared instance used by all routes in this process
+guide_cache = GuideCache()
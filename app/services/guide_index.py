@@ -0,0 +1,93 @@
+"""
+Guide Index Service - Time-indexed programme lookups over the parsed guide.
+Each channel keeps its programmes as sorted arrays of epoch start/stop seconds so
+"now", "next" and range queries are binary searches instead of linear scans.
+"""
+import time
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ChannelSchedule:
+    """Programmes for a single channel, sorted by start time."""
+
+    __slots__ = ('starts', 'stops', 'records')
+
+    def __init__(self, records: Iterable[Dict[str, Any]]):
+        self.records = sorted(records, key=lambda p: p['start'])
+        self.starts = array('q', (int(p['start'].timestamp()) for p in self.records))
+        self.stops = array('q', (int(p['stop'].timestamp()) for p in self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def now(self, at: int) -> Optional[Dict[str, Any]]:
+        """Get the programme airing at the given epoch time."""
+        i = bisect_right(self.starts, at) - 1
+        if i >= 0 and self.stops[i] > at:
+            return self.records[i]
+        return None
+
+    def next(self, at: int) -> Optional[Dict[str, Any]]:
+        """Get the first programme starting after the given epoch time."""
+        i = bisect_right(self.starts, at)
+        return self.records[i] if i < len(self.records) else None
+
+    def range(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Get programmes overlapping the epoch window [start, end)."""
+        # Step back one so a programme already airing at `start` is included
+        first = max(bisect_right(self.starts, start) - 1, 0)
+        if first < len(self.stops) and self.stops[first] <= start:
+            first += 1
+        last = bisect_left(self.starts, end)
+        return self.records[first:last]
+
+class GuideIndex:
+    """Per-channel, time-indexed view of a parsed XMLTV guide."""
+
+    def __init__(self, channels: Dict[str, str], schedules: Dict[str, ChannelSchedule]):
+        self.channels = channels
+        self.schedules = schedules
+
+    @classmethod
+    def from_parsed(cls, guide: Dict[str, Any]) -> 'GuideIndex':
+        """Build an index from the output of parse_xmltv_stream."""
+        schedules = {
+            tvg_id: ChannelSchedule(programmes)
+            for tvg_id, programmes in guide['programmes'].items()
+        }
+        index = cls(guide['channels'], schedules)
+        logger.info(f"Indexed {index.programme_count} programmes for {len(schedules)} channels")
+        return index
+
+    @property
+    def programme_count(self) -> int:
+        return sum(len(schedule) for schedule in self.schedules.values())
+
+    def channel_name(self, tvg_id: str) -> str:
+        """Get the XMLTV display name for a channel."""
+        return self.channels.get(tvg_id, '')
+
+    def now(self, tvg_id: str, at: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get the programme currently airing on a channel."""
+        schedule = self.schedules.get(tvg_id)
+        if not schedule:
+            return None
+        return schedule.now(int(time.time()) if at is None else at)
+
+    def next(self, tvg_id: str, at: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Get the next programme starting on a channel."""
+        schedule = self.schedules.get(tvg_id)
+        if not schedule:
+            return None
+        return schedule.next(int(time.time()) if at is None else at)
+
+    def range(self, tvg_id: str, start: int, end: int) -> List[Dict[str, Any]]:
+        """Get the programmes on a channel overlapping the epoch window [start, end)."""
+        schedule = self.schedules.get(tvg_id)
+        if not schedule:
+            return []
+        return schedule.range(start, end)
@@ -0,0 +1,286 @@
+"""
+Guide Snapshot Service - Compact binary snapshot of the indexed guide, shared between workers.
+
+One worker writes the parsed guide to a single file and every worker maps it
+read-only, so the page cache holds one copy no matter how many gunicorn workers
+are running. Programmes are stored column-wise (epoch start/stop arrays plus
+string table indexes) and only decoded into dicts when a lookup returns them.
+
+File layout (native byte order, sections in this order):
+
+    header        magic, format version, fetched_at, channel/programme/string counts, meta length
+    meta          JSON object with epg_url, etag and last_modified
+    starts        int64 epoch seconds per programme, grouped by channel then sorted by start
+    stops         int64 epoch seconds per programme
+    fields        one uint32 string index column per field in PROGRAMME_FIELDS
+    channels      uint32 tvg_id index, display name index, first programme, programme count
+    string index  uint32 offsets into the string data (string count + 1 entries)
+    string data   UTF-8 bytes
+"""
+import os
+import json
+import mmap
+import struct
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+from app.services.guide_index import ChannelSchedule, GuideIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GIDX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('=4sIdIIII')
+FETCHED_AT = struct.Struct('=d')
+FETCHED_AT_OFFSET = 8
+CHANNEL_ENTRY_FIELDS = 4
+NO_STRING = 0xFFFFFFFF
+
+# String fields stored per programme - categories are kept as a JSON list
+PROGRAMME_FIELDS = ('title', 'sub_title', 'description', 'episode_num', 'categories', 'artwork_url')
+
+def _align(offset: int, size: int = 8) -> int:
+    return (offset + size - 1) // size * size
+
+class _StringTable:
+    """Interns strings while a snapshot is being written."""
+
+    def __init__(self):
+        self.ids = {}
+        self.data = bytearray()
+        self.offsets = [0]
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_STRING
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.offsets) - 1
+            self.data += value.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return index
+
+def write_snapshot(path: str, parsed_guide: Dict[str, Any], fetched_at: float, meta: Dict[str, Any]):
+    """
+    Write a parsed guide to a snapshot file, replacing any previous one atomically.
+
+    Args:
+        path: Snapshot file path
+        parsed_guide: Output of parse_xmltv_stream (or Programme.load_guide)
+        fetched_at: Wall-clock time the guide was downloaded
+        meta: JSON-serialisable details about the download (epg_url, etag, last_modified)
+    """
+    strings = _StringTable()
+    channel_ids = sorted(set(parsed_guide['channels']) | set(parsed_guide['programmes']))
+
+    starts = []
+    stops = []
+    columns = {field: [] for field in PROGRAMME_FIELDS}
+    channel_entries = []
+
+    for tvg_id in channel_ids:
+        programmes = sorted(parsed_guide['programmes'].get(tvg_id, []), key=lambda p: p['start'])
+        channel_entries.extend((
+            strings.add(tvg_id),
+            strings.add(parsed_guide['channels'].get(tvg_id, '')),
+            len(starts),
+            len(programmes)
+        ))
+        for programme in programmes:
+            starts.append(int(programme['start'].timestamp()))
+            stops.append(int(programme['stop'].timestamp()))
+            for field in PROGRAMME_FIELDS:
+                value = programme.get(field)
+                if field == 'categories':
+                    value = json.dumps(value) if value else None
+                columns[field].append(strings.add(value))
+
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, fetched_at, len(channel_ids), len(starts),
+                         len(strings.offsets) - 1, len(meta_bytes))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(meta_bytes)
+        f.write(b'\0' * (_align(HEADER.size + len(meta_bytes)) - HEADER.size - len(meta_bytes)))
+        f.write(struct.pack(f'={len(starts)}q', *starts))
+        f.write(struct.pack(f'={len(stops)}q', *stops))
+        for field in PROGRAMME_FIELDS:
+            f.write(struct.pack(f'={len(starts)}I', *columns[field]))
+        f.write(struct.pack(f'={len(channel_entries)}I', *channel_entries))
+        f.write(struct.pack(f'={len(strings.offsets)}I', *strings.offsets))
+        f.write(strings.data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Readers either see the old file or the complete new one, never a partial write
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote guide snapshot: {len(starts)} programmes for {len(channel_ids)} channels")
+
+def update_fetched_at(path: str, fetched_at: float):
+    """Restart the TTL of an existing snapshot in place (e.g. after a 304)."""
+    with open(path, 'r+b') as f:
+        f.seek(FETCHED_AT_OFFSET)
+        f.write(FETCHED_AT.pack(fetched_at))
+
+class _MappedRecords:
+    """Sequence of programme dicts decoded on demand from a mapped snapshot."""
+
+    __slots__ = ('data', 'tvg_id', 'first', 'count')
+
+    def __init__(self, data: '_MappedData', tvg_id: str, first: int, count: int):
+        self.data = data
+        self.tvg_id = tvg_id
+        self.first = first
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self.count))]
+        if item < 0:
+            item += self.count
+        if not 0 <= item < self.count:
+            raise IndexError(item)
+        return self.data.programme(self.tvg_id, self.first + item)
+
+class _MappedSchedule(ChannelSchedule):
+    """ChannelSchedule whose arrays are views into a mapped snapshot."""
+
+    __slots__ = ()
+
+    def __init__(self, starts, stops, records):
+        self.starts = starts
+        self.stops = stops
+        self.records = records
+
+class _MappedData:
+    """
+    The mapping of a snapshot file and the column views that decode it.
+
+    Records point at this rather than at their GuideSnapshot, so nothing refers
+    back to the snapshot and the mapping is released by reference counting as
+    soon as the snapshot and every index handed out from it are dropped.
+    """
+
+    def __init__(self, mapped: mmap.mmap, meta_offset: int, meta_length: int,
+                 channel_count: int, programme_count: int, string_count: int):
+        self.map = mapped
+        self.meta = json.loads(bytes(mapped[meta_offset:meta_offset + meta_length]))
+        offset = _align(meta_offset + meta_length)
+
+        view = memoryview(mapped)
+        self.starts = view[offset:offset + programme_count * 8].cast('q')
+        offset += programme_count * 8
+        self.stops = view[offset:offset + programme_count * 8].cast('q')
+        offset += programme_count * 8
+
+        self.columns = {}
+        for field in PROGRAMME_FIELDS:
+            self.columns[field] = view[offset:offset + programme_count * 4].cast('I')
+            offset += programme_count * 4
+
+        self.channel_table = view[offset:offset + channel_count * CHANNEL_ENTRY_FIELDS * 4].cast('I')
+        offset += channel_count * CHANNEL_ENTRY_FIELDS * 4
+        self.string_offsets = view[offset:offset + (string_count + 1) * 4].cast('I')
+        self.string_base = offset + (string_count + 1) * 4
+
+    def string(self, index: int) -> Optional[str]:
+        if index == NO_STRING:
+            return None
+        start = self.string_base + self.string_offsets[index]
+        end = self.string_base + self.string_offsets[index + 1]
+        return self.map[start:end].decode('utf-8')
+
+    def programme(self, tvg_id: str, position: int) -> Dict[str, Any]:
+        """Decode one programme into the dict shape produced by the XMLTV parser."""
+        record = {
+            'channel': tvg_id,
+            'start': datetime.fromtimestamp(self.starts[position], timezone.utc),
+            'stop': datetime.fromtimestamp(self.stops[position], timezone.utc)
+        }
+        for field in PROGRAMME_FIELDS:
+            record[field] = self.string(self.columns[field][position])
+        record['categories'] = json.loads(record['categories']) if record['categories'] else []
+        return record
+
+class GuideSnapshot:
+    """Read-only view over a snapshot file mapped into memory."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.path = path
+        self.identity = (stat.st_dev, stat.st_ino)
+
+        magic, version, _, channel_count, programme_count, string_count, meta_length = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported guide snapshot format in {path}")
+
+        self._data = data = _MappedData(mapped, HEADER.size, meta_length, channel_count, programme_count, string_count)
+        self.meta = data.meta
+
+        channels = {}
+        schedules = {}
+        for i in range(channel_count):
+            tvg_id_index, name_index, first, count = data.channel_table[i * CHANNEL_ENTRY_FIELDS:(i + 1) * CHANNEL_ENTRY_FIELDS]
+            tvg_id = data.string(tvg_id_index)
+            channels[tvg_id] = data.string(name_index) or ''
+            if count:
+                schedules[tvg_id] = _MappedSchedule(
+                    data.starts[first:first + count],
+                    data.stops[first:first + count],
+                    _MappedRecords(data, tvg_id, first, count)
+                )
+
+        self.index = GuideIndex(channels, schedules)
+
+    @property
+    def fetched_at(self) -> float:
+        """Download time - read live from the mapping so in-place updates are seen."""
+        return FETCHED_AT.unpack_from(self._data.map, FETCHED_AT_OFFSET)[0]
+
+    def string(self, index: int) -> Optional[str]:
+        return self._data.string(index)
+
+    def programme(self, tvg_id: str, position: int) -> Dict[str, Any]:
+        """Decode one programme into the dict shape produced by the XMLTV parser."""
+        return self._data.programme(tvg_id, position)
+
+class LocalSnapshot:
+    """
+    Process-local stand-in for GuideSnapshot.
+
+    Used where a mapped file cannot be replaced while it is open (Windows), so
+    each process keeps its own index in memory instead.
+    """
+
+    identity = None
+
+    def __init__(self, parsed_guide: Dict[str, Any], fetched_at: float, meta: Dict[str, Any]):
+        self.index = GuideIndex.from_parsed(parsed_guide)
+        self.fetched_at = fetched_at
+        self.meta = meta
+
+def open_snapshot(path: str) -> Optional[GuideSnapshot]:
+    """Map a snapshot file, returning None if it does not exist or cannot be read."""
+    try:
+        return GuideSnapshot(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Ignoring unreadable guide snapshot {path}: {e}")
+        return None
+
+def snapshot_identity(path: str) -> Optional[Tuple[int, int]]:
+    """Get the (device, inode) pair of the current snapshot file - it changes on every rewrite."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino)
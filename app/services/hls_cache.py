@@ -0,0 +1,235 @@
+"""
+HLS Cache Service - Short-lived playlist cache and byte-budgeted segment cache for the stream proxy.
+
+Every hls.js client re-requests the live media playlist about once per
+target duration, and fetches each new segment. Playlists are cached for
+half their target duration, so clients polling together cost one upstream
+request. Segments are cached by URI in memory with LRU eviction under a
+byte budget. When a spill directory is configured, segments evicted from
+memory move to disk first, under a budget of their own.
+"""
+import os
+import re
+import atexit
+import shutil
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.constants import (
+    PLAYLIST_CACHE_DEFAULT_TTL,
+    SEGMENT_CACHE_MAX_BYTES,
+    SEGMENT_CACHE_SPILL_DIR,
+    SEGMENT_CACHE_SPILL_MAX_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+_TARGET_DURATION = re.compile(r'^#EXT-X-TARGETDURATION:\s*(\d+(?:\.\d+)?)', re.MULTILINE)
+
+def playlist_ttl(body: bytes) -> float:
+    """How long a playlist stays fresh - half its target duration, so clients never miss a segment."""
+    match = _TARGET_DURATION.search(body.decode('utf-8', 'replace'))
+    if not match:
+        return PLAYLIST_CACHE_DEFAULT_TTL
+    return float(match.group(1)) / 2
+
+class PlaylistCache:
+    """Playlists by upstream URL, each kept for half its target duration."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, str, bytes, str]] = {}
+
+    def get(self, url: str) -> Optional[Tuple[str, bytes, str]]:
+        """Get a fresh (content type, body, served-from URL), or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[url]
+                return None
+            return entry[1:]
+
+    def put(self, url: str, content_type: str, body: bytes, served_from: str):
+        now = time.monotonic()
+        with self._lock:
+            # Expired playlists of channels nobody watches any more would otherwise linger
+            for key in [key for key, entry in self._entries.items() if entry[0] <= now]:
+                del self._entries[key]
+            self._entries[url] = (now + playlist_ttl(body), content_type, body, served_from)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SegmentCache:
+    """
+    Segments by upstream URL, least recently used evicted first.
+
+    Memory holds up to max_bytes. With a spill directory, segments evicted
+    from memory are written there and kept up to spill_max_bytes. Without
+    one, evicted segments are dropped. Each process spills into a directory
+    named after its PID, removed when the process exits.
+    """
+
+    def __init__(self, max_bytes: int = SEGMENT_CACHE_MAX_BYTES, spill_dir: Optional[str] = SEGMENT_CACHE_SPILL_DIR,
+                 spill_max_bytes: int = SEGMENT_CACHE_SPILL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._lock = threading.Lock()
+        self._memory: 'OrderedDict[str, Tuple[str, bytes]]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: 'OrderedDict[str, Tuple[str, str, int]]' = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._pid = None
+
+    def get(self, url: str) -> Optional[Tuple[str, bytes]]:
+        """Get a cached (content type, body), or None."""
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is not None:
+                self._memory.move_to_end(url)
+                self.hits += 1
+                return entry
+            spilled = self._disk.get(url)
+            if spilled is None:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(url)
+
+        content_type, path, size = spilled
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except OSError as e:
+            logger.warning(f"Could not read spilled segment {path}: {e}")
+            with self._lock:
+                if self._disk.pop(url, None) is not None:
+                    self._disk_bytes -= size
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return content_type, body
+
+    def put(self, url: str, content_type: str, body: bytes):
+        """Cache a freshly downloaded segment, evicting the least recently used ones beyond the budget."""
+        with self._lock:
+            if len(body) > self.max_bytes:
+                return
+            previous = self._memory.pop(url, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous[1])
+            self._memory[url] = (content_type, body)
+            self._memory_bytes += len(body)
+
+            evicted = []
+            while self._memory_bytes > self.max_bytes:
+                key, entry = self._memory.popitem(last=False)
+                self._memory_bytes -= len(entry[1])
+                evicted.append((key, entry))
+
+        if self.spill_dir:
+            for key, (evicted_type, evicted_body) in evicted:
+                self._spill(key, evicted_type, evicted_body)
+
+    def _spill(self, url: str, content_type: str, body: bytes):
+        """Move a segment evicted from memory to the spill directory."""
+        # Per process, so processes never delete each other's files
+        directory = os.path.join(self.spill_dir, str(os.getpid()))
+        path = os.path.join(directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.seg')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not spill segment to {path}: {e}")
+            return
+
+        removed = []
+        with self._lock:
+            previous = self._disk.pop(url, None)
+            if previous is not None:
+                self._disk_bytes -= previous[2]
+            self._disk[url] = (content_type, path, len(body))
+            self._disk_bytes += len(body)
+            while self._disk_bytes > self.spill_max_bytes and self._disk:
+                _, (_, old_path, size) = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                removed.append(old_path)
+
+        for old_path in removed:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            paths = [path for _, path, _ in self._disk.values()]
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = 0
+            self._disk_bytes = 0
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def start(self):
+        """Remove the spill directories of processes that are gone, and this process's own when it exits."""
+        pid = os.getpid()
+        if not self.spill_dir or self._pid == pid:
+            return
+        self._pid = pid
+        atexit.register(shutil.rmtree, os.path.join(self.spill_dir, str(pid)), ignore_errors=True)
+
+        try:
+            names = os.listdir(self.spill_dir)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not list segment spill directory {self.spill_dir}: {e}")
+            return
+
+        for name in names:
+            if not name.isdigit() or int(name) == pid:
+                continue
+            try:
+                os.kill(int(name), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except OSError:
+                # Exists but belongs to another user
+                continue
+            logger.info(f"Removing segment spill directory of exited process {name}")
+            shutil.rmtree(os.path.join(self.spill_dir, name), ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'memory_segments': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'max_bytes': self.max_bytes,
+                'disk_segments': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# Shared by every channel session in this process
+playlist_cache = PlaylistCache()
+segment_cache = SegmentCache()
@@ -0,0 +1,129 @@
+"""
+HLS Proxy Service - Rewrites HLS playlists so every request of a stream goes through the app.
+
+The DVR's playlists refer to variant playlists, segments, keys and init
+sections by relative (or absolute) URIs. Those URIs are rewritten to
+/proxy/hls/<channel_id>/<resource>, where resource is the upstream path and
+query encoded URL-safe. Only resources on the channel's own DVR host are
+rewritten and later resolved, so the route cannot be used to reach other hosts.
+The headers and DVR error mapping of proxied responses live here too.
+"""
+import re
+import base64
+import logging
+from typing import Optional
+from urllib.parse import urlparse, urljoin, parse_qs, urlencode
+from requests import HTTPError
+from app.constants import CHANNELS_DVR_DEFAULT_PORT
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_CONTENT_TYPE = 'application/vnd.apple.mpegurl'
+
+# Headers for every proxied stream response
+STREAM_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+# Playlists change on every segment, so they must never be cached
+NO_CACHE_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0'
+}
+
+PLAYLIST_HEADERS = {**STREAM_HEADERS, **NO_CACHE_HEADERS}
+
+# URI="..." attributes of EXT-X-KEY, EXT-X-MAP, EXT-X-MEDIA, EXT-X-I-FRAME-STREAM-INF and friends
+_URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+
+def get_upstream_url(stream_url: str) -> str:
+    """
+    Get the HLS URL to request from the DVR for a channel's stream URL.
+
+    HDHomeRun and Channels DVR streams are transcoded to h264 for better browser
+    compatibility (AAC audio does not work well with codec=copy), others are copied.
+    """
+    if 'hdhomerun' in stream_url.lower() or str(CHANNELS_DVR_DEFAULT_PORT) in stream_url:
+        codec = 'h264'
+        logger.debug("Stream detected, using h264 codec for better browser compatibility")
+    else:
+        codec = 'copy'
+
+    if '?' not in stream_url:
+        return f"{stream_url}?format=hls&codec={codec}"
+
+    parsed = urlparse(stream_url)
+    params = parse_qs(parsed.query)
+    params['format'] = ['hls']
+    params['codec'] = [codec]
+    return f"{stream_url.split('?')[0]}?{urlencode(params, doseq=True)}"
+
+def encode_resource(url: str) -> str:
+    """Encode the path and query of an upstream URL for use as one path segment."""
+    parsed = urlparse(url)
+    resource = parsed.path + (f"?{parsed.query}" if parsed.query else '')
+    return base64.urlsafe_b64encode(resource.encode('utf-8')).decode('ascii').rstrip('=')
+
+def resolve_resource(stream_url: str, token: str) -> str:
+    """
+    Turn an encoded resource back into a URL on the channel's DVR host.
+
+    Raises:
+        ValueError: If the token is not a resource produced by encode_resource
+    """
+    try:
+        resource = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid stream resource: {token}") from e
+    if not resource.startswith('/'):
+        raise ValueError(f"Invalid stream resource: {token}")
+
+    parsed = urlparse(stream_url)
+    return f"{parsed.scheme}://{parsed.netloc}{resource}"
+
+def is_playlist(url: str, content_type: str) -> bool:
+    """Whether an upstream response is an HLS playlist rather than media."""
+    content_type = (content_type or '').lower()
+    return 'mpegurl' in content_type or urlparse(url).path.endswith('.m3u8')
+
+def rewrite_playlist(body: str, playlist_url: str, channel_id: int, viewer_id: Optional[str] = None) -> str:
+    """
+    Point every URI in a master or media playlist at the app's HLS proxy route.
+
+    Args:
+        body: Playlist text as received from the DVR
+        playlist_url: URL the playlist was fetched from, that relative URIs resolve against
+        channel_id: Channel the playlist belongs to
+        viewer_id: Viewer the playlist is for, carried in every URI so the viewer's requests can be counted
+
+    Returns:
+        The playlist with same-host URIs replaced by /proxy/hls/ paths
+    """
+    host = urlparse(playlist_url).netloc
+    query = f"?viewer={viewer_id}" if viewer_id else ''
+
+    def proxied(uri: str) -> str:
+        absolute = urljoin(playlist_url, uri.strip())
+        if urlparse(absolute).netloc != host:
+            return uri
+        return f"/proxy/hls/{channel_id}/{encode_resource(absolute)}{query}"
+
+    lines = []
+    for line in body.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith('#'):
+            lines.append(_URI_ATTRIBUTE.sub(lambda m: f'URI="{proxied(m.group(1))}"', line))
+        else:
+            lines.append(proxied(stripped))
+    return '\n'.join(lines) + '\n'
+
+def upstream_error_status(error: HTTPError) -> int:
+    """Get the status to pass on to the player for an error from the DVR, so hls.js can retry or give up."""
+    status = error.response.status_code if error.response is not None else 502
+    logger.warning(f"Channels DVR returned {status} for {error.request.url if error.request else 'stream'}")
+    return status
@@ -0,0 +1,71 @@
+"""
+HTTP Client Service - Shared keep-alive connection pool for all Channels DVR traffic.
+"""
+import os
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from app.constants import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+from app.services.circuit_breaker import get_breaker
+from app.services.deadline import DeadlineExceeded, clamp_timeout
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def _create_session() -> requests.Session:
+    """Build a session whose adapters keep connections to each host alive between requests."""
+    session = requests.Session()
+    # Beyond pool_maxsize extra connections are still opened, just not kept alive afterwards
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    logger.info(f"Created HTTP session pool ({HTTP_POOL_CONNECTIONS} hosts, {HTTP_POOL_MAXSIZE} connections per host)")
+    return session
+
+def get_session() -> requests.Session:
+    """
+    Get the process-wide HTTP session.
+    
+    The session is thread-safe for making requests and is recreated after a fork,
+    so gunicorn workers never share sockets with their parent.
+    """
+    global _session, _session_pid
+    
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _create_session()
+                _session_pid = pid
+    return _session
+
+def dvr_get(url: str, **kwargs) -> requests.Response:
+    """
+    GET a DVR URL through the shared session and the host's circuit breaker.
+    
+    Accepts the same keyword arguments as requests.get. The timeout is cut down
+    to whatever is left of the current request's deadline.
+    
+    Raises:
+        CircuitOpenError: If the host is known to be unreachable - no request is made
+        DeadlineExceeded: If the request's time budget ran out
+        requests.RequestException: If the request fails
+    """
+    timeout = kwargs.get('timeout')
+    budget = clamp_timeout(timeout)
+    kwargs['timeout'] = budget
+    
+    def get():
+        try:
+            return get_session().get(url, **kwargs)
+        except requests.Timeout as e:
+            # Running out of our own budget says nothing about the host
+            if budget is not None and (timeout is None or budget < timeout):
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for {url}") from e
+            raise
+    
+    return get_breaker(url).call(get)
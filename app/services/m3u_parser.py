@@ -3,14 +3,26 @@ M3U Parser Service - Adapted from test_guide.py
 Handles parsing M3U files and syncing channels with the database.
 """
 import re
-import requests
 import logging
+import threading
 from typing import Dict, List, Optional, Any
 from app.services.channels_dvr_services import ChannelsDVRClient
+from app.services.conditional_get import conditional_headers, response_validators, is_not_modified
+from app.services.single_flight import upstream_calls
+from app.services.http_client import dvr_get
 from app.models.database import Database, Channel
 
 logger = logging.getLogger(__name__)
 
+# Validators and parsed channels from the last M3U download, shared by every parser instance
+_m3u_cache = {
+    'url': None,
+    'etag': None,
+    'last_modified': None,
+    'channels': None
+}
+_m3u_cache_lock = threading.Lock()
+
 class M3UParser:
     """M3U parser for Channels DVR streams."""
     
@@ -18,36 +30,75 @@ class M3UParser:
         self.db = db
         self.channel_model = Channel(db)
     
-    def fetch_m3u_content(self, timeout: int = 30) -> Optional[str]:
-        """Fetch M3U content from Channels DVR server."""
+    def get_m3u_url(self, timeout: int = 30) -> Optional[str]:
+        """Get the M3U URL, preferring the configured server over discovery."""
+        from config.app_config import AppConfig
+        configured_server = AppConfig.get_setup_flag('configured_server')
+        
+        if configured_server:
+            # Use configured server directly
+            m3u_url = f"{configured_server['url']}/devices/ANY/channels.m3u?format=hls&codec=copy"
+            logger.info(f"Using configured server for M3U: {m3u_url}")
+            return m3u_url
+        
+        # Fallback to discovery
+        with ChannelsDVRClient(timeout=timeout) as client:
+            m3u_url = client.get_m3u_url()
+            if not m3u_url:
+                logger.error("Failed to get M3U URL from Channels DVR")
+            return m3u_url
+    
+    def fetch_channels(self, timeout: int = 30) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch and parse the M3U channel list from Channels DVR server.
+        
+        Sends the validators from the previous download so an unchanged playlist
+        comes back as 304 and the previously parsed channels are reused. Concurrent
+        callers share one download.
+        
+        Returns:
+            List of parsed channels, or None if the playlist could not be fetched
+        """
         try:
-            # Try to use configured server first
-            from config.app_config import AppConfig
-            configured_server = AppConfig.get_setup_flag('configured_server')
+            m3u_url = self.get_m3u_url(timeout)
+            if not m3u_url:
+                return None
             
-            if configured_server:
-                # Use configured server directly
-                m3u_url = f"{configured_server['url']}/devices/ANY/channels.m3u?format=hls&codec=copy"
-                logger.info(f"Using configured server for M3U: {m3u_url}")
-                response = requests.get(m3u_url, timeout=timeout)
-                response.raise_for_status()
-                return response.text
-            else:
-                # Fallback to discovery
-                with ChannelsDVRClient(timeout=timeout) as client:
-                    m3u_url = client.get_m3u_url()
-                    if not m3u_url:
-                        logger.error("Failed to get M3U URL from Channels DVR")
-                        return None
-                    
-                    response = requests.get(m3u_url, timeout=timeout)
-                    response.raise_for_status()
-                    return response.text
+            channels = upstream_calls.do(('GET', m3u_url), lambda: self._download_channels(m3u_url, timeout))
+            
+            # Callers may modify their channels, so each one gets its own copies
+            return [dict(channel) for channel in channels]
                 
         except Exception as e:
             logger.error(f"Error fetching M3U content: {e}")
             return None
     
+    def _download_channels(self, m3u_url: str, timeout: int) -> List[Dict[str, Any]]:
+        """Download and parse the playlist, revalidating the cached copy when there is one."""
+        with _m3u_cache_lock:
+            cached = dict(_m3u_cache) if _m3u_cache['url'] == m3u_url and _m3u_cache['channels'] is not None else None
+        
+        headers = conditional_headers(cached['etag'], cached['last_modified']) if cached else {}
+        response = dvr_get(m3u_url, timeout=timeout, headers=headers)
+        
+        if cached and is_not_modified(response):
+            logger.info("M3U playlist not modified, reusing parsed channels")
+            return cached['channels']
+        
+        response.raise_for_status()
+        channels = self.parse_m3u_content(response.text)
+        etag, last_modified = response_validators(response)
+        
+        with _m3u_cache_lock:
+            _m3u_cache.update({
+                'url': m3u_url,
+                'etag': etag,
+                'last_modified': last_modified,
+                'channels': [dict(channel) for channel in channels]
+            })
+        
+        return channels
+    
     def parse_m3u_content(self, m3u_content: str) -> List[Dict[str, Any]]:
         """Parse M3U content and extract channel information."""
         channels = []
@@ -135,9 +186,9 @@ class M3UParser:
         Returns:
             Dictionary with sync results
         """
-        # Fetch M3U content
-        m3u_content = self.fetch_m3u_content()
-        if not m3u_content:
+        # Fetch and parse M3U content
+        parsed_channels = self.fetch_channels()
+        if parsed_channels is None:
             return {
                 'success': False,
                 'error': 'Failed to fetch M3U content from Channels DVR server',
@@ -146,8 +197,6 @@ class M3UParser:
                 'channels_updated': 0
             }
         
-        # Parse M3U content
-        parsed_channels = self.parse_m3u_content(m3u_content)
         if not parsed_channels:
             return {
                 'success': False,
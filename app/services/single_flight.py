@@ -0,0 +1,82 @@
+"""
+Single Flight Service - Coalesces concurrent identical upstream calls into one.
+"""
+import threading
+import logging
+from typing import Callable, Dict, Hashable, TypeVar
+from app.services.deadline import DeadlineExceeded, remaining
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class _Call:
+    """An upstream call in progress and, once finished, its outcome."""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+
+    Callers that arrive while a call for the same key is in flight wait for it
+    and share its result (or exception) instead of starting their own. Nothing
+    is cached afterwards - the next caller starts a new call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """
+        Run fn for key, or wait for the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls, e.g. the upstream URL
+            fn: The upstream call - its timeout applies to every waiter
+
+        Returns:
+            The result of the single call made for this key
+
+        Raises:
+            DeadlineExceeded: If the current request runs out of time while waiting
+            Whatever the shared call raised
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            if not call.done.wait(timeout=remaining()):
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.debug(f"Shared upstream call {key} with {call.waiters} waiting callers")
+            call.done.set()
+
+        return call.result
+
+# Shared by every upstream DVR call in this process
+upstream_calls = SingleFlight()
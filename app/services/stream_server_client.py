@@ -0,0 +1,83 @@
+"""
+Stream Server Client - Lets the web UI reach the stream server it sends players to.
+
+Streams are only served by the stream server (see app.stream_server). Players
+load them from its own port, and fall back to the web UI's /proxy/ routes, which
+relay to it here, when that port is not reachable. A stream server that is down
+leaves every player without playback, so the web UI checks it at startup and
+says so in the log.
+"""
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+import requests
+from app.constants import (
+    QUICK_CHECK_TIMEOUT,
+    HTTP_REQUEST_TIMEOUT,
+    STREAM_SERVER_PORT,
+    STREAM_SERVER_URL,
+    STREAM_SERVER_INTERNAL_URL,
+    STREAM_SERVER_CHECK_ATTEMPTS,
+    STREAM_SERVER_CHECK_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+def get(path: str, timeout: float = QUICK_CHECK_TIMEOUT) -> Dict[str, Any]:
+    """
+    Get a JSON resource from the stream server over its internal address.
+
+    Raises:
+        requests.RequestException: If the stream server could not be reached or returned an error
+    """
+    response = requests.get(f"{STREAM_SERVER_INTERNAL_URL.rstrip('/')}{path}", timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def relay(method: str, path: str, body: Optional[bytes] = None) -> requests.Response:
+    """
+    Send a player's request on to the stream server over its internal address.
+
+    The response is streamed - the caller relays its body and closes it.
+
+    Raises:
+        requests.RequestException: If the stream server could not be reached
+    """
+    return requests.request(method, f"{STREAM_SERVER_INTERNAL_URL.rstrip('/')}{path}", data=body,
+                            stream=True, allow_redirects=False, timeout=HTTP_REQUEST_TIMEOUT)
+
+def check_reachable() -> Optional[str]:
+    """Check that the stream server answers. Returns the error, or None if it is up."""
+    try:
+        get('/proxy/sessions')
+        return None
+    except (requests.RequestException, ValueError) as e:
+        return str(e)
+
+def _run_startup_check(attempts: int, interval: float):
+    error = None
+    for attempt in range(attempts):
+        # Started alongside the web UI, so give it a moment to come up
+        if attempt:
+            time.sleep(interval)
+        error = check_reachable()
+        if error is None:
+            logger.info(f"Stream server is reachable at {STREAM_SERVER_INTERNAL_URL}")
+            return
+
+    players_use = STREAM_SERVER_URL or f"port {STREAM_SERVER_PORT} of the web UI's host"
+    logger.error(
+        f"Stream server is not reachable at {STREAM_SERVER_INTERNAL_URL} ({error}). "
+        f"Live TV will not play: streams are only served by the stream server, which players load them from "
+        f"({players_use}) or through this web UI. "
+        f"Run stream_server.py (serve.py runs both), or set STREAM_SERVER_INTERNAL_URL to where it runs."
+    )
+
+def start_startup_check(attempts: int = STREAM_SERVER_CHECK_ATTEMPTS,
+                        interval: float = STREAM_SERVER_CHECK_INTERVAL) -> threading.Thread:
+    """Check the stream server in the background, logging an error if it never answers."""
+    thread = threading.Thread(target=_run_startup_check, args=(attempts, interval),
+                              name='stream-server-check', daemon=True)
+    thread.start()
+    return thread
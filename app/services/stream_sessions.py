@@ -0,0 +1,331 @@
+"""
+Stream Session Service - One shared upstream per channel, however many people watch it.
+
+The first viewer of a channel opens a session that fetches the channel's
+top-level playlist from the DVR once. Later viewers get the same playlist,
+so they all follow the same DVR stream instead of each using a tuner or
+transcoder. Media playlists and segments go through the process-wide HLS
+caches, so each one is downloaded once and then served to every viewer.
+Viewers are counted by the id carried in their proxied URIs. A viewer
+leaves by telling the proxy, or counts as gone once it stops requesting.
+Raw streams relayed to a viewer are closed once they go idle. A reaper
+thread closes each session within seconds of its last viewer leaving.
+Sessions can also be listed and killed through the sessions API.
+Sessions live in memory, so every stream is served by one process - the
+stream server - for its viewers to share them.
+"""
+import os
+import re
+import secrets
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.services.http_client import dvr_get
+from app.services.single_flight import upstream_calls
+from app.services.hls_proxy import is_playlist
+from app.services.hls_cache import playlist_cache, segment_cache
+from app.constants import HTTP_REQUEST_TIMEOUT, STREAM_VIEWER_TIMEOUT, STREAM_IDLE_TIMEOUT, STREAM_REAP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_VIEWER_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+class ChannelSession:
+    """The shared upstream stream of one channel and the viewers reading it."""
+
+    def __init__(self, channel_id: int, upstream_url: str):
+        self.channel_id = channel_id
+        self.upstream_url = upstream_url
+        self.created_at = time.time()
+        self._lock = threading.Lock()
+        self._master: Optional[Tuple[str, str]] = None
+        self._relayed = False
+        self._viewers: Dict[str, float] = {}
+        self._relays: List['Relay'] = []
+
+    def get_master(self) -> Optional[Tuple[str, str]]:
+        """Get the shared top-level playlist and the URL it was served from, or None until it is fetched."""
+        with self._lock:
+            return self._master
+
+    def set_master(self, body: str, playlist_url: str) -> Tuple[str, str]:
+        """Share the top-level playlist fetched by the session's first viewer."""
+        with self._lock:
+            self._master = (body, playlist_url)
+            return self._master
+
+    def is_relayed(self) -> bool:
+        """Whether the DVR answered with a raw stream, which every viewer then reads on its own."""
+        with self._lock:
+            return self._relayed
+
+    def mark_relayed(self):
+        """Remember that the channel is a raw stream, so later viewers relay it without checking again."""
+        with self._lock:
+            self._relayed = True
+
+    def fetch(self, url: str) -> Tuple[str, bytes, str]:
+        """
+        Get a playlist, segment or key of this stream.
+
+        Segments and keys come from the segment cache when a viewer already
+        fetched them, media playlists from the playlist cache while they are
+        fresh. Concurrent fetches of the same URL share one request.
+
+        Returns:
+            (content type, body, URL the body was served from)
+
+        Raises:
+            requests.RequestException: If the DVR request fails
+        """
+        cached = playlist_cache.get(url)
+        if cached is not None:
+            return cached
+        # Playlists never go in the segment cache, so looking there would only count a miss
+        if not is_playlist(url, ''):
+            cached = segment_cache.get(url)
+            if cached is not None:
+                return cached[0], cached[1], url
+
+        def download():
+            r = dvr_get(url, timeout=HTTP_REQUEST_TIMEOUT)
+            r.raise_for_status()
+            content_type, body, served_from = r.headers.get('content-type', ''), r.content, r.url or url
+            # Cached by the one call that downloaded it - fetches that waited on it just share the result
+            if is_playlist(url, content_type):
+                playlist_cache.put(url, content_type, body, served_from)
+            else:
+                segment_cache.put(url, content_type, body)
+            return content_type, body, served_from
+
+        return upstream_calls.do(url, download)
+
+    def touch(self, viewer_id: str):
+        """Record that a viewer is still watching."""
+        with self._lock:
+            self._viewers[viewer_id] = time.monotonic()
+
+    def leave(self, viewer_id: str) -> int:
+        """Forget a viewer that said it stopped watching, closing its relays, and return how many are left."""
+        with self._lock:
+            self._viewers.pop(viewer_id, None)
+            relays = [relay for relay in self._relays if relay.viewer_id == viewer_id]
+            remaining = len(self._viewers)
+        for relay in relays:
+            relay.close()
+        return remaining
+
+    def open_relay(self, viewer_id: str, close_upstream: Callable[[], None]) -> 'Relay':
+        """Track a raw stream relayed to one viewer, so it can be reaped or killed."""
+        relay = Relay(viewer_id, close_upstream)
+        with self._lock:
+            self._relays.append(relay)
+        return relay
+
+    def end_relay(self, relay: 'Relay'):
+        """Stop tracking a relay that finished."""
+        with self._lock:
+            if relay in self._relays:
+                self._relays.remove(relay)
+
+    def prune(self, now: float) -> int:
+        """Close idle relays, forget viewers that stopped requesting and return how many are left."""
+        with self._lock:
+            idle = [relay for relay in self._relays if now - relay.last_activity > STREAM_IDLE_TIMEOUT]
+        for relay in idle:
+            logger.info(f"Closing idle stream relay for channel {self.channel_id}")
+            relay.close()
+
+        with self._lock:
+            # A viewer receiving a relayed stream makes no further requests, but is still watching
+            relaying = {relay.viewer_id for relay in self._relays if not relay.closed}
+            for viewer_id, last_seen in list(self._viewers.items()):
+                if now - last_seen > STREAM_VIEWER_TIMEOUT and viewer_id not in relaying:
+                    del self._viewers[viewer_id]
+            return len(self._viewers)
+
+    def get_viewer_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._viewers)
+
+    def close(self):
+        """Close every relay and drop the shared playlist. The next viewer starts a new upstream stream."""
+        with self._lock:
+            relays = list(self._relays)
+            self._master = None
+            self._relayed = False
+            self._viewers.clear()
+        for relay in relays:
+            relay.close()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Describe the session for the sessions API."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'channel_id': self.channel_id,
+                'upstream_url': self.upstream_url,
+                'created_at': self.created_at,
+                'viewers': len(self._viewers),
+                'seconds_since_request': round(now - max(self._viewers.values()), 1) if self._viewers else None,
+                'playlist_shared': self._master is not None,
+                'relays': [relay.get_status(now) for relay in self._relays]
+            }
+
+class Relay:
+    """A raw stream being relayed from the DVR to one viewer."""
+
+    def __init__(self, viewer_id: str, close_upstream: Callable[[], None]):
+        self.viewer_id = viewer_id
+        self.started_at = time.time()
+        self.last_activity = time.monotonic()
+        self.bytes_sent = 0
+        self.closed = False
+        self._close_upstream = close_upstream
+
+    def record(self, size: int):
+        """Record a chunk passed on to the viewer."""
+        self.last_activity = time.monotonic()
+        self.bytes_sent += size
+
+    def close(self):
+        """Close the upstream connection, which also ends the relay loop waiting on it."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._close_upstream()
+        except Exception as e:
+            logger.warning(f"Error closing upstream stream: {e}")
+
+    def get_status(self, now: float) -> Dict[str, Any]:
+        return {
+            'viewer_id': self.viewer_id,
+            'started_at': self.started_at,
+            'idle_seconds': round(now - self.last_activity, 1),
+            'bytes_sent': self.bytes_sent
+        }
+
+class StreamKilled(Exception):
+    """Raised when a viewer whose session was killed keeps requesting it."""
+
+class StreamSessionManager:
+    """Keeps one ChannelSession per watched channel and reaps those nobody watches any more."""
+
+    def __init__(self, reap_interval: int = STREAM_REAP_INTERVAL):
+        self.reap_interval = reap_interval
+        self._lock = threading.Lock()
+        self._sessions: Dict[int, ChannelSession] = {}
+        # (channel id, viewer id) -> when it was killed, so the viewer's player does not just reopen it
+        self._killed: Dict[Tuple[int, str], float] = {}
+        self._thread = None
+        self._pid = None
+
+    def join(self, channel_id: int, upstream_url: str, viewer_id: Optional[str] = None) -> Tuple[ChannelSession, str]:
+        """
+        Get the channel's session, opening one if nobody is watching it, and register the viewer.
+
+        Args:
+            channel_id: Channel being watched
+            upstream_url: The channel's HLS URL on the DVR
+            viewer_id: The viewer's id from the player or a proxied URI, or None for a new viewer
+
+        Returns:
+            (session, viewer id)
+
+        Raises:
+            StreamKilled: If this viewer's session for the channel was killed
+        """
+        self.start()
+        if not viewer_id or not _VIEWER_ID.match(viewer_id):
+            viewer_id = secrets.token_hex(8)
+
+        with self._lock:
+            if (channel_id, viewer_id) in self._killed:
+                raise StreamKilled(f"Stream for channel {channel_id} was closed")
+            session = self._sessions.get(channel_id)
+            if session is not None and session.upstream_url != upstream_url:
+                # The channel's stream URL changed (e.g. after a sync)
+                session.close()
+                session = None
+            if session is None:
+                session = self._sessions[channel_id] = ChannelSession(channel_id, upstream_url)
+                logger.info(f"Opened upstream stream for channel {channel_id}")
+            session.touch(viewer_id)
+
+        return session, viewer_id
+
+    def leave(self, channel_id: int, viewer_id: str):
+        """Remove a viewer that stopped watching, closing the session right away if it was the last."""
+        with self._lock:
+            session = self._sessions.get(channel_id)
+            if session is None:
+                return
+            if session.leave(viewer_id) == 0:
+                session.close()
+                del self._sessions[channel_id]
+                logger.info(f"Closed upstream stream for channel {channel_id}, last viewer left")
+
+    def kill(self, channel_id: int) -> bool:
+        """
+        Close a channel's session and refuse its current viewers' further requests.
+
+        Returns:
+            False if nobody was watching the channel
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(channel_id, None)
+            if session is None:
+                return False
+            for viewer_id in session.get_viewer_ids():
+                self._killed[(channel_id, viewer_id)] = now
+        session.close()
+        logger.info(f"Killed upstream stream for channel {channel_id}")
+        return True
+
+    def prune(self):
+        """Close the sessions whose last viewer has left."""
+        now = time.monotonic()
+        with self._lock:
+            for channel_id, session in list(self._sessions.items()):
+                if session.prune(now) == 0:
+                    session.close()
+                    del self._sessions[channel_id]
+                    logger.info(f"Closed upstream stream for channel {channel_id}, last viewer left")
+            # Long enough for a killed viewer's player to give up retrying
+            for key, killed_at in list(self._killed.items()):
+                if now - killed_at > STREAM_VIEWER_TIMEOUT * 4:
+                    del self._killed[key]
+
+    def get_sessions(self) -> List[Dict[str, Any]]:
+        """Describe every open session in this process."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.get_status() for session in sessions]
+
+    def _run(self):
+        """Background loop that reaps sessions and relays within seconds of their viewers leaving."""
+        logger.info("Stream session reaper started")
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error(f"Error reaping stream sessions: {e}")
+
+    def start(self):
+        """Start the reaper thread once per process."""
+        pid = os.getpid()
+        if self._pid == pid and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='stream-reaper', daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+# Shared by all stream routes in this process
+stream_sessions = StreamSessionManager()
@@ -0,0 +1,116 @@
+"""
+XMLTV Parser Service - Incremental parsing of Channels DVR guide data.
+Elements are cleared as soon as they are read so memory stays flat regardless of guide size.
+"""
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+def parse_xmltv_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse an XMLTV timestamp (e.g. "20231215120000 +0000") into an aware UTC datetime."""
+    if not value:
+        return None
+
+    value = value.strip()
+    try:
+        parsed = datetime.strptime(value, '%Y%m%d%H%M%S %z')
+    except ValueError:
+        try:
+            # No offset given - XMLTV times default to UTC
+            parsed = datetime.strptime(value[:14], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+
+    return parsed.astimezone(timezone.utc)
+
+def _child_text(elem: ET.Element, tag: str) -> Optional[str]:
+    """Get the text of the first child with the given tag."""
+    child = elem.find(tag)
+    return child.text if child is not None else None
+
+def _parse_programme(elem: ET.Element, start: datetime, stop: datetime) -> Dict[str, Any]:
+    """Extract the fields we use from a <programme> element."""
+    # Prefer <icon src>, then fall back to <image>
+    artwork_url = None
+    icon_elem = elem.find('icon')
+    if icon_elem is not None:
+        artwork_url = icon_elem.get('src')
+    if not artwork_url:
+        image_elem = elem.find('image')
+        if image_elem is not None:
+            artwork_url = image_elem.text or image_elem.get('src')
+
+    return {
+        'channel': elem.get('channel'),
+        'start': start,
+        'stop': stop,
+        'title': _child_text(elem, 'title'),
+        'sub_title': _child_text(elem, 'sub-title'),
+        'description': _child_text(elem, 'desc'),
+        'episode_num': _child_text(elem, 'episode-num'),
+        'categories': [c.text for c in elem.findall('category') if c.text],
+        'artwork_url': artwork_url
+    }
+
+def parse_xmltv_stream(source: BinaryIO, tvg_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Parse an XMLTV document incrementally from a file-like object.
+
+    Args:
+        source: Binary stream to read from, e.g. an HTTP response body
+        tvg_ids: Only keep programmes for these channel ids (None keeps everything)
+
+    Returns:
+        Dictionary with 'channels' (tvg_id -> display name) and
+        'programmes' (tvg_id -> list of programme dicts sorted by start time)
+
+    Raises:
+        ET.ParseError: If the document is not valid XML
+    """
+    wanted = set(tvg_ids) if tvg_ids is not None else None
+    channels = {}
+    programmes = {}
+    skipped = 0
+
+    context = ET.iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event != 'end':
+            continue
+
+        if elem.tag == 'channel':
+            channel_id = elem.get('id')
+            if channel_id and (wanted is None or channel_id in wanted):
+                channels[channel_id] = _child_text(elem, 'display-name') or ''
+            # Drop everything read so far - only top-level elements live under root
+            root.clear()
+
+        elif elem.tag == 'programme':
+            channel_id = elem.get('channel')
+            if wanted is not None and channel_id not in wanted:
+                skipped += 1
+                root.clear()
+                continue
+
+            start = parse_xmltv_time(elem.get('start'))
+            stop = parse_xmltv_time(elem.get('stop'))
+            if start and stop:
+                programmes.setdefault(channel_id, []).append(_parse_programme(elem, start, stop))
+            else:
+                logger.warning(f"Error parsing time {elem.get('start')}/{elem.get('stop')}")
+            root.clear()
+
+    for channel_programmes in programmes.values():
+        channel_programmes.sort(key=lambda p: p['start'])
+
+    kept = sum(len(p) for p in programmes.values())
+    logger.info(f"Parsed XMLTV guide: {kept} programmes for {len(programmes)} channels ({skipped} skipped)")
+
+    return {
+        'channels': channels,
+        'programmes': programmes
+    }
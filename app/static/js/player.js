@@ -9,8 +9,15 @@ class ChannelsPlayer {
         this.playlists = window.playlistsData || [];
         this.channels = window.channelsData || [];
         this.guideData = {};
+        this.guideVersion = null;
         this.hls = null;
         
+        // Identifies this player to the stream proxy, so it can release a channel's upstream when we leave
+        this.viewerId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+        this.streamChannelId = null;
+        // Where streams are loaded from - the stream server, or the web UI itself once that proved unreachable
+        this.streamBaseUrl = window.streamBaseUrl || '';
+        
         // Update intervals
         this.programUpdateInterval = null;
         this.guideDataRefreshInterval = null;
@@ -365,7 +372,13 @@ class ChannelsPlayer {
         this.updateCurrentProgramBar();
         this.addToRecentChannels(channel);
         
-        const proxyUrl = `/proxy/stream/${channel.id}`;
+        if (this.streamChannelId !== channel.id) {
+            this.leaveStream();
+        }
+        this.streamChannelId = channel.id;
+        
+        // Streams may be served by the separate async stream server
+        const proxyUrl = `${this.streamBaseUrl}/proxy/stream/${channel.id}?viewer=${this.viewerId}`;
         console.log(`Loading channel ${channel.name} via proxy: ${proxyUrl}`);
         this.loadVideoStream(proxyUrl);
         
@@ -509,7 +522,15 @@ class ChannelsPlayer {
             this.hls.on(Hls.Events.ERROR, (event, data) => {
                 console.error('HLS error:', data);
                 if (data.fatal) {
-                    if (data.type === Hls.ErrorTypes.MEDIA_ERROR || 
+                    if (this.streamBaseUrl && streamUrl.startsWith(this.streamBaseUrl) &&
+                        data.type === Hls.ErrorTypes.NETWORK_ERROR &&
+                        !(data.response && data.response.code)) {
+                        // The stream server's port is not reachable from here - the web UI relays streams too
+                        console.log('Stream server unreachable, loading streams through the web UI');
+                        const path = streamUrl.slice(this.streamBaseUrl.length);
+                        this.streamBaseUrl = '';
+                        this.loadVideoStream(path);
+                    } else if (data.type === Hls.ErrorTypes.MEDIA_ERROR || 
                         data.details === 'manifestIncompatibleCodecsError') {
                         console.log('Codec error detected, trying fallback...');
                         this.tryCodecFallback(streamUrl);
@@ -635,9 +656,25 @@ class ChannelsPlayer {
         }
     }
     
+    leaveStream() {
+        // Tell the proxy right away rather than leaving it to notice we stopped requesting
+        if (this.streamChannelId === null) {
+            return;
+        }
+        const leaveUrl = `${this.streamBaseUrl}/proxy/leave/${this.streamChannelId}?viewer=${this.viewerId}`;
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon(leaveUrl);
+        } else {
+            fetch(leaveUrl, { method: 'POST', keepalive: true }).catch(() => {});
+        }
+        this.streamChannelId = null;
+    }
+    
     stopCurrentVideo() {
         const video = document.getElementById('videoPlayer');
         
+        this.leaveStream();
+        
         video.pause();
         video.currentTime = 0;
         video.src = '';
@@ -728,15 +765,33 @@ class ChannelsPlayer {
                 body: JSON.stringify({
                     channels: channelIds,
                     start_time: new Date().toISOString(),
-                    end_time: new Date(Date.now() + 8 * 60 * 60 * 1000).toISOString()
+                    end_time: new Date(Date.now() + 8 * 60 * 60 * 1000).toISOString(),
+                    since: this.guideVersion,
+                    format: 'compact'
                 })
             });
             
             if (response.ok) {
-                const newGuideData = await response.json();
+                const newGuideData = this.decodeGuideResponse(await response.json());
+                const guideVersion = response.headers.get('X-Guide-Version');
                 
-                if (newGuideData && Object.keys(newGuideData).length > 0) {
+                if (newGuideData && newGuideData.unchanged) {
+                    this.guideVersion = guideVersion;
+                    this.pruneEndedPrograms();
+                    console.log('Guide data unchanged');
+                } else if (newGuideData && newGuideData.delta) {
+                    this.applyGuideDelta(newGuideData);
+                    this.guideVersion = guideVersion;
+                    console.log(`Guide data delta applied for ${Object.keys(newGuideData.programmes).length} channels`);
+                    
+                    this.updateChannelListWithPrograms();
+                    
+                    if (this.currentChannel) {
+                        this.updateCurrentProgramBar();
+                    }
+                } else if (newGuideData && Object.keys(newGuideData).length > 0) {
                     this.guideData = newGuideData;
+                    this.guideVersion = guideVersion;
                     console.log(`Guide data updated successfully for ${Object.keys(this.guideData).length} channels`);
                     
                     this.updateChannelListWithPrograms();
@@ -755,6 +810,66 @@ class ChannelsPlayer {
         }
     }
     
+    decodeGuideResponse(data) {
+        if (data && data.format === 'compact') {
+            return this.decodeCompactGuide(data);
+        }
+        if (data && data.delta && data.programmes && data.programmes.format === 'compact') {
+            data.programmes = this.decodeCompactGuide(data.programmes);
+        }
+        return data;
+    }
+    
+    decodeCompactGuide(data) {
+        // Expand the columnar format back into per-program objects
+        const strings = data.strings || [];
+        const lookup = index => (index >= 0 ? strings[index] : null);
+        const isoTime = epoch => new Date(epoch * 1000).toISOString().replace('.000Z', 'Z');
+        const guideData = {};
+        
+        for (const [channelId, columns] of Object.entries(data.channels || {})) {
+            guideData[channelId] = columns.start.map((start, i) => ({
+                title: lookup(columns.title[i]),
+                description: lookup(columns.description[i]),
+                episode: lookup(columns.episode[i]),
+                category: lookup(columns.category[i]),
+                artwork_url: lookup(columns.artwork_url[i]),
+                start_time: isoTime(start),
+                end_time: isoTime(columns.stop[i]),
+                channel_display_name: columns.display_name
+            }));
+        }
+        
+        return guideData;
+    }
+    
+    applyGuideDelta(delta) {
+        // Removals first, so a programme removed and re-added comes back
+        for (const [channelId, startTimes] of Object.entries(delta.removals || {})) {
+            const removed = new Set(startTimes);
+            this.guideData[channelId] = (this.guideData[channelId] || [])
+                .filter(program => !removed.has(program.start_time));
+        }
+        
+        for (const [channelId, programs] of Object.entries(delta.programmes || {})) {
+            const byStart = new Map((this.guideData[channelId] || []).map(program => [program.start_time, program]));
+            programs.forEach(program => byStart.set(program.start_time, program));
+            this.guideData[channelId] = Array.from(byStart.values())
+                .sort((a, b) => a.start_time.localeCompare(b.start_time));
+        }
+        
+        this.pruneEndedPrograms();
+    }
+    
+    pruneEndedPrograms() {
+        const now = new Date();
+        
+        for (const channelId of Object.keys(this.guideData)) {
+            this.guideData[channelId] = this.guideData[channelId]
+                .filter(program => new Date(program.end_time) > now);
+        }
+    }
+    
     startProgramUpdates() {
         this.programUpdateInterval = setInterval(() => {
             if (this.guideData && Object.keys(this.guideData).length > 0) {
@@ -1001,6 +1116,7 @@ class ChannelsPlayer {
     
     destroy() {
         this.stopProgramUpdates();
+        this.leaveStream();
         if (this.hls) {
             this.hls.destroy();
             this.hls = null;
@@ -0,0 +1,299 @@
+"""
+Stream Server - asyncio server for the stream proxy routes.
+
+The Flask routes hold a sync worker for as long as a viewer downloads from
+them. This aiohttp application serves the same /proxy/stream and /proxy/hls
+routes from one event loop, so hundreds of viewers fit in one process and
+never take workers away from the web UI. It is a separate process that runs
+the same session, cache and breaker code as the Flask routes, but has its own
+instances of them - nothing in memory is shared with the Gunicorn workers.
+Blocking upstream fetches run on a bounded thread pool, and raw (non-HLS)
+streams are relayed with aiohttp's own client.
+"""
+import os
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Tuple
+import aiohttp
+from aiohttp import web
+from requests import HTTPError
+from app.models.database import Database, Channel
+from app.services.circuit_breaker import get_breaker, get_breaker_statuses, CircuitOpenError, OPEN
+from app.services.hls_proxy import (
+    get_upstream_url, resolve_resource, is_playlist, rewrite_playlist, upstream_error_status,
+    PLAYLIST_CONTENT_TYPE, STREAM_HEADERS, PLAYLIST_HEADERS
+)
+from app.services.stream_sessions import stream_sessions, StreamKilled
+from app.services.hls_cache import segment_cache
+from app.constants import HTTP_REQUEST_TIMEOUT, HLS_RELAY_CHUNK_SIZE, STREAM_SERVER_THREADS
+
+logger = logging.getLogger(__name__)
+
+# Failures of aiohttp's client that mean the DVR host is unreachable
+TRIP_EXCEPTIONS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+# Per-application resources, created by _resources
+EXECUTOR = web.AppKey('executor', ThreadPoolExecutor)
+CLIENT = web.AppKey('client', aiohttp.ClientSession)
+MASTER_FETCHES = web.AppKey('master_fetches', dict)  # session -> future of its master playlist fetch
+
+async def run_blocking(request: web.Request, fn, *args):
+    """Run a blocking call (database, pooled DVR client) on the server's thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app[EXECUTOR], partial(fn, *args))
+
+# One handle for every lookup - Database() runs the schema setup, which the segment path must not repeat
+_channel_model = None
+
+def get_channel(channel_id: int):
+    """Look up a channel through the long-lived handle. Each call still opens its own connection."""
+    global _channel_model
+    if _channel_model is None:
+        _channel_model = Channel(Database())
+    try:
+        return _channel_model.get_by_id(channel_id)
+    except sqlite3.OperationalError:
+        # The database file was replaced (factory reset) - open it again, which recreates the tables
+        _channel_model = Channel(Database())
+        return _channel_model.get_by_id(channel_id)
+
+def error_response(message: str, status: int) -> web.Response:
+    return web.json_response({'error': message}, status=status, headers=STREAM_HEADERS)
+
+def playlist_response(playlist: str) -> web.Response:
+    return web.Response(text=playlist, content_type=PLAYLIST_CONTENT_TYPE, headers=PLAYLIST_HEADERS)
+
+def upstream_error_response(error: HTTPError) -> web.Response:
+    status = upstream_error_status(error)
+    return error_response(f'Channels DVR returned {status}', status)
+
+async def open_upstream(request: web.Request, upstream_url: str) -> aiohttp.ClientResponse:
+    """
+    Open a DVR URL with the server's client, leaving the body to be read.
+
+    Raises:
+        CircuitOpenError: If the host is known to be unreachable - no request is made
+        aiohttp.ClientResponseError: If the DVR answered with an error status
+    """
+    client = request.app[CLIENT]
+    timeout = aiohttp.ClientTimeout(sock_connect=HTTP_REQUEST_TIMEOUT, sock_read=HTTP_REQUEST_TIMEOUT)
+    # Through the breaker like every other DVR request, so a half-open host gets only its trial calls
+    upstream = await get_breaker(upstream_url).call_async(lambda: client.get(upstream_url, timeout=timeout),
+                                                         TRIP_EXCEPTIONS)
+    # Releases the connection before raising
+    upstream.raise_for_status()
+    return upstream
+
+async def fetch_master(request: web.Request, session) -> Tuple[Optional[Tuple[str, str]], Optional[aiohttp.ClientResponse]]:
+    """
+    Fetch a session's top-level playlist once, however many viewers arrive while it is on its way.
+
+    Returns:
+        (playlist text and URL, None), or (None, the open response) to the viewer that found
+        the DVR sending a raw stream - it relays that response instead of opening another.
+        Viewers that waited on it get (None, None) and open their own.
+    """
+    fetches = request.app[MASTER_FETCHES]
+    pending = fetches.get(session)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending), None
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # The viewer fetching it went away first - fetch it for this one
+            return await fetch_master(request, session)
+
+    pending = fetches[session] = asyncio.get_running_loop().create_future()
+    try:
+        upstream = await open_upstream(request, session.upstream_url)
+        if not is_playlist(session.upstream_url, upstream.headers.get('Content-Type')):
+            session.mark_relayed()
+            pending.set_result(None)
+            return None, upstream
+
+        async with upstream:
+            master = session.set_master(await upstream.text(), str(upstream.url))
+        pending.set_result(master)
+        return master, None
+    except asyncio.CancelledError:
+        pending.cancel()
+        raise
+    except Exception as e:
+        pending.set_exception(e)
+        # Mark it retrieved, so an error nobody waited for is not logged as unhandled
+        pending.exception()
+        raise
+    finally:
+        del fetches[session]
+
+async def relay_stream(request: web.Request, session, viewer_id: str,
+                       upstream: Optional[aiohttp.ClientResponse] = None) -> web.StreamResponse:
+    """Stream a non-HLS response from the DVR through unchanged, for this viewer alone."""
+    if upstream is None:
+        upstream = await open_upstream(request, session.upstream_url)
+
+    async with upstream:
+        # Tracked so it can be closed when it goes idle, the viewer leaves or it is killed.
+        # The reaper runs on its own thread, so the close is handed to the event loop.
+        loop = asyncio.get_running_loop()
+        relay = session.open_relay(viewer_id, lambda: loop.call_soon_threadsafe(upstream.close))
+
+        response = web.StreamResponse(headers=STREAM_HEADERS)
+        response.content_type = upstream.content_type or 'application/octet-stream'
+        await response.prepare(request)
+        try:
+            async for chunk in upstream.content.iter_chunked(HLS_RELAY_CHUNK_SIZE):
+                # Stop reading from the DVR as soon as the viewer is gone
+                if relay.closed or request.transport is None or request.transport.is_closing():
+                    break
+                await response.write(chunk)
+                relay.record(len(chunk))
+        except (ConnectionResetError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not relay.closed:
+                logger.info(f"Stream relay ended: {e}")
+        finally:
+            session.end_relay(relay)
+        return response
+
+async def proxy_stream(request: web.Request) -> web.StreamResponse:
+    """Proxy a channel's HLS stream through the channel's shared upstream session."""
+    channel_id = int(request.match_info['channel_id'])
+    try:
+        channel = await run_blocking(request, get_channel, channel_id)
+        if not channel:
+            return error_response('Channel not found', 404)
+
+        # Always use HLS format for web playback
+        upstream_url = get_upstream_url(channel['stream_url'])
+
+        # Fail fast instead of holding a connection on a host known to be down
+        if get_breaker(upstream_url).state == OPEN:
+            return error_response('Channels DVR server is unavailable', 503)
+
+        # Viewers of a channel share its upstream stream rather than each opening one
+        session, viewer_id = stream_sessions.join(channel_id, upstream_url, request.query.get('viewer'))
+        master, upstream = session.get_master(), None
+        if master is None and not session.is_relayed():
+            master, upstream = await fetch_master(request, session)
+        if master is None:
+            logger.info(f"Channels DVR did not return a playlist, relaying stream: {upstream_url}")
+            return await relay_stream(request, session, viewer_id, upstream)
+
+        body, playlist_url = master
+        return playlist_response(rewrite_playlist(body, playlist_url, channel_id, viewer_id))
+
+    except (CircuitOpenError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+        return error_response('Channels DVR server is unavailable', 503)
+    except StreamKilled as e:
+        return error_response(str(e), 410)
+    except aiohttp.ClientResponseError as e:
+        logger.warning(f"Channels DVR returned {e.status} for {e.request_info.real_url}")
+        return error_response(f'Channels DVR returned {e.status}', e.status)
+    except Exception as e:
+        logger.error(f"Proxy stream error: {e}")
+        return error_response(str(e), 500)
+
+async def proxy_hls(request: web.Request) -> web.Response:
+    """Proxy a variant playlist, segment or key referenced by a rewritten channel playlist."""
+    channel_id = int(request.match_info['channel_id'])
+    try:
+        channel = await run_blocking(request, get_channel, channel_id)
+        if not channel:
+            return error_response('Channel not found', 404)
+
+        stream_url = get_upstream_url(channel['stream_url'])
+        try:
+            upstream_url = resolve_resource(stream_url, request.match_info['resource'])
+        except ValueError as e:
+            return error_response(str(e), 400)
+
+        if get_breaker(upstream_url).state == OPEN:
+            return error_response('Channels DVR server is unavailable', 503)
+
+        session, viewer_id = stream_sessions.join(channel_id, stream_url, request.query.get('viewer'))
+        content_type, body, served_from = await run_blocking(request, session.fetch, upstream_url)
+
+        if is_playlist(upstream_url, content_type):
+            return playlist_response(rewrite_playlist(body.decode('utf-8'), served_from, channel_id, viewer_id))
+
+        # The event loop writes the body out however slowly the viewer reads it
+        response = web.Response(body=body, headers=STREAM_HEADERS)
+        response.content_type = (content_type or 'application/octet-stream').split(';')[0]
+        return response
+
+    except CircuitOpenError:
+        return error_response('Channels DVR server is unavailable', 503)
+    except StreamKilled as e:
+        return error_response(str(e), 410)
+    except HTTPError as e:
+        return upstream_error_response(e)
+    except Exception as e:
+        logger.error(f"HLS proxy error: {e}")
+        return error_response(str(e), 500)
+
+async def proxy_leave(request: web.Request) -> web.Response:
+    """Let a player say it stopped watching, so the channel's upstream is released right away."""
+    viewer_id = request.query.get('viewer')
+    if viewer_id:
+        stream_sessions.leave(int(request.match_info['channel_id']), viewer_id)
+    return web.Response(status=204, headers=STREAM_HEADERS)
+
+async def proxy_sessions(request: web.Request) -> web.Response:
+    """List every open stream session - all of them live in this process."""
+    return web.json_response({
+        'success': True,
+        'sessions': stream_sessions.get_sessions(),
+        'segment_cache': segment_cache.get_stats()
+    })
+
+async def close_proxy_session(request: web.Request) -> web.Response:
+    """Kill a channel's stream session and release its upstream."""
+    if not stream_sessions.kill(int(request.match_info['channel_id'])):
+        return web.json_response({'success': False, 'error': 'No stream session for this channel'}, status=404)
+    return web.json_response({'success': True})
+
+async def proxy_circuits(request: web.Request) -> web.Response:
+    """List this process's circuit breakers - the ones guarding stream traffic, for /api/dvr/status."""
+    return web.json_response({
+        'success': True,
+        'pid': os.getpid(),
+        'circuits': get_breaker_statuses()
+    })
+
+async def _resources(app: web.Application):
+    """Create the thread pool and DVR client, start the session reaper and tidy the segment spill directory."""
+    app[EXECUTOR] = ThreadPoolExecutor(max_workers=STREAM_SERVER_THREADS, thread_name_prefix='stream')
+    app[CLIENT] = aiohttp.ClientSession()
+    app[MASTER_FETCHES] = {}
+    stream_sessions.start()
+    segment_cache.start()
+    yield
+    await app[CLIENT].close()
+    app[EXECUTOR].shutdown(wait=False)
+
+def create_stream_app() -> web.Application:
+    """Create the aiohttp application serving the stream proxy routes."""
+    app = web.Application()
+    app.cleanup_ctx.append(_resources)
+    app.router.add_get('/proxy/stream/{channel_id:\\d+}', proxy_stream)
+    app.router.add_get('/proxy/hls/{channel_id:\\d+}/{resource}', proxy_hls)
+    app.router.add_post('/proxy/leave/{channel_id:\\d+}', proxy_leave)
+    app.router.add_get('/proxy/sessions', proxy_sessions)
+    app.router.add_post('/proxy/sessions/{channel_id:\\d+}/close', close_proxy_session)
+    app.router.add_get('/proxy/circuits', proxy_circuits)
+    return app
+
+def serve_in_thread(host: str, port: int) -> threading.Thread:
+    """Run the stream server on a background thread - for the Flask development server, which is one process."""
+    def run():
+        loop = asyncio.new_event_loop()
+        web.run_app(create_stream_app(), host=host, port=port, loop=loop, handle_signals=False, print=None)
+
+    thread = threading.Thread(target=run, name='stream-server', daemon=True)
+    thread.start()
+    return thread
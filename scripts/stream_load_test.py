@@ -0,0 +1,155 @@
+"""
+Load test for the stream server against a fake Channels DVR.
+
+Runs a fake DVR serving a live HLS stream (a master playlist, a sliding media
+playlist and fixed-size segments) and the stream server in one event loop,
+then has many viewers watch the same channel at once. Reports how long the
+viewers waited and how often each upstream URL was requested - with the
+shared channel session and segment cache every segment should be fetched
+from the DVR about once, however many viewers there are.
+
+Usage:
+    python scripts/stream_load_test.py --viewers 300 --duration 20
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from collections import Counter
+
+# Add the repository root to Python path for imports
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+import aiohttp
+from aiohttp import web
+
+SEGMENT_SECONDS = 2
+SEGMENT_BYTES = 256 * 1024
+PLAYLIST_WINDOW = 3
+
+def create_fake_dvr(upstream_hits: Counter) -> web.Application:
+    """A DVR serving one live HLS channel whose media playlist moves on every SEGMENT_SECONDS."""
+    started_at = time.time()
+    segment_body = b'\x47' * SEGMENT_BYTES
+
+    async def master(request):
+        upstream_hits['master'] += 1
+        body = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=2000000\nindex.m3u8\n"
+        return web.Response(text=body, content_type='application/vnd.apple.mpegurl')
+
+    async def media(request):
+        upstream_hits['media playlist'] += 1
+        newest = int((time.time() - started_at) // SEGMENT_SECONDS)
+        first = max(newest - PLAYLIST_WINDOW + 1, 0)
+        lines = ['#EXTM3U', f'#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}', f'#EXT-X-MEDIA-SEQUENCE:{first}']
+        for sequence in range(first, newest + 1):
+            lines += [f'#EXTINF:{SEGMENT_SECONDS}.0,', f'segment{sequence}.ts']
+        return web.Response(text='\n'.join(lines) + '\n', content_type='application/vnd.apple.mpegurl')
+
+    async def segment(request):
+        upstream_hits[f"segment {request.match_info['sequence']}"] += 1
+        # Stand-in for the transcoder taking a moment per segment
+        await asyncio.sleep(0.05)
+        return web.Response(body=segment_body, content_type='video/mp2t')
+
+    app = web.Application()
+    app.router.add_get('/devices/ANY/channels/1/stream', master)
+    app.router.add_get('/devices/ANY/channels/1/index.m3u8', media)
+    app.router.add_get('/devices/ANY/channels/1/segment{sequence:\\d+}.ts', segment)
+    return app
+
+def uris(playlist: str):
+    return [line.strip() for line in playlist.splitlines() if line.strip() and not line.startswith('#')]
+
+async def watch(client: aiohttp.ClientSession, base_url: str, viewer: int, duration: float, waits: list, errors: Counter):
+    """Play the channel like hls.js does: fetch the master playlist, then poll the media playlist and fetch new segments."""
+    async def get(path):
+        started = time.monotonic()
+        async with client.get(f"{base_url}{path}") as response:
+            body = await response.read()
+            waits.append(time.monotonic() - started)
+            if response.status != 200:
+                errors[response.status] += 1
+                return None
+            return body
+
+    master = await get(f"/proxy/stream/1?viewer=load{viewer}")
+    if master is None:
+        return
+    media_path = uris(master.decode('utf-8'))[0]
+
+    seen = set()
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        playlist = await get(media_path)
+        if playlist is None:
+            return
+        for segment_path in uris(playlist.decode('utf-8')):
+            if segment_path not in seen:
+                seen.add(segment_path)
+                await get(segment_path)
+        await asyncio.sleep(SEGMENT_SECONDS / 2)
+
+async def run(viewers: int, duration: float):
+    from app.models.database import Database, Channel
+    from app.stream_server import create_stream_app
+
+    upstream_hits = Counter()
+    dvr_runner = web.AppRunner(create_fake_dvr(upstream_hits))
+    await dvr_runner.setup()
+    dvr_site = web.TCPSite(dvr_runner, '127.0.0.1', 0)
+    await dvr_site.start()
+    dvr_port = dvr_runner.addresses[0][1]
+
+    Channel(Database()).create_or_update({
+        'name': 'Load Test',
+        'tvg_id': 'load.1',
+        'stream_url': f"http://127.0.0.1:{dvr_port}/devices/ANY/channels/1/stream"
+    })
+
+    stream_runner = web.AppRunner(create_stream_app())
+    await stream_runner.setup()
+    stream_site = web.TCPSite(stream_runner, '127.0.0.1', 0)
+    await stream_site.start()
+    base_url = f"http://127.0.0.1:{stream_runner.addresses[0][1]}"
+
+    waits = []
+    errors = Counter()
+    connector = aiohttp.TCPConnector(limit=0)
+    started = time.monotonic()
+    async with aiohttp.ClientSession(connector=connector) as client:
+        await asyncio.gather(*(watch(client, base_url, viewer, duration, waits, errors) for viewer in range(viewers)))
+    elapsed = time.monotonic() - started
+
+    await stream_runner.cleanup()
+    await dvr_runner.cleanup()
+
+    segment_hits = [count for key, count in upstream_hits.items() if key.startswith('segment')]
+    waits.sort()
+    print(f"{viewers} viewers for {elapsed:.1f}s, {len(waits)} requests served by one process")
+    if waits:
+        print(f"  wait median {statistics.median(waits) * 1000:.0f} ms, "
+              f"p95 {waits[int(len(waits) * 0.95)] * 1000:.0f} ms, max {waits[-1] * 1000:.0f} ms")
+    print(f"  errors: {dict(errors) or 'none'}")
+    print(f"  upstream: {upstream_hits['master']} master, {upstream_hits['media playlist']} media playlist, "
+          f"{len(segment_hits)} segments fetched {sum(segment_hits)} times "
+          f"(at most {max(segment_hits, default=0)} per segment)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--viewers', type=int, default=300, help='Concurrent viewers of the channel')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds each viewer watches for')
+    args = parser.parse_args()
+
+    # Keep the test's channel database away from the real one
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        asyncio.run(run(args.viewers, args.duration))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import signal
+import logging
+import subprocess
+
+# Add the current directory to Python path for imports
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from app.constants import DEFAULT_HOST, DEFAULT_PORT, STREAM_SERVER_RESTART_DELAY, STREAM_SERVER_MAX_RESTART_DELAY
+
+logger = logging.getLogger('serve')
+
+def start_web_ui():
+    """Start Gunicorn serving the web UI."""
+    host = os.environ.get('HOST', DEFAULT_HOST)
+    port = int(os.environ.get('PORT', DEFAULT_PORT))
+    workers = os.environ.get('WEB_WORKERS', '4')
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '--bind', f'{host}:{port}',
+                             '--workers', workers, 'app:create_app()'], cwd=current_dir)
+
+def start_stream_server():
+    """Start the async stream server."""
+    return subprocess.Popen([sys.executable, os.path.join(current_dir, 'stream_server.py')], cwd=current_dir)
+
+def stop(processes):
+    """Ask every running process to stop, then wait for them."""
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def main():
+    """
+    Run the web UI and the stream server, restarting the stream server whenever it exits.
+
+    SIGTERM and SIGINT stop both. If Gunicorn exits the supervisor exits with its
+    status, so the container stops and its restart policy takes over.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [serve] %(message)s')
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    web_ui = start_web_ui()
+    stream_server = start_stream_server()
+    restart_delay = STREAM_SERVER_RESTART_DELAY
+    restart_at = None
+    started_at = time.monotonic()
+
+    while not stopping:
+        if web_ui.poll() is not None:
+            logger.error(f"Web UI exited with status {web_ui.returncode}, shutting down")
+            stop([stream_server])
+            return web_ui.returncode or 1
+
+        if restart_at is None and stream_server.poll() is not None:
+            # A server that ran for a while starts over from the shortest delay
+            if time.monotonic() - started_at > STREAM_SERVER_MAX_RESTART_DELAY:
+                restart_delay = STREAM_SERVER_RESTART_DELAY
+            logger.error(f"Stream server exited with status {stream_server.returncode}, "
+                         f"restarting in {restart_delay}s")
+            restart_at = time.monotonic() + restart_delay
+            restart_delay = min(restart_delay * 2, STREAM_SERVER_MAX_RESTART_DELAY)
+
+        if restart_at is not None and time.monotonic() >= restart_at:
+            stream_server = start_stream_server()
+            restart_at = None
+            started_at = time.monotonic()
+
+        time.sleep(0.5)
+
+    logger.info("Stopping web UI and stream server")
+    stop([web_ui, stream_server])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# Add the current directory to Python path for imports
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from aiohttp import web
+from app.stream_server import create_stream_app
+from app.constants import DEFAULT_HOST, STREAM_SERVER_PORT
+
+app = create_stream_app()
+
+if __name__ == '__main__':
+    # Serves only the stream proxy routes - run app.py (or gunicorn) alongside it for the web UI
+    host = os.environ.get('HOST', DEFAULT_HOST)
+    port = int(os.environ.get('STREAM_SERVER_PORT', STREAM_SERVER_PORT))
+    
+    web.run_app(app, host=host, port=port)
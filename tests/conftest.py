@@ -0,0 +1,53 @@
+"""
+Shared pytest fixtures for the Channels DVR Player tests.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Make the app and config packages importable when pytest runs from the repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory so the relative database and snapshot paths stay isolated."""
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    # Tests that change TZ have it restored by monkeypatch - pick that up again
+    time.tzset()
+
+def make_programme(tvg_id, start, hours=1, title='Programme', **fields):
+    """Build a programme record in the shape produced by parse_xmltv_stream."""
+    programme = {
+        'channel': tvg_id,
+        'start': start,
+        'stop': start + timedelta(hours=hours),
+        'title': title,
+        'sub_title': None,
+        'description': None,
+        'episode_num': None,
+        'categories': [],
+        'artwork_url': None
+    }
+    programme.update(fields)
+    return programme
+
+def make_guide(schedule):
+    """
+    Build a parsed guide from {tvg_id: (display name, [titles])}.
+
+    Each channel's programmes run back to back, one hour each, starting at the top of the current hour.
+    """
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    channels = {}
+    programmes = {}
+    for tvg_id, (display_name, titles) in schedule.items():
+        channels[tvg_id] = display_name
+        programmes[tvg_id] = [make_programme(tvg_id, start + timedelta(hours=i), title=title)
+                              for i, title in enumerate(titles)]
+    return {'channels': channels, 'programmes': programmes}
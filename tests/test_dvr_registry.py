@@ -0,0 +1,40 @@
+"""
+Tests for the mDNS registry of DVR servers.
+"""
+from app.services import channels_dvr_services
+from app.services.channels_dvr_services import DVRRegistry
+
+class FakeZeroconf:
+    def close(self):
+        pass
+
+def test_failed_start_is_retried_after_backoff(monkeypatch):
+    attempts = []
+
+    def zeroconf():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError('No usable network interface')
+        return FakeZeroconf()
+
+    monkeypatch.setattr(channels_dvr_services, 'Zeroconf', zeroconf)
+    monkeypatch.setattr(channels_dvr_services, 'ServiceBrowser', lambda zc, type, listener: object())
+    clock = [1000.0]
+    monkeypatch.setattr(channels_dvr_services.time, 'monotonic', lambda: clock[0])
+
+    registry = DVRRegistry(initial_browse=0)
+    registry.start()
+    assert registry._zeroconf is None
+
+    # Lookups during the backoff do not hammer the network stack
+    assert registry.get_servers() == []
+    assert len(attempts) == 1
+
+    clock[0] += channels_dvr_services.DVR_DISCOVERY_RETRY_SECONDS
+    assert registry.get_servers() == []
+    assert len(attempts) == 2
+    assert isinstance(registry._zeroconf, FakeZeroconf)
+
+    # Once running it is not started again
+    registry.get_servers()
+    assert len(attempts) == 2
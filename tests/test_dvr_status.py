@@ -0,0 +1,38 @@
+"""
+Tests for /api/dvr/status.
+"""
+import os
+
+import pytest
+import requests
+from flask import Flask
+
+from app.main import bp
+from app.main import routes
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app.test_client()
+
+def test_reports_this_worker_and_the_stream_server(client, monkeypatch):
+    stream_circuits = {'success': True, 'pid': 4242, 'circuits': [{'name': 'dvr.test:8089', 'state': 'open'}]}
+    monkeypatch.setattr(routes.stream_server_client, 'get', lambda path: dict(stream_circuits))
+
+    body = client.get('/api/dvr/status').get_json()
+
+    assert body['success']
+    assert body['pid'] == os.getpid()
+    assert isinstance(body['circuits'], list)
+    assert body['stream_server'] == {'pid': 4242, 'circuits': [{'name': 'dvr.test:8089', 'state': 'open'}]}
+
+def test_reports_an_unreachable_stream_server(client, monkeypatch):
+    def unreachable(path):
+        raise requests.ConnectionError('refused')
+    monkeypatch.setattr(routes.stream_server_client, 'get', unreachable)
+
+    body = client.get('/api/dvr/status').get_json()
+
+    assert body['success']
+    assert 'not reachable' in body['stream_server']['error']
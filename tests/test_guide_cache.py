@@ -0,0 +1,155 @@
+"""
+Tests for the shared guide cache - store reload and refresh scheduling.
+"""
+import os
+import time
+
+import pytest
+
+from app.constants import GUIDE_REFRESH_RETRY_SECONDS
+from app.models.database import Database, Programme
+from app.services import guide_cache as guide_cache_module
+from app.services.guide_cache import GuideCache, CHANNELS_KEY
+from tests.conftest import make_guide
+
+EPG_URL = 'http://dvr.test:8089/devices/ANY/guide/xmltv?duration=86400'
+
+@pytest.fixture
+def cache(monkeypatch):
+    """A guide cache on the test directory that never starts its background thread."""
+    cache = GuideCache(snapshot_path='guide.snapshot')
+    monkeypatch.setattr(cache, 'start_refresher', lambda: None)
+    monkeypatch.setattr(cache, 'get_epg_url', lambda: EPG_URL)
+    return cache
+
+def publish(cache, guide=None):
+    """Publish a guide downloaded under the current generations, as a successful refresh would."""
+    meta = {'epg_url': EPG_URL, 'etag': None, 'last_modified': None,
+            'generation': cache._get_generation(), 'channels_generation': cache._get_generation(CHANNELS_KEY)}
+    with cache._exclusive():
+        cache._write_snapshot(guide or make_guide({'news.1': ('News', ['Morning'])}), time.time(), meta)
+    return meta
+
+def test_fresh_guide_waits_for_ttl(cache):
+    publish(cache)
+    assert cache._seconds_until_refresh() > GUIDE_REFRESH_RETRY_SECONDS
+
+def test_enabled_channels_refresh_after_quiet_period(cache):
+    publish(cache)
+    cache.schedule_refresh(delay=0)
+    assert cache._seconds_until_refresh() == 0
+
+def test_enabled_channels_refresh_backs_off_after_failure(cache, monkeypatch):
+    publish(cache)
+    cache.schedule_refresh(delay=0)
+
+    def unreachable(*args, **kwargs):
+        raise ConnectionError('DVR is down')
+    monkeypatch.setattr(guide_cache_module, 'dvr_get', unreachable)
+
+    with cache._exclusive():
+        assert not cache._refresh()
+
+    # The copy still lacks the new channels, but the next attempt waits out the backoff
+    delay = cache._seconds_until_refresh()
+    assert GUIDE_REFRESH_RETRY_SECONDS - 5 < delay <= GUIDE_REFRESH_RETRY_SECONDS
+
+def test_stale_guide_backs_off_after_failure(cache):
+    cache._last_failure = time.time()
+    assert cache._seconds_until_refresh() > GUIDE_REFRESH_RETRY_SECONDS - 5
+
+def test_generation_polling_sets_up_the_schema_once(cache, monkeypatch):
+    publish(cache)
+    cache.schedule_refresh(delay=60)
+
+    init_calls = []
+    init_db = Database.init_db
+    monkeypatch.setattr(Database, 'init_db', lambda self: init_calls.append(1) or init_db(self))
+    cache._programme_model = None
+
+    for _ in range(5):
+        assert cache._seconds_until_refresh() > 0
+        cache._get_generation()
+    assert len(init_calls) == 1
+
+def test_invalidate_reopens_a_replaced_database(cache):
+    assert cache._get_generation() == 0
+
+    # Factory reset removes the database file
+    os.remove(cache._programme_model.db.db_path)
+    cache.invalidate()
+
+    assert cache._get_generation() == 1
+
+def test_reload_from_store_matches_channels_generation(cache):
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon'])})
+    cache.schedule_refresh(delay=0)
+    meta = publish(cache, guide)
+    cache._store(guide, {'news.1'}, time.time(), meta)
+
+    # A new process rebuilds its snapshot from the programmes table
+    restarted = GuideCache(snapshot_path='restarted.snapshot')
+    with restarted._exclusive():
+        assert restarted._load_from_store(EPG_URL, {'news.1'}, restarted._get_generation())
+
+    assert restarted._snapshot.meta['channels_generation'] == restarted._get_generation(CHANNELS_KEY)
+    assert restarted._seconds_until_refresh() > GUIDE_REFRESH_RETRY_SECONDS
+    assert [p['title'] for p in restarted._guide.range('news.1', 0, 2 ** 40)] == ['Morning', 'Noon']
+
+def test_reload_from_store_skips_invalidated_copy(cache):
+    guide = make_guide({'news.1': ('News', ['Morning'])})
+    meta = publish(cache, guide)
+    cache._store(guide, {'news.1'}, time.time(), meta)
+    Programme(Database()).increment_meta('guide_generation')
+
+    restarted = GuideCache(snapshot_path='restarted.snapshot')
+    with restarted._exclusive():
+        assert not restarted._load_from_store(EPG_URL, {'news.1'}, restarted._get_generation())
+
+class SlowGuide:
+    """An XMLTV body that keeps trickling in, one channel element per read."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.decode_content = False
+        self.sent_header = False
+
+    def read(self, size=-1):
+        time.sleep(self.delay)
+        if not self.sent_header:
+            self.sent_header = True
+            return b'<?xml version="1.0"?><tv>'
+        return b'<channel id="slow.1"><display-name>Slow</display-name></channel>'
+
+class SlowResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, delay):
+        self.raw = SlowGuide(delay)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+def test_cold_download_stops_at_the_request_deadline(cache, monkeypatch):
+    from flask import Flask
+    from app.services.deadline import start_deadline
+
+    monkeypatch.setattr(guide_cache_module, 'dvr_get', lambda url, **kwargs: SlowResponse(delay=0.05))
+
+    with Flask(__name__).test_request_context():
+        start_deadline(0.3)
+        started = time.monotonic()
+        assert cache.get_guide() is None
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 1
+    # Running out of time is not the DVR's fault - the refresher takes over straight away
+    assert cache._last_failure == 0.0
+    assert cache._wake.is_set()
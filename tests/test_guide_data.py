@@ -0,0 +1,187 @@
+"""
+Tests for the /api/guide/data encoders - version tokens, deltas and the compact format.
+"""
+import time
+from datetime import timedelta
+
+from app.main.routes import (
+    build_guide_data, build_guide_delta, make_guide_token, parse_guide_token, get_guide_channels_key,
+    parse_guide_time
+)
+from app.models.database import Database, Programme
+from tests.conftest import make_guide
+
+TVG_ID_TO_CHANNEL_ID = {'news.1': 1, 'film.1': 2}
+
+def store(guide):
+    programme_model = Programme(Database())
+    programme_model.sync_guide(guide['channels'], guide['channels'], guide['programmes'], int(time.time()) - 7200)
+    return programme_model
+
+def window(guide):
+    programmes = [p for channel in guide['programmes'].values() for p in channel]
+    return min(p['start'] for p in programmes), max(p['stop'] for p in programmes)
+
+def test_token_round_trip():
+    guide = make_guide({'news.1': ('News', ['Morning'])})
+    _, window_end = window(guide)
+    channels_key = get_guide_channels_key(['news.1', 'film.1'])
+
+    token = parse_guide_token(make_guide_token('abcd1234', 7, window_end, channels_key))
+
+    assert token == {'guide_id': 'abcd1234', 'version': 7, 'window_end': int(window_end.timestamp()),
+                     'channels_key': channels_key}
+    assert get_guide_channels_key(['film.1', 'news.1']) == channels_key
+
+def test_unusable_tokens_are_ignored():
+    for token in (None, '', 42, 'abcd1234.7', 'abcd1234.x.1.ffff'):
+        assert parse_guide_token(token) is None
+
+def test_delta_is_unchanged_when_nothing_changed():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon'])})
+    programme_model = store(guide)
+    start, end = window(guide)
+    since = {'version': programme_model.get_version(), 'window_end': int(end.timestamp())}
+
+    # The same guide downloaded again changes nothing
+    store(guide)
+
+    assert build_guide_delta(programme_model, ['news.1'], TVG_ID_TO_CHANNEL_ID, start, end, since) == {'unchanged': True}
+
+def test_delta_sends_changed_and_removed_programmes():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon', 'Evening'])})
+    programme_model = store(guide)
+    start, end = window(guide)
+    since = {'version': programme_model.get_version(), 'window_end': int(end.timestamp())}
+
+    # Noon's title changes and Evening drops out of the feed
+    noon, evening = guide['programmes']['news.1'][1:]
+    noon['title'] = 'Noon Update'
+    guide['programmes']['news.1'].remove(evening)
+    store(guide)
+
+    delta = build_guide_delta(programme_model, ['news.1'], TVG_ID_TO_CHANNEL_ID, start, end, since)
+
+    assert delta['delta']
+    assert [p['title'] for p in delta['programmes'][1]] == ['Noon Update']
+    assert delta['removals'] == {1: [evening['start'].strftime('%Y-%m-%dT%H:%M:%SZ')]}
+
+def test_delta_sends_programmes_past_the_previous_window():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon', 'Evening'])})
+    programme_model = store(guide)
+    start, end = window(guide)
+    previous_end = guide['programmes']['news.1'][1]['start']
+    since = {'version': programme_model.get_version(), 'window_end': int(previous_end.timestamp())}
+
+    delta = build_guide_delta(programme_model, ['news.1'], TVG_ID_TO_CHANNEL_ID, start, end, since)
+
+    assert [p['title'] for p in delta['programmes'][1]] == ['Noon', 'Evening']
+    assert delta['removals'] == {}
+
+def test_full_guide_is_keyed_by_channel_id():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon']), 'other.1': ('Other', ['Unmapped'])})
+    programme_model = store(guide)
+    start, end = window(guide)
+
+    guide_data = build_guide_data(programme_model, ['news.1', 'other.1'], TVG_ID_TO_CHANNEL_ID, start, end)
+
+    assert list(guide_data) == [1]
+    assert [p['title'] for p in guide_data[1]] == ['Morning', 'Noon']
+    assert guide_data[1][0]['channel_display_name'] == 'News'
+    assert guide_data[1][0]['start_time'] == start.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def test_window_only_returns_overlapping_programmes():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon', 'Evening'])})
+    programme_model = store(guide)
+    start, _ = window(guide)
+
+    guide_data = build_guide_data(programme_model, ['news.1'], TVG_ID_TO_CHANNEL_ID,
+                                  start + timedelta(minutes=90), start + timedelta(minutes=150))
+
+    assert [p['title'] for p in guide_data[1]] == ['Noon', 'Evening']
+
+def decode_compact(encoded):
+    """Expand the compact format back into per-channel programme dicts, as the player does."""
+    strings = encoded['strings']
+
+    def lookup(index):
+        return strings[index] if index >= 0 else None
+
+    decoded = {}
+    for channel_id, columns in encoded['channels'].items():
+        decoded[channel_id] = [
+            {
+                'start': columns['start'][i],
+                'stop': columns['stop'][i],
+                'title': lookup(columns['title'][i]),
+                'description': lookup(columns['description'][i]),
+                'episode': lookup(columns['episode'][i]),
+                'category': lookup(columns['category'][i]),
+                'artwork_url': lookup(columns['artwork_url'][i]),
+                'channel_display_name': columns['display_name']
+            }
+            for i in range(len(columns['start']))
+        ]
+    return decoded
+
+def test_compact_format_matches_full_format():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon']), 'film.1': ('Films', ['Matinee'])})
+    morning = guide['programmes']['news.1'][0]
+    morning.update({'description': 'Headlines', 'episode_num': 'S1E2', 'sub_title': 'Part Two',
+                    'categories': ['News', 'Talk'], 'artwork_url': 'http://art.test/morning.jpg'})
+    programme_model = store(guide)
+    start, end = window(guide)
+    tvg_ids = ['news.1', 'film.1']
+
+    full = build_guide_data(programme_model, tvg_ids, TVG_ID_TO_CHANNEL_ID, start, end)
+    compact = build_guide_data(programme_model, tvg_ids, TVG_ID_TO_CHANNEL_ID, start, end, compact=True)
+
+    assert compact['format'] == 'compact'
+    decoded = decode_compact(compact)
+    assert set(decoded) == set(full)
+    for channel_id, programmes in full.items():
+        expected = [
+            {**{key: p[key] for key in ('title', 'description', 'episode', 'category', 'artwork_url',
+                                        'channel_display_name')},
+             'start': int(parse_guide_time(p['start_time']).timestamp()),
+             'stop': int(parse_guide_time(p['end_time']).timestamp())}
+            for p in programmes
+        ]
+        assert decoded[channel_id] == expected
+    assert decoded[1][0]['episode'] == 'S1E2 • Part Two'
+
+def test_compact_strings_are_shared():
+    guide = make_guide({'news.1': ('News', ['Repeat', 'Repeat', 'Repeat'])})
+    programme_model = store(guide)
+    start, end = window(guide)
+
+    compact = build_guide_data(programme_model, ['news.1'], TVG_ID_TO_CHANNEL_ID, start, end, compact=True)
+
+    titles = compact['channels'][1]['title']
+    assert len(set(titles)) == 1
+    assert compact['strings'].count('Repeat') == 1
+    # Missing values are -1 rather than a string
+    assert compact['channels'][1]['episode'] == [-1, -1, -1]
+
+def test_compact_delta():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon'])})
+    programme_model = store(guide)
+    start, end = window(guide)
+    since = {'version': programme_model.get_version(), 'window_end': int(end.timestamp())}
+
+    guide['programmes']['news.1'][1]['title'] = 'Noon Update'
+    store(guide)
+
+    delta = build_guide_delta(programme_model, ['news.1'], TVG_ID_TO_CHANNEL_ID, start, end, since, compact=True)
+
+    assert delta['delta'] and delta['programmes']['format'] == 'compact'
+    assert [p['title'] for p in decode_compact(delta['programmes'])[1]] == ['Noon Update']
+
+def test_window_is_capped_at_what_the_guide_cache_downloads():
+    from app.constants import EPG_DOWNLOAD_SECONDS, GUIDE_MAX_WINDOW_HOURS
+    from app.main.routes import get_guide_window
+
+    start, end = get_guide_window('2026-01-01T00:00:00Z', '2026-01-02T00:00:00Z')
+
+    assert end - start == timedelta(hours=GUIDE_MAX_WINDOW_HOURS)
+    assert GUIDE_MAX_WINDOW_HOURS * 3600 <= EPG_DOWNLOAD_SECONDS
@@ -0,0 +1,38 @@
+"""
+Tests for the memory-mapped guide snapshot.
+"""
+import gc
+import time
+import weakref
+
+from app.services.guide_snapshot import write_snapshot, open_snapshot
+from tests.conftest import make_guide
+
+def test_round_trip():
+    guide = make_guide({'news.1': ('News', ['Morning', 'Noon'])})
+    write_snapshot('guide.snapshot', guide, 123.0, {'epg_url': 'http://dvr.test'})
+
+    snapshot = open_snapshot('guide.snapshot')
+
+    assert snapshot.fetched_at == 123.0
+    assert snapshot.meta == {'epg_url': 'http://dvr.test'}
+    assert snapshot.index.channel_name('news.1') == 'News'
+    assert [p['title'] for p in snapshot.index.range('news.1', 0, 2 ** 40)] == ['Morning', 'Noon']
+
+def test_mapping_is_released_without_the_cyclic_gc():
+    write_snapshot('guide.snapshot', make_guide({'news.1': ('News', ['Morning'])}), time.time(), {})
+    snapshot = open_snapshot('guide.snapshot')
+    index = snapshot.index
+    data = weakref.ref(snapshot._data)
+
+    gc.disable()
+    try:
+        # A reader still holding the index keeps the mapping alive
+        del snapshot
+        assert data() is not None
+        assert index.now('news.1', int(time.time()))['title'] == 'Morning'
+
+        del index
+        assert data() is None
+    finally:
+        gc.enable()
@@ -0,0 +1,91 @@
+"""
+Tests for HLS playlist rewriting and resource resolution.
+"""
+import base64
+from urllib.parse import urlparse
+
+import pytest
+
+from app.services.hls_proxy import encode_resource, resolve_resource, rewrite_playlist, get_upstream_url
+
+STREAM_URL = 'http://dvr.test:8089/devices/ANY/channels/7/hls/master.m3u8?format=hls&codec=copy'
+PLAYLIST_URL = 'http://dvr.test:8089/devices/ANY/channels/7/hls/stream.m3u8'
+
+def token(resource):
+    return base64.urlsafe_b64encode(resource.encode('utf-8')).decode('ascii').rstrip('=')
+
+def proxied_urls(playlist):
+    """The upstream URL behind every /proxy/hls/ URI of a rewritten playlist."""
+    urls = []
+    for line in playlist.splitlines():
+        for part in line.replace('"', ' ').split():
+            if part.startswith('/proxy/hls/'):
+                resource = urlparse(part).path.split('/')[-1]
+                urls.append(resolve_resource(STREAM_URL, resource))
+    return urls
+
+def test_rewrites_segments_and_uri_attributes():
+    body = '\n'.join([
+        '#EXTM3U',
+        '#EXT-X-KEY:METHOD=AES-128,URI="key.bin?k=1"',
+        '#EXT-X-MAP:URI="/devices/ANY/channels/7/hls/init.mp4"',
+        '#EXTINF:6.0,',
+        'segment1.ts',
+        '',
+        '#EXTINF:6.0,',
+        'http://dvr.test:8089/devices/ANY/channels/7/hls/segment2.ts'
+    ])
+
+    playlist = rewrite_playlist(body, PLAYLIST_URL, 7, 'viewer1')
+
+    assert 'segment1.ts\n' not in playlist and 'dvr.test' not in playlist
+    assert proxied_urls(playlist) == [
+        'http://dvr.test:8089/devices/ANY/channels/7/hls/key.bin?k=1',
+        'http://dvr.test:8089/devices/ANY/channels/7/hls/init.mp4',
+        'http://dvr.test:8089/devices/ANY/channels/7/hls/segment1.ts',
+        'http://dvr.test:8089/devices/ANY/channels/7/hls/segment2.ts'
+    ]
+    assert all(line.endswith('?viewer=viewer1') for line in playlist.splitlines() if line.startswith('/proxy/hls/7/'))
+    assert playlist.endswith('\n')
+
+def test_leaves_other_hosts_alone():
+    body = '#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="https://keys.test/key"\n#EXTINF:6.0,\nhttp://cdn.test/segment.ts\n'
+
+    playlist = rewrite_playlist(body, PLAYLIST_URL, 7)
+
+    assert 'URI="https://keys.test/key"' in playlist
+    assert 'http://cdn.test/segment.ts' in playlist
+    assert proxied_urls(playlist) == []
+
+def test_resolve_round_trips_encode():
+    url = 'http://dvr.test:8089/devices/ANY/channels/7/hls/segment1.ts?session=abc'
+    assert resolve_resource(STREAM_URL, encode_resource(url)) == url
+
+@pytest.mark.parametrize('resource', [
+    '//evil.test/steal',
+    '/@evil.test/steal',
+    '/..//evil.test:80/steal',
+    '/\\\\evil.test/steal'
+])
+def test_resolve_stays_on_the_channel_host(resource):
+    url = resolve_resource(STREAM_URL, token(resource))
+    assert urlparse(url).netloc == 'dvr.test:8089'
+    assert url.startswith('http://dvr.test:8089/')
+
+@pytest.mark.parametrize('resource', ['http://evil.test/steal', 'evil.test/steal', ''])
+def test_resolve_rejects_resources_without_a_leading_slash(resource):
+    with pytest.raises(ValueError):
+        resolve_resource(STREAM_URL, token(resource))
+
+def test_resolve_rejects_garbage():
+    with pytest.raises(ValueError):
+        resolve_resource(STREAM_URL, '!!!not-base64!!!')
+    with pytest.raises(ValueError):
+        # Valid base64, but not UTF-8
+        resolve_resource(STREAM_URL, base64.urlsafe_b64encode(b'/\xff\xfe').decode('ascii'))
+
+def test_upstream_url_picks_codec():
+    assert get_upstream_url('http://dvr.test:8089/devices/ANY/channels/7/stream.mpg') == \
+        'http://dvr.test:8089/devices/ANY/channels/7/stream.mpg?format=hls&codec=h264'
+    assert get_upstream_url('http://tuner.test/auto/v7?transcode=none') == \
+        'http://tuner.test/auto/v7?transcode=none&format=hls&codec=copy'
@@ -0,0 +1,62 @@
+"""
+Tests for /api/search's single pass over the cached guide.
+"""
+import time
+
+from app.main.routes import search_guide
+from app.models.database import Database, Programme
+from app.services.guide_index import GuideIndex
+from tests.conftest import make_guide
+
+def channel(channel_id, name, tvg_id):
+    return {'id': channel_id, 'name': name, 'tvg_id': tvg_id, 'is_enabled': True}
+
+def stored_guide(schedule):
+    """Index a guide and store it in the programmes table, as a guide refresh does."""
+    guide = make_guide(schedule)
+    programme_model = Programme(Database())
+    programme_model.sync_guide(guide['channels'], guide['channels'], guide['programmes'], int(time.time()) - 7200)
+    return GuideIndex.from_parsed(guide), programme_model
+
+def test_programs_match_on_channels_with_other_names(monkeypatch):
+    # Shown in the server's local time, not UTC
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    guide, programme_model = stored_guide({
+        'abc.1': ('ABC', ['Morning Show', 'Evening News']),
+        'cbs.1': ('CBS', ['Drama'])
+    })
+    enabled = [channel(1, 'ABC', 'abc.1'), channel(2, 'CBS', 'cbs.1')]
+
+    current, programs = search_guide(guide, programme_model, 'news', [], enabled)
+
+    assert current == {}
+    assert [(p['title'], p['channel_id'], p['channel_name']) for p in programs] == [('Evening News', 1, 'ABC')]
+    evening_news = guide.range('abc.1', 0, 2 ** 40)[1]['start']
+    assert programs[0]['start_time'] == evening_news.astimezone().strftime('%I:%M %p')
+    assert programs[0]['start_time'] != evening_news.strftime('%I:%M %p')
+
+def test_current_programs_only_for_matched_channels():
+    guide, programme_model = stored_guide({
+        'abc.1': ('ABC', ['Morning Show']),
+        'cbs.1': ('CBS', ['Drama'])
+    })
+    abc = channel(1, 'ABC', 'abc.1')
+
+    current, programs = search_guide(guide, programme_model, 'abc', [abc], [abc, channel(2, 'CBS', 'cbs.1')])
+
+    assert current == {'abc.1': 'Morning Show'}
+    assert programs == []
+
+def test_programs_skip_disabled_channels():
+    guide, programme_model = stored_guide({
+        'abc.1': ('ABC', ['Drama', 'Evening News']),
+        'cbs.1': ('CBS', ['Drama', 'News Hour'])
+    })
+
+    _, programs = search_guide(guide, programme_model, 'news', [], [channel(2, 'CBS', 'cbs.1')])
+
+    assert [p['title'] for p in programs] == ['News Hour']
+
+def test_no_guide_returns_nothing():
+    assert search_guide(None, Programme(Database()), 'news', [], [channel(1, 'ABC', 'abc.1')]) == ({}, [])
@@ -0,0 +1,47 @@
+"""
+Tests for the stream server's channel lookups.
+"""
+import os
+import asyncio
+
+from app import stream_server
+from app.models import database
+from app.models.database import Database, Channel
+
+def test_get_channel_sets_up_the_schema_once(monkeypatch):
+    channel_id = Channel(Database()).create_or_update({'name': 'News', 'tvg_id': 'news.1', 'stream_url': 'http://dvr.test/news'})
+    monkeypatch.setattr(stream_server, '_channel_model', None)
+
+    init_calls = []
+    init_db = database.Database.init_db
+    monkeypatch.setattr(database.Database, 'init_db', lambda self: init_calls.append(1) or init_db(self))
+
+    for _ in range(5):
+        assert stream_server.get_channel(channel_id)['name'] == 'News'
+    assert stream_server.get_channel(channel_id + 1) is None
+    assert len(init_calls) == 1
+
+def test_get_channel_reopens_a_replaced_database(monkeypatch):
+    Channel(Database()).create_or_update({'name': 'News', 'tvg_id': 'news.1', 'stream_url': 'http://dvr.test/news'})
+    monkeypatch.setattr(stream_server, '_channel_model', None)
+    assert stream_server.get_channel(1) is not None
+
+    # Factory reset removes the database file
+    os.remove(stream_server._channel_model.db.db_path)
+    assert stream_server.get_channel(1) is None
+
+def test_circuits_lists_the_stream_servers_breakers():
+    from aiohttp.test_utils import TestClient, TestServer
+    from app.services.circuit_breaker import get_breaker
+
+    get_breaker('http://dvr.test:8089/devices/ANY/channels/1/stream').record_failure(ConnectionError('refused'))
+
+    async def fetch():
+        async with TestClient(TestServer(stream_server.create_stream_app())) as client:
+            response = await client.get('/proxy/circuits')
+            return response.status, await response.json()
+
+    status, body = asyncio.run(fetch())
+    assert status == 200
+    assert body['pid'] == os.getpid()
+    assert any(c['name'] == 'dvr.test:8089' and c['consecutive_failures'] >= 1 for c in body['circuits'])
@@ -0,0 +1,80 @@
+"""
+Tests for the web UI's startup check of the stream server and its relay of player requests.
+"""
+import logging
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask import Flask
+
+from app.main import bp
+from app.services import stream_server_client
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+def test_unreachable_stream_server_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(stream_server_client, 'STREAM_SERVER_INTERNAL_URL', unused_url())
+
+    assert stream_server_client.check_reachable() is not None
+    with caplog.at_level(logging.ERROR):
+        stream_server_client._run_startup_check(attempts=2, interval=0)
+    assert 'Stream server is not reachable' in caplog.text
+
+def test_reachable_stream_server(monkeypatch, caplog):
+    monkeypatch.setattr(stream_server_client, 'get', lambda path: {'success': True, 'sessions': []})
+
+    with caplog.at_level(logging.INFO):
+        stream_server_client._run_startup_check(attempts=2, interval=0)
+    assert 'Stream server is reachable' in caplog.text
+
+class FakeStreamServer(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = f"#EXTM3U\n# {self.path}\n".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app.test_client()
+
+@pytest.fixture
+def stream_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStreamServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(stream_server_client, 'STREAM_SERVER_INTERNAL_URL', f"http://127.0.0.1:{server.server_port}")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_web_ui_relays_streams_to_the_stream_server(client, stream_server):
+    response = client.get('/proxy/stream/7?viewer=abc')
+
+    assert response.status_code == 200
+    assert response.content_type == 'application/vnd.apple.mpegurl'
+    assert response.get_data(as_text=True) == "#EXTM3U\n# /proxy/stream/7?viewer=abc\n"
+    assert client.post('/proxy/leave/7?viewer=abc').status_code == 204
+
+def test_relay_to_an_unreachable_stream_server(client, monkeypatch):
+    monkeypatch.setattr(stream_server_client, 'STREAM_SERVER_INTERNAL_URL', unused_url())
+
+    response = client.get('/proxy/stream/7?viewer=abc')
+
+    assert response.status_code == 503
+    assert not response.get_json()['success']
@@ -0,0 +1,114 @@
+"""
+Tests for shared channel sessions - joining, leaving, killing and reaping.
+"""
+import pytest
+
+from app.constants import STREAM_VIEWER_TIMEOUT, STREAM_IDLE_TIMEOUT
+from app.services import stream_sessions as stream_sessions_module
+from app.services.stream_sessions import StreamSessionManager, StreamKilled
+
+UPSTREAM_URL = 'http://dvr.test:8089/devices/ANY/channels/7/stream?format=hls&codec=h264'
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(stream_sessions_module.time, 'monotonic', lambda: now[0])
+    return now
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """A session manager whose reaper thread never runs - tests call prune() themselves."""
+    manager = StreamSessionManager()
+    monkeypatch.setattr(manager, 'start', lambda: None)
+    return manager
+
+def test_viewers_of_a_channel_share_one_session(sessions):
+    first, viewer1 = sessions.join(7, UPSTREAM_URL)
+    second, viewer2 = sessions.join(7, UPSTREAM_URL, 'player-2')
+
+    assert first is second
+    assert viewer2 == 'player-2' and viewer1 != viewer2
+    assert sorted(first.get_viewer_ids()) == sorted([viewer1, 'player-2'])
+    assert [s['viewers'] for s in sessions.get_sessions()] == [2]
+
+def test_invalid_viewer_ids_are_replaced(sessions):
+    _, viewer_id = sessions.join(7, UPSTREAM_URL, '../../etc')
+    assert viewer_id != '../../etc'
+    assert len(viewer_id) == 16
+
+def test_changed_stream_url_opens_a_new_session(sessions):
+    first, _ = sessions.join(7, UPSTREAM_URL)
+    first.set_master('#EXTM3U\n', UPSTREAM_URL)
+
+    second, _ = sessions.join(7, UPSTREAM_URL + '&v=2')
+
+    assert second is not first
+    assert first.get_master() is None
+
+def test_last_viewer_leaving_closes_the_session(sessions):
+    session, viewer1 = sessions.join(7, UPSTREAM_URL)
+    _, viewer2 = sessions.join(7, UPSTREAM_URL)
+    closed = []
+    session.open_relay(viewer1, lambda: closed.append(viewer1))
+
+    sessions.leave(7, viewer1)
+    assert closed == [viewer1]
+    assert len(sessions.get_sessions()) == 1
+
+    sessions.leave(7, viewer2)
+    assert sessions.get_sessions() == []
+    # Leaving a channel nobody watches is harmless
+    sessions.leave(7, viewer2)
+
+def test_killed_viewers_are_refused(sessions):
+    session, viewer_id = sessions.join(7, UPSTREAM_URL)
+    closed = []
+    session.open_relay(viewer_id, lambda: closed.append(True))
+
+    assert sessions.kill(7)
+    assert closed == [True]
+    assert sessions.get_sessions() == []
+    with pytest.raises(StreamKilled):
+        sessions.join(7, UPSTREAM_URL, viewer_id)
+
+    # Someone else can still start watching
+    _, other = sessions.join(7, UPSTREAM_URL)
+    assert other != viewer_id
+    assert not sessions.kill(8)
+
+def test_prune_reaps_sessions_whose_viewers_stopped_requesting(sessions, clock):
+    sessions.join(7, UPSTREAM_URL, 'gone')
+    sessions.join(8, UPSTREAM_URL.replace('/7/', '/8/'), 'watching')
+
+    clock[0] += STREAM_VIEWER_TIMEOUT / 2
+    sessions.join(8, UPSTREAM_URL.replace('/7/', '/8/'), 'watching')
+    clock[0] += STREAM_VIEWER_TIMEOUT / 2 + 1
+    sessions.prune()
+
+    assert [s['channel_id'] for s in sessions.get_sessions()] == [8]
+
+def test_prune_keeps_viewers_of_active_relays(sessions, clock):
+    session, viewer_id = sessions.join(7, UPSTREAM_URL)
+    relay = session.open_relay(viewer_id, lambda: None)
+
+    # A relayed viewer makes no further requests, but data keeps flowing
+    clock[0] += STREAM_VIEWER_TIMEOUT + 1
+    relay.record(1024)
+    sessions.prune()
+    assert len(sessions.get_sessions()) == 1
+
+    # Once the relay goes idle it is closed and the session reaped
+    clock[0] += STREAM_IDLE_TIMEOUT + 1
+    sessions.prune()
+    assert relay.closed
+    assert sessions.get_sessions() == []
+
+def test_prune_forgets_killed_viewers_eventually(sessions, clock):
+    _, viewer_id = sessions.join(7, UPSTREAM_URL)
+    sessions.kill(7)
+
+    clock[0] += STREAM_VIEWER_TIMEOUT * 4 + 1
+    sessions.prune()
+
+    session, rejoined = sessions.join(7, UPSTREAM_URL, viewer_id)
+    assert rejoined == viewer_id